@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Rolling per-topic, per-field statistics maintained at ingest time.
+#
+# Every window (1 min, 1 h, 24 h by default) is a ring of SLOTS sub-buckets
+# of window/SLOTS seconds. A bucket holds Welford running stats (count, mean,
+# M2, min, max), so adding a reading is O(1): locate its bucket, reset the
+# bucket if it belongs to an older period, fold the value in. A query merges
+# the live buckets with Chan's parallel formula, i.e. at most SLOTS merges no
+# matter how much history the window covers. The window slides with bucket
+# granularity (1/SLOTS of its length). The merged closed buckets are cached
+# until the next bucket opens, so both the z-score check and a stats query
+# only fold in the open bucket: O(1) per reading and per query.
+#
+# Anomaly checks run before a value is folded in:
+#   limit  value outside configured [lo, hi] for the field
+#   zscore |value - mean| / stddev over the reference window above a threshold
+#          (once that window has at least min_count readings)
+from __future__ import annotations
+import math, threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+SLOTS = 60
+WINDOWS = {"1m": 60, "1h": 3600, "24h": 86400}
+
+
+class _Bucket:
+    __slots__ = ("period", "n", "mean", "m2", "lo", "hi")
+
+    def __init__(self):
+        self.period = -1
+        self.n = 0
+
+    def reset(self, period: int):
+        self.period = period
+        self.n = 0
+        self.mean = self.m2 = 0.0
+        self.lo = math.inf
+        self.hi = -math.inf
+
+    def add(self, v: float):
+        self.n += 1
+        d = v - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (v - self.mean)
+        if v < self.lo: self.lo = v
+        if v > self.hi: self.hi = v
+
+
+class _Window:
+    __slots__ = ("width", "buckets", "_closed")
+
+    def __init__(self, seconds: int):
+        self.width = max(1, seconds // SLOTS)
+        self.buckets = [_Bucket() for _ in range(SLOTS)]
+        self._closed = (None, None)     # (period, merged stats of the buckets before it)
+
+    def add(self, ts: float, v: float):
+        period = int(ts // self.width)
+        b = self.buckets[period % SLOTS]
+        if b.period != period:
+            if b.period > period:
+                return          # older than the window
+            b.reset(period)
+        if self._closed[0] is not None and period < self._closed[0]:
+            self._closed = (None, None)     # late reading into a cached closed bucket
+        b.add(v)
+
+    def merged(self, now: float, skip: Optional[int] = None) -> Tuple[int, float, float, float, float]:
+        # (count, mean, M2, min, max) over buckets still inside the window at `now`.
+        first = int(now // self.width) - SLOTS + 1
+        n, mean, m2, lo, hi = 0, 0.0, 0.0, math.inf, -math.inf
+        for b in self.buckets:
+            if b.period < first or not b.n or b.period == skip:
+                continue
+            n, mean, m2 = _merge(n, mean, m2, b.n, b.mean, b.m2)
+            lo = min(lo, b.lo)
+            hi = max(hi, b.hi)
+        return n, mean, m2, lo, hi
+
+    def current(self, ts: float) -> Tuple[int, float, float, float, float]:
+        # merged(ts) for the hot path: the closed buckets are merged once per
+        # bucket period and cached, then the open bucket is added.
+        period = int(ts // self.width)
+        if self._closed[0] != period:
+            self._closed = (period, self.merged(ts, skip=period))
+        n, mean, m2, lo, hi = self._closed[1]
+        b = self.buckets[period % SLOTS]
+        if b.period == period and b.n:
+            n, mean, m2 = _merge(n, mean, m2, b.n, b.mean, b.m2)
+            return n, mean, m2, min(lo, b.lo), max(hi, b.hi)
+        return n, mean, m2, lo, hi
+
+
+def _merge(n: int, mean: float, m2: float, bn: int, bmean: float, bm2: float) -> Tuple[int, float, float]:
+    # Chan et al. pairwise combination of two Welford states.
+    if not n:
+        return bn, bmean, bm2
+    tot = n + bn
+    d = bmean - mean
+    return tot, mean + d * bn / tot, m2 + bm2 + d * d * n * bn / tot
+
+
+def _summary(n: int, mean: float, m2: float, lo: float, hi: float) -> Dict[str, Any]:
+    if not n:
+        return {"count": 0}
+    return {"count": n, "mean": round(mean, 4), "min": lo, "max": hi,
+            "stddev": round(math.sqrt(m2 / (n - 1)), 4) if n > 1 else 0.0}
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "temperature:-20:60,humidity:0:100" -> {"temperature": (-20.0, 60.0), ...}
+    out = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        field, lo, hi = part.split(":")
+        out[field.strip()] = (float(lo), float(hi))
+    return out
+
+
+class RollingStats:
+
+    def __init__(self, windows: Dict[str, int] = WINDOWS, zscore: float = 0.0,
+                 z_window: str = "1h", min_count: int = 30,
+                 limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 recent_max: int = 256):
+        self.windows = dict(windows)
+        self.zscore = zscore
+        self.z_window = z_window if z_window in self.windows else next(iter(self.windows))
+        self.min_count = min_count
+        self.limits = limits or {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=recent_max)
+        self.flagged: Dict[Tuple[str, str, str], int] = {}
+        self._topics: Dict[str, Dict[str, Dict[str, _Window]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, topic: str, ts: float, values: Dict[str, float]) -> List[Dict[str, Any]]:
+        # Fold one reading in; returns the anomalies it triggered (usually none).
+        found = []
+        with self._lock:
+            fields = self._topics.get(topic)
+            if fields is None:
+                fields = self._topics[topic] = {}
+            for f, v in values.items():
+                if not math.isfinite(v):
+                    continue        # NaN/inf would poison every window it lands in
+                wins = fields.get(f)
+                if wins is None:
+                    wins = fields[f] = {k: _Window(s) for k, s in self.windows.items()}
+                a = self._check(f, v, wins[self.z_window], ts)
+                if a is not None:
+                    a["topic"] = topic
+                    found.append(a)
+                for w in wins.values():
+                    w.add(ts, v)
+            for a in found:
+                self.recent.append(a)
+                key = (topic, a["field"], a["kind"])
+                self.flagged[key] = self.flagged.get(key, 0) + 1
+        return found
+
+    def _check(self, field: str, v: float, ref: _Window, ts: float) -> Optional[Dict[str, Any]]:
+        lim = self.limits.get(field)
+        if lim and not lim[0] <= v <= lim[1]:
+            return {"ts": ts, "field": field, "value": v, "kind": "limit", "limit": list(lim)}
+        if self.zscore > 0:
+            n, mean, m2 = ref.current(ts)[:3]
+            if n >= self.min_count and m2 > 0:
+                z = (v - mean) / math.sqrt(m2 / (n - 1))
+                if abs(z) >= self.zscore:
+                    return {"ts": ts, "field": field, "value": v, "kind": "zscore",
+                            "z": round(z, 2), "mean": round(mean, 4)}
+        return None
+
+    def stats(self, topic: str, now: float, window: Optional[str] = None,
+              fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        # {field: {window: summary}} for one topic; None for an unknown topic.
+        with self._lock:
+            per_field = self._topics.get(topic)
+            if per_field is None:
+                return None
+            out = {}
+            for f, wins in per_field.items():
+                if fields and f not in fields:
+                    continue
+                out[f] = {k: _summary(*w.current(now)) for k, w in wins.items()
+                          if window is None or k == window}
+            return out
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return list(self._topics)
+
+    def totals(self) -> List[Tuple[Tuple[str, str, str], int]]:
+        with self._lock:
+            return sorted(self.flagged.items())
+
+    def anomalies(self, topic: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        # Most recent anomalies first.
+        with self._lock:
+            items = [a for a in reversed(self.recent) if topic is None or a["topic"] == topic]
+        return items[:limit]
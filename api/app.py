@@ -1,14 +1,34 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import json, ssl, threading, time
-from typing import Dict, Any
-from collections import deque
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse, PlainTextResponse
+import asyncio, hmac, json, math, ssl, threading, time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 import paho.mqtt.client as mqtt
 from pathlib import Path
 import os
 
+from api.history_store import HistoryStore, columns_json, rows_json
+from api.aggregates import RollingStats, parse_limits
+from api.schemas import SchemaRegistry, SchemaReject, loads as loads_payload
+from api.downsample import minmax_buckets, bucket_rows, lttb_indices, take
+from api.telemetry_log import TelemetryLog
+from api import export
+from api.live import LiveHub
+from api.ingest import IngestPipeline
+from api.snapshot import LatestState, load as load_latest, save as save_latest
+from api.shm_store import (SharedBlob, SharedHistoryStore, SharedLatestView, WorkerSlots, elect_writer,
+                           encode_latest, exclusive, replaced)
+from api.topic_index import TopicIndex, valid_filter
+from api.subscriber_pool import SubscriberPool, parse_brokers
+from api.ratelimit import RateLimiter, parse_overrides
+from common.record_codec import decode as decode_records, is_record, split_topic
+from common import client_tls
+from api.metrics import Registry, TimingMiddleware
+from api.responses import JSONBytes, StaticAsset, accepts, dumps, GZIP_MIN_BYTES
+
 # === Portable API MQTT config ===
 BROKER = os.getenv("API_MQTT_BROKER_HOST", "localhost")
 PORT = int(os.getenv("API_MQTT_BROKER_PORT", "8884"))
@@ -20,41 +40,335 @@ KEY = os.getenv("API_MQTT_CLIENT_KEY")
 
 CLIENT_ID = os.getenv("API_MQTT_CLIENT_ID", "api-subscriber")
 
+# Subscriber pool: extra brokers, connections per broker, optional shared subscription group
+BROKERS = parse_brokers(os.getenv("API_MQTT_BROKERS", f"{BROKER}:{PORT}"), PORT)
+FILTERS = [f.strip() for f in TOPIC_FILTER.split(",") if f.strip()]
+CONNECTIONS = int(os.getenv("API_MQTT_CONNECTIONS", "1"))
+SHARED_GROUP = os.getenv("API_MQTT_SHARED_GROUP", "")
+PROTOCOL = mqtt.MQTTv5 if os.getenv("API_MQTT_PROTOCOL", "311") == "5" else mqtt.MQTTv311
+
 # --------------------------------------------------------------
 
-# Most recent message per topic
-LATEST: Dict[str, Dict[str, Any]] = {}
-# Rolling history per topic (last N points for chart)
-HISTORY: Dict[str, deque] = {}
-HISTORY_MAX = 200
-
-def on_connect(client: mqtt.Client, userdata, flags, rc):
-    # Subscribe when TLS MQTT connection is made.
-    if rc == 0:
-        print("[MQTT] connected")
-        client.subscribe(TOPIC_FILTER)
-        print(f"[MQTT] subscribed to: {TOPIC_FILTER}")
-    else:
-        print(f"[MQTT] connect failed rc={rc}")
+# Most recent message per topic (versioned snapshots, written by the ingest worker).
+# Each publish copies the map, so it happens at most every API_LATEST_PUBLISH_MS
+# while messages keep arriving, and right away once the queue runs dry.
+LATEST_PUBLISH_S = float(os.getenv("API_LATEST_PUBLISH_MS", "50")) / 1000
+LATEST = LatestState(LATEST_PUBLISH_S)
+# Trie of every topic seen, for wildcard queries and pagination
+TOPICS = TopicIndex()
+# Rolling history per topic (columnar ring buffers, last N points per topic)
+HISTORY_MAX = int(os.getenv("API_HISTORY_CAPACITY", "10000"))
+HISTORY = HistoryStore(HISTORY_MAX)
+
+# Rolling 1m/1h/24h stats per topic and field, plus optional anomaly flags:
+# API_ANOMALY_ZSCORE=4 flags readings 4 stddevs from the API_ANOMALY_WINDOW mean,
+# API_ANOMALY_LIMITS="temperature:-20:60,humidity:0:100" flags out-of-range readings.
+STATS = RollingStats(
+    zscore=float(os.getenv("API_ANOMALY_ZSCORE", "0")),
+    z_window=os.getenv("API_ANOMALY_WINDOW", "1h"),
+    min_count=int(os.getenv("API_ANOMALY_MIN_COUNT", "30")),
+    limits=parse_limits(os.getenv("API_ANOMALY_LIMITS", "")),
+)
+
+# Optional payload schemas per topic filter (see api/schemas.py); topics without
+# one keep the generic temp_c/hum normalization below.
+# Loaded at startup (lifespan).
+SCHEMAS_FILE = os.getenv("API_SCHEMAS_FILE", "")
+SCHEMAS = SchemaRegistry()
+
+# Optional on-disk telemetry log (disabled when API_TELEMETRY_LOG_DIR is unset),
+# opened and replayed at startup (lifespan)
+LOG_DIR = os.getenv("API_TELEMETRY_LOG_DIR", "")
+TLOG: Optional[TelemetryLog] = None
+
+# Live delta fan-out for /telemetry/stream
+LIVE = LiveHub(policy=os.getenv("API_LIVE_DROP_POLICY", "coalesce"),
+               maxlen=int(os.getenv("API_LIVE_BUFFER", "512")))
+
+# Warm start: the latest row per topic is saved to API_LATEST_SNAPSHOT every
+# API_LATEST_SNAPSHOT_S seconds (when it changed) and on shutdown, and loaded
+# before MQTT starts. Retained messages the broker sends on subscribe then
+# refresh topics that have not had a live message yet.
+SNAPSHOT_FILE = os.getenv("API_LATEST_SNAPSHOT", "")
+SNAPSHOT_INTERVAL = float(os.getenv("API_LATEST_SNAPSHOT_S", "30"))
+
+# Ingest load shedding (see api/ratelimit.py): token buckets per topic and for all
+# topics together, checked in on_message before a message is queued or parsed.
+# Rates are messages/s (0 = unlimited), bursts default to one second's worth;
+# API_RATE_OVERRIDES="team1/lab/+:50:100,team1/noisy:1:5" sets filter:rate:burst
+# per topic filter. Retained messages are never shed. Limits can be changed at
+# runtime with PUT /admin/limits, which needs API_ADMIN_TOKEN to be set and
+# sent as "Authorization: Bearer <token>".
+LIMITER = RateLimiter(
+    topic_rate=float(os.getenv("API_RATE_TOPIC", "0")),
+    topic_burst=float(os.getenv("API_RATE_TOPIC_BURST", "0")),
+    global_rate=float(os.getenv("API_RATE_GLOBAL", "0")),
+    global_burst=float(os.getenv("API_RATE_GLOBAL_BURST", "0")),
+    overrides=parse_overrides(os.getenv("API_RATE_OVERRIDES", "")),
+    sample_n=int(os.getenv("API_RATE_SAMPLE_N", "5")),
+    max_topics=int(os.getenv("API_RATE_MAX_TOPICS", "10000")),
+)
+ADMIN_TOKEN = os.getenv("API_ADMIN_TOKEN", "")
+
+# Multi-process mode (uvicorn --workers N): set API_SHM_NAME and the worker that
+# wins the writer lock runs the MQTT pool and ingest, keeping history, latest rows
+# and a status document in shared memory (see api/shm_store.py); every other
+# worker is a read-only HTTP worker over those segments. Decided at startup.
+SHM_NAME = os.getenv("API_SHM_NAME", "")
+SHM_TOPICS = int(os.getenv("API_SHM_TOPICS", "1024"))
+SHM_HISTORY = int(os.getenv("API_SHM_HISTORY", str(min(HISTORY_MAX, 10000))))
+SHM_LATEST_MB = int(os.getenv("API_SHM_LATEST_MB", "4"))
+SHM_STATUS_MB = int(os.getenv("API_SHM_STATUS_MB", "4"))
+SHM_PUBLISH_S = float(os.getenv("API_SHM_PUBLISH_MS", "50")) / 1000
+ROLE = "standalone"        # "writer" or "reader" in multi-process mode
+SHM_LATEST: Optional[SharedBlob] = None
+SHM_STATUS: Optional[SharedBlob] = None
+SHM_CONTROL: Optional[SharedBlob] = None   # reader -> writer runtime changes
+SHM_SLOTS: Optional[WorkerSlots] = None     # this worker's own slot, e.g. its HTTP latency totals
+
+# Prometheus metrics for /metrics; hot-path counters are per-thread and lock-free
+METRICS = Registry()
+M_MESSAGES = METRICS.counter("gateway_mqtt_messages_total", "MQTT messages received", ("topic",))
+M_BYTES = METRICS.counter("gateway_mqtt_bytes_total", "MQTT payload bytes received", ("topic",))
+M_READINGS = METRICS.counter("gateway_readings_total", "Readings stored", ("topic",))
+M_ANOMALIES = METRICS.counter("gateway_anomalies_total", "Readings flagged as anomalous",
+                              ("topic", "field", "kind"))
+M_SCHEMA_REJECTS = METRICS.counter("gateway_schema_rejects_total",
+                                   "Payloads rejected by their topic's schema", ("schema", "reason"))
+M_DECODE_ERRORS = METRICS.counter("gateway_decode_errors_total",
+                                  "Payloads stored as raw hex because they failed to decode", ("topic",))
+H_DEVICE_LAG = METRICS.histogram("gateway_ingest_latency_seconds",
+                                 "Time from a reading's _ts to it being stored")
+H_QUEUE_LAG = METRICS.histogram("gateway_queue_lag_seconds",
+                                "Time from MQTT receive to the ingest worker picking the message up")
+H_HTTP = METRICS.histogram("gateway_http_request_duration_seconds",
+                           "HTTP handler latency to response start", ("route", "method", "status"))
+M_RETAINED = METRICS.counter("gateway_retained_messages_total",
+                             "Retained MQTT messages, by whether they updated the latest row", ("outcome",))
+M_INGEST_ERRORS = METRICS.counter("gateway_ingest_errors_total",
+                                  "Messages whose ingest raised; the rest of their batch is still stored", ("topic",))
+
+_RESTORED: set = set()     # topics with history on disk from before this process
+
+# Startup timeline (seconds since the lifespan started) for /ingest/stats and /metrics
+WARM: Dict[str, Any] = {"hydrated_topics": 0, "snapshot_age_s": None, "snapshot_bytes": None, "hydrate_s": None,
+                        "first_state_s": None, "full_state_s": None}
+_WARM_T0 = time.monotonic()
+_PENDING: set = set()      # hydrated topics not yet refreshed from the broker (ingest worker)
+
+def _warm_mark(key: str):
+    if WARM[key] is None:
+        WARM[key] = round(time.monotonic() - _WARM_T0, 6)
+
+def _load_snapshot():
+    # Latest rows from the local snapshot file, before the log and MQTT.
+    if not SNAPSHOT_FILE:
+        return
+    t0 = time.perf_counter()
+    rows, saved = load_latest(SNAPSHOT_FILE)
+    for row in rows.values():
+        row["restored"] = True
+    LATEST.update(rows)
+    if rows:
+        WARM["snapshot_age_s"] = round(time.time() - saved, 3)
+        print(f"[WARM] {len(rows)} topics from {SNAPSHOT_FILE} (saved {WARM['snapshot_age_s']:.0f} s ago) "
+              f"in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+def _save_snapshot():
+    try:
+        size = save_latest(LATEST, SNAPSHOT_FILE)
+    except Exception as e:      # never fatal: the loop keeps going and shutdown still closes the log
+        print(f"[WARM] saving {SNAPSHOT_FILE} failed: {e}")
+        return
+    WARM["snapshot_bytes"] = size
+
+def _open_log() -> Optional[TelemetryLog]:
+    # Cold start: last known reading per topic straight from the segment tail
+    # (a newer row from the snapshot file wins)
+    if not LOG_DIR:
+        return None
+    t0 = time.perf_counter()
+    log = TelemetryLog(
+        LOG_DIR,
+        segment_bytes=int(os.getenv("API_TELEMETRY_LOG_SEGMENT_MB", "8")) << 20,
+        retention_segments=int(os.getenv("API_TELEMETRY_LOG_RETENTION", "16")),
+        fsync_interval=float(os.getenv("API_TELEMETRY_LOG_FSYNC_S", "1.0")),
+    )
+    rows = log.restore_latest()
+    for topic, row in rows.items():
+        cur = LATEST.get(topic)
+        if cur is None or row["ts"] > cur.get("ts", 0):
+            LATEST.set(topic, row)
+    _RESTORED.update(rows)
+    print(f"[LOG] restored {len(rows)} topics from {LOG_DIR} "
+          f"in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    return log
+
+def _hydrate() -> Optional[TelemetryLog]:
+    # Snapshot file, then telemetry log; publish once so reads see it right away.
+    _load_snapshot()
+    log = _open_log()
+    data = LATEST.publish(force=True).data
+    _RESTORED.update(data)
+    _PENDING.update(data)
+    for t in data:
+        TOPICS.insert(t)
+    WARM["hydrated_topics"] = len(data)
+    _warm_mark("hydrate_s")
+    if data:
+        _warm_mark("first_state_s")
+    return log
+
+def _ingest_idle():
+    # Queue ran dry: publish what the throttle held back, then fsync the log.
+    LATEST.publish(force=True)
+    if TLOG:
+        TLOG.sync()
+
+def _finite(v: Any) -> bool:
+    # json.loads accepts NaN/Infinity, overflows 1e400 to inf and keeps huge ints:
+    # none of those belong in history or stats.
+    try:
+        return isinstance(v, (int, float)) and math.isfinite(v)
+    except OverflowError:
+        return False
 
 def _append_history(topic: str, ts: int, payload: Dict[str, Any], size: int):
     # Keep a compact, time-ordered buffer for charts.
-    if topic not in HISTORY:
-        HISTORY[topic] = deque(maxlen=HISTORY_MAX)
-    rec = {"ts": ts, "size_bytes": size}
+    values = {}
     if isinstance(payload, dict):
         # Accept either normalized or raw bridge fields
         t = payload.get("temperature", payload.get("temp_c"))
         h = payload.get("humidity",    payload.get("hum"))
-        if isinstance(t, (int, float)): rec["temperature"] = t
-        if isinstance(h, (int, float)): rec["humidity"]    = h
-    HISTORY[topic].append(rec)
+        if _finite(t): values["temperature"] = t
+        if _finite(h): values["humidity"]    = h
+    _append_values(topic, ts, size, values)
 
-def on_message(client: mqtt.Client, userdata, msg: mqtt.MQTTMessage):
+def _append_values(topic: str, ts: int, size: int, values: Dict[str, float]):
+    if _retained:
+        return          # a broker's last value, not a new reading
+    HISTORY.append(topic, ts, size, values)
+    for a in STATS.add(topic, ts, values):
+        M_ANOMALIES.inc((topic, a["field"], a["kind"]))
+    if TLOG:
+        TLOG.append(topic, ts, size, values)
+
+def _history_window(topic: str, since: Optional[float], until: Optional[float], n: Optional[int]):
+    # Serve from memory when the ring holds the whole request, otherwise from the on-disk log.
+    cols = HISTORY.window(topic, since, until, n)
+    if TLOG is None:
+        return cols
+    if cols is None:
+        return TLOG.window(topic, since, until, n)
+    # The ring is complete unless it has wrapped or the topic predates this process
+    # (shared rings may hold fewer points than the log for any topic).
+    if topic in _RESTORED or ROLE != "standalone" or HISTORY.wrapped(topic):
+        oldest = HISTORY.oldest(topic)
+        if (since is not None and since < oldest) or (n is not None and len(cols["ts"]) < n):
+            return TLOG.window(topic, since, until, n)
+    return cols
+
+def _take_retained(topic: str, row: Dict[str, Any]) -> bool:
+    # A retained message only fills in topics with no live message yet (restored or
+    # retained rows), and never rolls one back: its ts (the reading's own _ts when
+    # the payload carries one) must not be older than the row it replaces.
+    cur = LATEST.get(topic)
+    if cur is not None and not (cur.get("restored") or cur.get("retained")):
+        M_RETAINED.inc(("ignored",))
+        return False
+    p = row["payload"]
+    if isinstance(p, dict) and isinstance(p.get("_ts"), (int, float)):
+        row["ts"] = int(p["_ts"] / 1000)
+    if cur is not None and row["ts"] < cur.get("ts", 0):
+        M_RETAINED.inc(("stale",))
+        return False
+    row["retained"] = True
+    M_RETAINED.inc(("applied",))
+    return True
+
+def _store_latest(topic: str, row: Dict[str, Any]):
+    # Update the latest map and push the same row to live stream clients.
+    if _retained and not _take_retained(topic, row):
+        return
+    LATEST.set(topic, row)
+    TOPICS.insert(topic)
+    if _PENDING:
+        _PENDING.discard(topic)
+        if not _PENDING:
+            _warm_mark("full_state_s")
+            print(f"[WARM] all {WARM['hydrated_topics']} hydrated topics refreshed from the broker "
+                  f"{WARM['full_state_s']:.3f} s after startup")
+    if WARM["first_state_s"] is None:
+        _warm_mark("first_state_s")
+    if not _retained:
+        M_READINGS.inc((topic,))
+        p = row["payload"]
+        if isinstance(p, dict) and isinstance(p.get("_ts"), (int, float)):
+            H_DEVICE_LAG.observe((), max(0.0, time.time() - p["_ts"] / 1000))
+    if LIVE:
+        LIVE.publish(topic, LATEST.row_json(topic, row).decode("utf-8"))
+
+def _store_raw(topic: str, payload: bytes, ts: int, err: Exception):
+    # Undecodable payload: keep the bytes as hex so the dashboard still shows something.
+    M_DECODE_ERRORS.inc((topic,))
+    raw = {"raw": payload.hex()}
+    _store_latest(topic, {
+        "topic": topic,
+        "payload": raw,
+        "size_bytes": len(payload),
+        "ts": ts,
+        "error": str(err)
+    })
+    _append_history(topic, ts, raw, len(payload))
+
+def _ingest_records(topic: str, payload: bytes, ts: int):
+    # Compact binary records (common/record_codec.py), already normalized.
+    try:
+        rows = decode_records(payload)
+    except ValueError as e:
+        _store_raw(topic, payload, ts, e)
+        return
+    size = len(payload) // len(rows)
+    for data in rows:
+        _store_latest(topic, {"topic": topic, "payload": data, "size_bytes": size, "ts": ts})
+        _append_history(topic, ts, data, size)
+
+def _ingest_schema(schema, topic: str, payload: bytes, ts: int):
+    # Declared payload: the schema's compiled normalizer replaces the generic probing.
+    try:
+        data = loads_payload(payload)
+    except ValueError as e:
+        _store_raw(topic, payload, ts, e)
+        return
+    try:
+        data, values = SCHEMAS.apply(schema, data)
+    except SchemaReject as e:
+        M_SCHEMA_REJECTS.inc((schema.name, e.reason))
+        _store_latest(topic, {"topic": topic, "payload": data, "size_bytes": len(payload),
+                              "ts": ts, "error": f"schema {schema.name}: {e}"})
+        return
+    _store_latest(topic, {"topic": topic, "payload": data, "size_bytes": len(payload), "ts": ts})
+    _append_values(topic, ts, len(payload), values)
+
+def _ingest_one(topic: str, payload: bytes, ts: int):
     # Store latest JSON payload per topic and normalize fields for charts.
-    ts = int(time.time())
+    topic, marked = split_topic(topic, payload)
+    if marked or is_record(payload):
+        # "<topic>/bin" suffix, or a payload that sniffs as records (magic first byte)
+        _ingest_records(topic, payload, ts)
+        return
+    if b"}\n{" in payload:
+        # Batched message from the serial bridge: one JSON object per line
+        for line in payload.split(b"\n"):
+            if line:
+                _ingest_one(topic, line, ts)
+        return
+    schema = SCHEMAS.lookup(topic) if SCHEMAS.schemas else None
+    if schema is not None:
+        _ingest_schema(schema, topic, payload, ts)
+        return
     try:
-        text = msg.payload.decode("utf-8", errors="replace")
+        text = payload.decode("utf-8", errors="replace")
         data = json.loads(text)
 
         # ---- normalize field names from device/bridge ----
@@ -65,90 +379,697 @@ def on_message(client: mqtt.Client, userdata, msg: mqtt.MQTTMessage):
                 data["humidity"] = data.get("hum")
         # --------------------------------------------------
 
-        LATEST[msg.topic] = {
-            "topic": msg.topic,
+        _store_latest(topic, {
+            "topic": topic,
             "payload": data,
-            "size_bytes": len(msg.payload),
+            "size_bytes": len(payload),
             "ts": ts
-        }
-        _append_history(msg.topic, ts, data, len(msg.payload))
+        })
+        _append_history(topic, ts, data, len(payload))
     except Exception as e:
-        raw = {"raw": msg.payload.hex()}
-        LATEST[msg.topic] = {
-            "topic": msg.topic,
-            "payload": raw,
-            "size_bytes": len(msg.payload),
-            "ts": ts,
-            "error": str(e)
-        }
-        _append_history(msg.topic, ts, raw, len(msg.payload))
-
-def start_mqtt():
-    c = mqtt.Client(client_id="api-subscriber", clean_session=True, protocol=mqtt.MQTTv311)
-
-    # Strict TLS verification with PQC chain + present client cert (mTLS)
-    context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-    context.load_verify_locations(cafile=str(CA))
-    context.check_hostname = True          # SAN on server cert includes IP/DNS; leave True if you reissued with SAN
-    context.verify_mode = ssl.CERT_REQUIRED
-    context.load_cert_chain(certfile=str(CRT), keyfile=str(KEY))
-    try:
-        context.minimum_version = ssl.TLSVersion.TLSv1_3
-    except Exception:
-        pass
+        _store_raw(topic, payload, ts, e)
+
+_retained = False   # ingest worker: the message being handled was a retained one
+_ERR_LOG_S = 10.0   # at most one ingest error line per this many seconds
+_err_next, _err_quiet = 0.0, 0
+
+def _ingest_error(topic: str, e: Exception):
+    # One message failed: count it, log it (rate-limited) and let the batch go on.
+    global _err_next, _err_quiet
+    M_INGEST_ERRORS.inc((topic,))
+    now = time.monotonic()
+    if now < _err_next:
+        _err_quiet += 1
+        return
+    more = f" ({_err_quiet} more since the last report)" if _err_quiet else ""
+    print(f"[INGEST] message on {topic} failed: {type(e).__name__}: {e}{more}")
+    _err_next, _err_quiet = now + _ERR_LOG_S, 0
+
+def _ingest_batch(batch):
+    # Worker side of the ingest pipeline: parse, normalize and store a batch.
+    global _retained
+    now = time.time()
+    for topic, payload, ts, retained in batch:
+        M_MESSAGES.inc((topic,))
+        M_BYTES.inc((topic,), len(payload))
+        H_QUEUE_LAG.observe((), now - ts)
+        _retained = retained
+        try:
+            _ingest_one(topic, payload, int(ts))
+        except Exception as e:
+            _ingest_error(topic, e)
+        finally:
+            _retained = False
+    LATEST.publish()
+
+PIPELINE = IngestPipeline(
+    _ingest_batch,
+    maxsize=int(os.getenv("API_INGEST_QUEUE_MAX", "10000")),
+    batch_max=int(os.getenv("API_INGEST_BATCH_MAX", "256")),
+    policy=os.getenv("API_INGEST_OVERFLOW", "drop_oldest"),
+    idle=_ingest_idle,
+    idle_interval=min(1.0, LATEST_PUBLISH_S) or 1.0,
+)
+DRAIN_TIMEOUT = float(os.getenv("API_SHUTDOWN_DRAIN_S", "10"))
+
+def on_message(client: mqtt.Client, userdata, msg: mqtt.MQTTMessage):
+    # Runs on the event loop: only hand the raw message to the pipeline, never block
+    # (with the "block" policy the pool pauses socket reads while the queue is full).
+    # Messages over their rate limit are shed here, before they cost a queue slot or a parse.
+    if LIMITER.enabled and not msg.retain and LIMITER.check(msg.topic, msg.payload):
+        return
+    PIPELINE.submit(msg.topic, msg.payload, time.time(), wait=False, retained=bool(msg.retain))
+
+def _tls_context() -> ssl.SSLContext:
+    # Strict TLS 1.3 verification with PQC chain + present client cert (mTLS).
+    # Cached and shared by every pool connection; reconnects resume the TLS session.
+    # check_hostname stays on: SAN on server cert includes IP/DNS.
+    if not CA:
+        raise ValueError("API_MQTT_CA_CERT is not set")
+    return client_tls.client_context(CA, CRT, KEY)
+
+# Built at startup unless a pool was injected beforehand (bench/gateway_bench.py does)
+POOL: Optional[SubscriberPool] = None
+
+def make_pool(tls_context: Optional[ssl.SSLContext], **kw) -> SubscriberPool:
+    # One TLS context shared by every connection in the pool.
+    opts = dict(connections=CONNECTIONS, client_id=CLIENT_ID, shared_group=SHARED_GROUP,
+                protocol=PROTOCOL, accept=PIPELINE.has_room,
+                min_backoff=float(os.getenv("API_MQTT_BACKOFF_MIN_S", "1")),
+                max_backoff=float(os.getenv("API_MQTT_BACKOFF_MAX_S", "30")))
+    opts.update(kw)
+    return SubscriberPool(BROKERS, FILTERS, on_message, tls_context=tls_context, **opts)
+
+def _shm_open(create: bool):
+    # Map (or, for the writer, create) the shared history, latest, status and control segments.
+    global HISTORY, SHM_LATEST, SHM_STATUS, SHM_CONTROL
+    history = SharedHistoryStore(SHM_NAME, SHM_HISTORY, SHM_TOPICS, HISTORY.fields, create)
+    latest = SharedBlob(f"{SHM_NAME}-latest", SHM_LATEST_MB << 20, create)
+    SHM_STATUS = SharedBlob(f"{SHM_NAME}-status", SHM_STATUS_MB << 20, create)
+    SHM_CONTROL = SharedBlob(f"{SHM_NAME}-control", 64 << 10, create)
+    HISTORY, SHM_LATEST = history, latest
+
+def _status_doc() -> bytes:
+    # Writer state the HTTP workers cannot see themselves, refreshed once a second.
+    now = time.time()
+    return dumps({
+        "pid": os.getpid(), "ts": now,
+        "ingest": _ingest_status(),
+        "schemas": SCHEMAS.describe(),
+        "stats": {t: STATS.stats(t, now) for t in STATS.topics()},
+        "anomalies": STATS.anomalies(None, STATS.recent.maxlen),
+        "totals": STATS.totals(),
+        "limits": LIMITER.describe(),
+        # HTTP latency is per worker: every worker publishes its own to its slot
+        "metrics": METRICS.render(exclude=(H_HTTP,)),
+    })
+
+def _publish_http_totals():
+    # This worker's request-latency histogram, for /metrics on every other worker.
+    SHM_SLOTS.write(dumps([[list(k), e] for k, e in H_HTTP.totals().items()]))
+
+def _peer_http_totals():
+    for data in SHM_SLOTS.others():
+        yield {tuple(k): e for k, e in loads_payload(data)}
+
+async def _shm_publish():
+    # Writer: the latest snapshot whenever it changed, the status document every
+    # second, and any change a reader forwarded through the control blob.
+    version, next_status = None, 0.0
+    control = SHM_CONTROL.version()
+    while True:
+        if SHM_CONTROL.version() != control:
+            control, data = SHM_CONTROL.read()
+            if data:
+                _apply_limits(loads_payload(data))
+                print(f"[LIMIT] applied limits forwarded by a reader: {LIMITER.limits()}")
+        snap = LATEST.snapshot()
+        if snap.version != version:
+            version = snap.version
+            SHM_LATEST.write(encode_latest(LATEST))
+        if time.monotonic() >= next_status:
+            next_status = time.monotonic() + 1.0
+            SHM_STATUS.write(await asyncio.to_thread(_status_doc))
+            _publish_http_totals()
+        await asyncio.sleep(SHM_PUBLISH_S)
+
+async def _shm_follow():
+    # Reader: map the segments once the writer has created them (again, if it
+    # recreated them), then pick up new latest blobs for TOPICS and /telemetry/stream.
+    global LATEST
+    next_check = 0.0
+    while True:
+        if time.monotonic() >= next_check:
+            next_check = time.monotonic() + 1.0
+            _publish_http_totals()
+            if SHM_LATEST is None or any(replaced(b.shm) for b in (SHM_LATEST, SHM_STATUS, SHM_CONTROL, HISTORY)):
+                try:
+                    _shm_open(create=False)
+                except (FileNotFoundError, RuntimeError):
+                    next_check = 0.0
+                    await asyncio.sleep(0.5)
+                    continue
+                LATEST = SharedLatestView(SHM_LATEST)
+                print(f"[SHM] worker {os.getpid()} reading {SHM_NAME}")
+        changed = LATEST.refresh()
+        if changed:
+            prev, cur = changed
+            for t in cur.spans:
+                if t not in prev.spans:
+                    TOPICS.insert(t)
+                    if LIVE:
+                        LIVE.publish(t, cur.row(t).decode("utf-8"))
+                elif LIVE and cur.fragment(t) != prev.fragment(t):
+                    LIVE.publish(t, cur.row(t).decode("utf-8"))
+        await asyncio.sleep(SHM_PUBLISH_S)
+
+_status_cache = (None, {})
 
-    c.tls_set_context(context)
-    c.on_connect = on_connect
-    c.on_message = on_message
-    c.connect(BROKER, PORT, keepalive=60)
-    c.loop_forever()
+def _writer_status() -> Dict[str, Any]:
+    # Reader: the writer's last status document ({} until there is one).
+    global _status_cache
+    if SHM_STATUS is None:
+        return {}
+    version = SHM_STATUS.version()
+    if version != _status_cache[0]:
+        _, data = SHM_STATUS.read()
+        _status_cache = (version, loads_payload(data) if data else {})
+    return _status_cache[1]
 
-# Spin up the MQTT subscriber in background
-threading.Thread(target=start_mqtt, daemon=True).start()
+async def _snapshot_loop():
+    # Save the latest map every API_LATEST_SNAPSHOT_S seconds if it changed.
+    version = LATEST.snapshot().version
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        if LATEST.snapshot().version != version:
+            version = LATEST.snapshot().version
+            await asyncio.to_thread(_save_snapshot)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: schemas, telemetry log replay, ingest worker, then the MQTT pool on
+    # this event loop. Shutdown: disconnect the pool, drain the queue, close the log.
+    # A reader worker (API_SHM_NAME set, writer lock taken) only follows shared memory.
+    global SCHEMAS, TLOG, POOL, ROLE, SHM_SLOTS, _WARM_T0
+    _WARM_T0 = time.monotonic()
+    tasks = []
+    lock = None
+    if SHM_NAME:
+        lock = elect_writer(SHM_NAME)
+        ROLE = "writer" if lock else "reader"
+        SHM_SLOTS = WorkerSlots(SHM_NAME)
+        slot = SHM_SLOTS.claim()
+        H_HTTP.remote = _peer_http_totals
+        print(f"[SHM] worker {os.getpid()} is the {ROLE} for {SHM_NAME} (slot {slot})")
+    if ROLE == "reader":
+        if LOG_DIR and TLOG is None:
+            TLOG = TelemetryLog(LOG_DIR, HISTORY.fields, readonly=True)
+        tasks.append(asyncio.create_task(_shm_follow()))
+        try:
+            yield
+        finally:
+            for t in tasks:
+                t.cancel()
+            SHM_SLOTS.close()
+        return
+    if SCHEMAS_FILE:
+        SCHEMAS = SchemaRegistry.from_file(SCHEMAS_FILE, HISTORY.fields)
+        print(f"[SCHEMA] loaded {len(SCHEMAS)} schemas from {SCHEMAS_FILE}")
+    if ROLE == "writer":
+        _shm_open(create=True)
+    if TLOG is None:
+        TLOG = await asyncio.to_thread(_hydrate)
+    PIPELINE.start()
+    if POOL is None:
+        try:
+            POOL = make_pool(_tls_context())
+        except Exception as e:
+            print(f"[MQTT] subscriber pool not started: {e}")
+    if POOL:
+        await POOL.start()
+    if ROLE == "writer":
+        tasks.append(asyncio.create_task(_shm_publish()))
+    if SNAPSHOT_FILE:
+        tasks.append(asyncio.create_task(_snapshot_loop()))
+    try:
+        yield
+    finally:
+        if POOL:
+            await POOL.stop()
+        left = PIPELINE.stats()["depth"]
+        await asyncio.to_thread(PIPELINE.stop, DRAIN_TIMEOUT)
+        print(f"[INGEST] drained {left - PIPELINE.stats()['depth']}/{left} queued messages on shutdown")
+        for t in tasks:
+            t.cancel()
+        try:
+            LATEST.publish(force=True)
+            if SHM_LATEST is not None:
+                SHM_LATEST.write(encode_latest(LATEST))
+            if SNAPSHOT_FILE:
+                await asyncio.to_thread(_save_snapshot)
+        finally:
+            if TLOG:
+                TLOG.close()
+                TLOG = None
+            if lock:
+                lock.close()
+            if SHM_SLOTS:
+                SHM_SLOTS.close()
 
 # FastAPI app and endpoints.
-app = FastAPI(title="Gateway API", version="1.2")
+app = FastAPI(title="Gateway API", version="1.2", lifespan=lifespan)
+app.add_middleware(TimingMiddleware, histogram=H_HTTP)
+
+# Gauges read at scrape time from the components that already track them
+@METRICS.collector("gateway_ingest_queue_depth", "Messages waiting for the ingest worker")
+def _m_depth():
+    yield {}, PIPELINE.stats()["depth"]
+
+@METRICS.collector("gateway_ingest_dropped_total", "Messages dropped by the ingest overflow policy", "counter")
+def _m_dropped():
+    yield {}, PIPELINE.dropped
+
+@METRICS.collector("gateway_ingest_batch_errors_total", "Ingest batches that raised", "counter")
+def _m_errors():
+    yield {}, PIPELINE.errors
+
+@METRICS.collector("gateway_ingest_shed_total", "Messages shed by the ingest rate limits, by the limit hit", "counter")
+def _m_shed():
+    yield {"reason": "topic"}, LIMITER.shed_topic
+    yield {"reason": "global"}, LIMITER.shed_global
+
+@METRICS.collector("gateway_rate_limited_topics", "Topics that hit their rate limit in the last minute")
+def _m_noisy():
+    yield {}, LIMITER.noisy()
+
+@METRICS.collector("gateway_mqtt_connected", "1 while a subscriber connection is up")
+def _m_connected():
+    for c in POOL.stats() if POOL else []:
+        yield {"client_id": c["client_id"], "broker": c["broker"]}, int(c["connected"])
+
+@METRICS.collector("gateway_mqtt_connects_total", "Successful (re)connects per subscriber connection", "counter")
+def _m_connects():
+    for c in POOL.stats() if POOL else []:
+        yield {"client_id": c["client_id"], "broker": c["broker"]}, c["connects"]
+
+@METRICS.collector("gateway_topic_last_seen_age_seconds", "Seconds since the last reading per topic")
+def _m_age():
+    now = time.time()
+    for topic, row in LATEST.snapshot().data.items():
+        yield {"topic": topic}, round(now - row.get("ts", now), 3)
+
+@METRICS.collector("gateway_tls_handshakes_total", "Client TLS handshakes by outcome", "counter")
+def _m_tls():
+    s = client_tls.stats()
+    yield {"mode": "full"}, s["handshakes"] - s["resumed"]
+    yield {"mode": "resumed"}, s["resumed"]
+    yield {"mode": "failed"}, s["failures"]
+
+@METRICS.collector("gateway_warm_start_seconds",
+                   "Seconds from startup to: rows loaded from snapshot/log (hydrate), first row "
+                   "served (first_state), every hydrated topic refreshed from the broker (full_state)")
+def _m_warm():
+    for phase in ("hydrate", "first_state", "full_state"):
+        if WARM[f"{phase}_s"] is not None:
+            yield {"phase": phase}, WARM[f"{phase}_s"]
+
+@METRICS.collector("gateway_warm_start_pending_topics", "Hydrated topics not yet refreshed from the broker")
+def _m_pending():
+    yield {}, len(_PENDING)
+
+@METRICS.collector("gateway_live_clients", "Connected /telemetry/stream clients")
+def _m_live():
+    yield {}, LIVE.stats()["clients"]
+
+@METRICS.collector("gateway_live_dropped_total",
+                   "Stream events lost to a full client buffer", "counter")
+def _m_live_dropped():
+    yield {}, LIVE.stats()["dropped_total"]
+
+@METRICS.collector("gateway_live_coalesced_total",
+                   "Stream events replaced by a newer one for the same topic before delivery", "counter")
+def _m_live_coalesced():
+    yield {}, LIVE.stats()["coalesced_total"]
+
+def _ingest_status() -> Dict[str, Any]:
+    # Ingest queue, subscriber connections and TLS handshakes of the ingest process.
+    if ROLE == "reader":
+        return _writer_status().get("ingest") or {**PIPELINE.stats(), "subscribers": [], "tls": {}}
+    return {**PIPELINE.stats(), "subscribers": POOL.stats() if POOL else [],
+            "shed": {"topic": LIMITER.shed_topic, "global": LIMITER.shed_global},
+            "tls": client_tls.stats(), "warm_start": {**WARM, "pending_topics": len(_PENDING)}}
 
 @app.get("/gateway_ok")
 def gateway_ok():
     # health / status
-    return {"status": "ok", "broker": f"{BROKER}:{PORT}", "subscribed": TOPIC_FILTER}
+    subs = _ingest_status()["subscribers"]
+    return {"status": "ok", "broker": f"{BROKER}:{PORT}", "subscribed": TOPIC_FILTER,
+            "brokers": [f"{h}:{p}" for h, p in BROKERS],
+            "connected": sum(1 for c in subs if c["connected"]),
+            "role": ROLE, "pid": os.getpid()}
+
+def _fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+def _project(row: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    # Keep only the requested payload fields of a latest row.
+    if not fields or not isinstance(row.get("payload"), dict):
+        return row
+    p = row["payload"]
+    return {**row, "payload": {f: p[f] for f in fields if f in p}}
+
+def _check_filter(flt: str):
+    if not valid_filter(flt):
+        raise HTTPException(400, f"Invalid topic filter '{flt}'")
 
 @app.get("/telemetry/latest")
-def latest_all():
-    # Latest message per topic as JSON
-    return LATEST
+def latest_all(request: Request, filter: Optional[str] = None,
+               limit: Optional[int] = Query(None, ge=1, le=10000),
+               cursor: Optional[str] = None, fields: Optional[str] = None):
+    # Latest message per topic as JSON, served from the snapshot's cached body.
+    # With filter (MQTT +/#), limit/cursor paging or fields projection it returns
+    # {"items": {topic: row}, "next_cursor": ...} for just that page instead.
+    snap = LATEST.snapshot()
+    if filter is not None or limit is not None or cursor is not None or fields:
+        flt = filter or "#"
+        _check_filter(flt)
+        topics, nxt = TOPICS.match(flt, limit, cursor)
+        keep = _fields(fields)
+        if keep:
+            items = {t: _project(snap.data[t], keep) for t in topics if t in snap.data}
+            return JSONBytes(dumps({"items": items, "next_cursor": nxt}))
+        page = LATEST.compose((t, snap.data[t]) for t in topics if t in snap.data)
+        return JSONBytes(b'{"items":' + page + b',"next_cursor":' + dumps(nxt) + b"}")
+    headers = {"ETag": snap.etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == snap.etag:
+        return Response(status_code=304, headers=headers)
+    body = snap.body()
+    if len(body) >= GZIP_MIN_BYTES and accepts(request, "gzip"):
+        return JSONBytes(snap.body_gzip(), headers={**headers, "Content-Encoding": "gzip"})
+    return JSONBytes(body, headers=headers)
 
 @app.get("/telemetry/by_topic")
 def latest_by_topic(topic: str):
     # Latest record for a topic.
-    row = LATEST.get(topic)
+    row = LATEST.snapshot().data.get(topic)
     if not row:
         raise HTTPException(404, f"No data for topic '{topic}'")
-    return row
+    return JSONBytes(LATEST.row_json(topic, row))
+
+# Serialized history responses, reused until the topic gets a new point
+HISTORY_CACHE_MAX = int(os.getenv("API_HISTORY_CACHE", "256"))
+_history_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_history_cache_lock = threading.Lock()
 
 @app.get("/telemetry/history")
-def history(topic: str, n: int = Query(120, ge=1, le=HISTORY_MAX)):
-    # Last n history points for a topic (for charts)
-    buf = HISTORY.get(topic)
-    if not buf:
+def history(topic: str, n: int = Query(120, ge=1, le=HISTORY_MAX),
+            since: Optional[float] = None, until: Optional[float] = None,
+            max_points: Optional[int] = Query(None, ge=2, le=10000),
+            mode: Literal["minmax", "lttb"] = "minmax",
+            field: str = "temperature", fields: Optional[str] = None,
+            layout: Literal["rows", "columns"] = "rows"):
+    # History points for a topic (for charts).
+    # Without since/until: last n points. With since/until (epoch seconds): every
+    # point in that range. max_points downsamples server-side, either into
+    # min/max/mean time buckets (mode=minmax) or by LTTB on `field` (mode=lttb).
+    # layout=columns returns {"ts": [...], "temperature": [...], ...} without per-point objects.
+    # fields=temperature,... limits which value columns are returned.
+    key = (topic, n, since, until, max_points, mode, field, fields, layout)
+    gen = HISTORY.generation(topic)
+    with _history_cache_lock:
+        hit = _history_cache.get(key)
+        if hit is not None and hit[0] == gen:
+            _history_cache.move_to_end(key)
+            return JSONBytes(hit[1])
+    body = dumps(_history_body(topic, n, since, until, max_points, mode, field, fields, layout))
+    with _history_cache_lock:
+        _history_cache[key] = (gen, body)
+        _history_cache.move_to_end(key)
+        while len(_history_cache) > HISTORY_CACHE_MAX:
+            _history_cache.popitem(last=False)
+    return JSONBytes(body)
+
+def _history_body(topic, n, since, until, max_points, mode, field, fields, layout):
+    ranged = since is not None or until is not None
+    cols = _history_window(topic, since, until, None if ranged else n)
+    if cols is None:
         raise HTTPException(404, f"No history for topic '{topic}'")
-    return list(buf)[-n:]
+    keep = _fields(fields)
+    if keep:
+        cols = {k: v for k, v in cols.items() if k in ("ts", "size_bytes") or k in keep or k == field}
+    if max_points and len(cols["ts"]) > max_points:
+        if mode == "minmax":
+            out = minmax_buckets(cols, max_points, since, until)
+            return out if layout == "columns" else bucket_rows(out)
+        if field not in cols or field in ("ts", "size_bytes"):
+            raise HTTPException(400, f"Unknown field '{field}'")
+        cols = take(cols, lttb_indices(cols["ts"], cols[field], max_points))
+    if keep and field not in keep:
+        cols.pop(field, None)
+    return columns_json(cols) if layout == "columns" else rows_json(cols)
+
+@app.get("/telemetry/schemas")
+def schemas():
+    # Loaded payload schemas with accepted/rejected counts.
+    if ROLE == "reader":
+        return {"file": SCHEMAS_FILE or None, "schemas": _writer_status().get("schemas", [])}
+    return {"file": SCHEMAS_FILE or None, "schemas": SCHEMAS.describe()}
+
+def _topic_stats(topic: str, now: float, window: Optional[str],
+                 keep: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    # Reader workers use the writer's once-a-second copy of every topic's stats.
+    if ROLE != "reader":
+        return STATS.stats(topic, now, window, keep)
+    per_field = _writer_status().get("stats", {}).get(topic)
+    if per_field is None:
+        return None
+    return {f: {k: v for k, v in wins.items() if window is None or k == window}
+            for f, wins in per_field.items() if not keep or f in keep}
+
+@app.get("/telemetry/stats")
+def telemetry_stats(topic: Optional[str] = None, filter: str = "#",
+                    window: Optional[str] = None,
+                    fields: Optional[str] = None,
+                    limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None):
+    # Rolling count/mean/min/max/stddev per field over each window, maintained at
+    # ingest, so the cost does not depend on history length. One topic, or one
+    # page of topics matching an MQTT filter.
+    if window is not None and window not in STATS.windows:
+        raise HTTPException(400, f"Unknown window '{window}' (have {', '.join(STATS.windows)})")
+    now = time.time()
+    keep = _fields(fields)
+    if topic is not None:
+        out = _topic_stats(topic, now, window, keep)
+        if out is None:
+            raise HTTPException(404, f"No stats for topic '{topic}'")
+        return {"topic": topic, "ts": now, "stats": out}
+    _check_filter(filter)
+    names, nxt = TOPICS.match(filter, limit, cursor)
+    items = {}
+    for t in names:
+        out = _topic_stats(t, now, window, keep)
+        if out:
+            items[t] = out
+    return {"ts": now, "items": items, "next_cursor": nxt}
+
+@app.get("/telemetry/anomalies")
+def anomalies(topic: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    # Most recent anomaly flags (newest first) and per topic/field/kind totals.
+    if ROLE == "reader":
+        st = _writer_status()
+        flagged = st.get("totals", [])
+        recent = [a for a in st.get("anomalies", []) if topic is None or a["topic"] == topic][:limit]
+    else:
+        flagged, recent = STATS.totals(), STATS.anomalies(topic, limit)
+    totals = [{"topic": t, "field": f, "kind": k, "count": n}
+              for (t, f, k), n in flagged if topic is None or t == topic]
+    return {"zscore": STATS.zscore or None, "window": STATS.z_window,
+            "limits": {f: list(v) for f, v in STATS.limits.items()},
+            "recent": recent, "totals": totals}
+
+@app.get("/telemetry/export")
+def export_history(filter: List[str] = Query(["#"]), since: Optional[float] = None,
+                   until: Optional[float] = None,
+                   format: Literal["ndjson", "csv", "arrow"] = "ndjson",
+                   fields: Optional[str] = None):
+    # Bulk export of every point for the topics matching the MQTT-style filters,
+    # optionally limited to [since, until] (epoch seconds). Streamed in chunks
+    # straight from the on-disk log (or the in-memory history without one), so
+    # memory use does not depend on the size of the result.
+    for flt in filter:
+        _check_filter(flt)
+    if format == "arrow" and export.pa is None:
+        raise HTTPException(400, "format=arrow needs pyarrow installed on the API host")
+    keep = _fields(fields)
+    src = TLOG or HISTORY
+    if keep and not set(keep) & set(src.fields):
+        raise HTTPException(400, f"Unknown fields '{fields}'")
+    names = sorted({t for flt in filter for t in TOPICS.match(flt)[0]})
+    if TLOG:
+        batches = TLOG.scan(names, since, until)
+    else:
+        batches = export.history_batches(HISTORY, names, since, until)
+    ext = "arrows" if format == "arrow" else format
+    return StreamingResponse(export.ENCODERS[format](batches, src.fields, keep),
+                             media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="telemetry.{ext}"'})
+
+@app.get("/telemetry/topics")
+def topics(filter: str = "#", limit: Optional[int] = Query(None, ge=1, le=10000),
+           cursor: Optional[str] = None):
+    # Sorted topic names matching an MQTT filter, one page at a time.
+    _check_filter(filter)
+    names, nxt = TOPICS.match(filter, limit, cursor)
+    return {"topics": names, "next_cursor": nxt}
+
+@app.get("/telemetry/topics/children")
+def topic_children(prefix: str = ""):
+    # Next topic level under a prefix, with the number of topics below each entry.
+    return TOPICS.children(prefix.rstrip("/"))
+
+@app.get("/telemetry/stream")
+async def stream(request: Request, filter: List[str] = Query(["#"])):
+    # Server-Sent Events: one "snapshot" event with the current rows matching the
+    # MQTT-style filters, then one "latest" event per new message. Slow clients
+    # lose events according to API_LIVE_DROP_POLICY and get a "dropped" event
+    # (events coalesced into a newer one for the same topic are not reported).
+    sub = LIVE.subscribe(filter, asyncio.get_running_loop())
+
+    async def events():
+        try:
+            data = LATEST.snapshot().data
+            snap = LATEST.compose((t, data[t]) for t in data if sub.matches(t))
+            yield f"event: snapshot\ndata: {snap.decode('utf-8')}\n\n"
+            while not sub.closed:
+                try:
+                    await asyncio.wait_for(sub.event.wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                items, dropped = LIVE.drain(sub)
+                if dropped:
+                    yield f"event: dropped\ndata: {{\"count\": {dropped}}}\n\n"
+                yield "".join(f"event: latest\ndata: {data}\n\n" for _, data in items)
+        finally:
+            LIVE.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    # Ingest queue depth, lag and overflow counters, per-connection subscriber state and TLS handshakes
+    return _ingest_status()
+
+def _check_admin(request: Request, required: bool) -> bool:
+    # True for a request with the admin token. Without API_ADMIN_TOKEN nobody is
+    # admin (a loopback peer may be a local reverse proxy); `required` makes that a 403.
+    if not ADMIN_TOKEN:
+        if required:
+            raise HTTPException(403, "Set API_ADMIN_TOKEN to change limits at runtime")
+        return False
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(401, "Missing or wrong admin token")
+    return True
+
+def _apply_limits(changes: Dict[str, Any]):
+    # Merge changed limits into the current ones; overrides come as an API_RATE_OVERRIDES
+    # string. A new rate without a burst goes back to the default burst for that rate.
+    limits = LIMITER.limits()
+    for scope in ("topic", "global"):
+        if f"{scope}_rate" in changes and f"{scope}_burst" not in changes:
+            limits[f"{scope}_burst"] = 0.0
+    for k, v in changes.items():
+        limits[k] = parse_overrides(v) if k == "overrides" else v
+    LIMITER.configure(**limits)
+
+@app.get("/admin/limits")
+def get_limits(request: Request, top: int = Query(20, ge=0, le=1000)):
+    # Rate limits in effect, shed counters, and the noisiest topics with their
+    # last accepted payloads (reader workers serve the ingest process's copy).
+    # Payload samples only go to admin-token requests.
+    admin = _check_admin(request, required=False)
+    if ROLE != "reader":
+        return LIMITER.describe(top, samples=admin)
+    doc = _writer_status().get("limits", {})
+    if doc and not admin:
+        doc = {**doc, "noisy": [{**n, "samples": [{k: v for k, v in x.items() if k != "payload"}
+                                                   for x in n["samples"]]} for n in doc["noisy"]]}
+    return doc
+
+@app.put("/admin/limits")
+def put_limits(request: Request,
+               topic_rate: Optional[float] = Query(None, ge=0), topic_burst: Optional[float] = Query(None, ge=0),
+               global_rate: Optional[float] = Query(None, ge=0), global_burst: Optional[float] = Query(None, ge=0),
+               overrides: Optional[str] = None):
+    # Change rate limits at runtime; omitted values are kept, overrides="" clears them.
+    _check_admin(request, required=True)
+    changes = {k: v for k, v in (("topic_rate", topic_rate), ("topic_burst", topic_burst),
+                                 ("global_rate", global_rate), ("global_burst", global_burst),
+                                 ("overrides", overrides)) if v is not None}
+    if overrides:
+        try:
+            parsed = parse_overrides(overrides)
+        except ValueError:
+            raise HTTPException(400, f"Invalid overrides '{overrides}' (want filter:rate:burst,...)")
+        for flt, (rate, burst) in parsed.items():
+            _check_filter(flt)
+            if rate < 0 or burst < 0:
+                raise HTTPException(400, f"Negative limit for '{flt}'")
+    if ROLE == "reader":
+        # Only the ingest process sheds; it picks this up within API_SHM_PUBLISH_MS
+        if SHM_CONTROL is None:
+            raise HTTPException(503, "Ingest writer not attached yet")
+        body = dumps(changes)
+        with exclusive(f"{SHM_NAME}-control"):
+            SHM_CONTROL.write(body)
+        return JSONBytes(b'{"status":"forwarded","changes":' + body + b"}", status_code=202)
+    _apply_limits(changes)
+    print(f"[LIMIT] limits changed: {LIMITER.limits()}")
+    return LIMITER.describe(0)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition of the counters, histograms and gauges above.
+    # Reader workers serve the ingest process's last rendering; request latency
+    # is summed over every worker (the others' as of their last second) either way.
+    if ROLE == "reader":
+        text = _writer_status().get("metrics", "") + "\n".join(H_HTTP.render()) + "\n"
+    else:
+        text = METRICS.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/telemetry/memory")
+def history_memory():
+    # History store footprint, for sizing API_HISTORY_CAPACITY on the Pi
+    return HISTORY.memory_report()
 
 @app.get("/overview", response_class=PlainTextResponse)
 def overview():
     # Text summary for debugging
-    topics = ", ".join(sorted(LATEST.keys())) if LATEST else "none"
+    latest = LATEST.snapshot().data
+    topics = ", ".join(sorted(latest)) if latest else "none"
+    mem = HISTORY.memory_report()
+    live = LIVE.stats()
+    ing = _ingest_status()
+    shed = sum(ing.get("shed", {}).values())
     return (
         "Status: ok\n"
         f"Broker: {BROKER}:{PORT}\n"
+        f"Role: {ROLE} (pid {os.getpid()})\n"
         f"Subscribed: {TOPIC_FILTER}\n"
         f"Topics seen: {topics}\n"
-        f"Count: {len(LATEST)}\n"
+        f"Count: {len(latest)}\n"
+        f"History: {mem['points']} points, {mem['bytes_allocated']} bytes "
+        f"(capacity {HISTORY_MAX}/topic)\n"
+        f"Live clients: {live['clients']} (dropped {live['dropped_total']}, coalesced {live['coalesced_total']})\n"
+        f"Ingest queue: {ing['depth']}/{ing['capacity']} (dropped {ing['dropped']}, shed {shed}, "
+        f"lag {ing['queue_lag_s']:.3f} s)\n"
     )
 
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard():
+def _dashboard_html() -> str:
     # Dashboard with table and a live chart using Chart.js
     return f"""
 <!doctype html>
@@ -215,57 +1136,83 @@ def dashboard():
       }});
     }}
 
-    async function refreshTableAndTopics() {{
-      const res = await fetch('/telemetry/latest');
-      const data = await res.json();
-      const tbody = document.querySelector('#tbl tbody');
-      tbody.innerHTML = '';
-      const seenTopics = Object.keys(data).sort();
-      for (const topic of seenTopics) {{
-        const row = data[topic] || {{}};
-        const p = row.payload || {{}};
-        const tr = document.createElement('tr');
-        tr.innerHTML = '<td>'+topic+'</td>'+
-                       '<td>'+(p.temperature ?? '')+'</td>'+
-                       '<td>'+(p.humidity ?? '')+'</td>'+
-                       '<td>'+(row.size_bytes ?? '')+'</td>';
-        tbody.appendChild(tr);
-      }}
-      // maintain topic dropdown
-      const sel = document.getElementById('topicSel');
-      const current = sel.value;
-      sel.innerHTML = '';
-      for (const t of seenTopics) {{
+    // Table rows, dropdown options and chart are updated from /telemetry/stream
+    // deltas; the history endpoint is only hit when the selected topic changes.
+    const rows = {{}};
+    const CHART_MAX = 240;
+    let selTopic = '', redraw = false;
+
+    function renderRow(row) {{
+      let tr = rows[row.topic];
+      if (!tr) {{
+        tr = rows[row.topic] = document.createElement('tr');
+        const tbody = document.querySelector('#tbl tbody');
+        const after = Object.keys(rows).sort().find(t => t > row.topic);
+        tbody.insertBefore(tr, after ? rows[after] : null);
+        const sel = document.getElementById('topicSel');
         const opt = document.createElement('option');
-        opt.value = t; opt.textContent = t;
-        sel.appendChild(opt);
+        opt.value = row.topic; opt.textContent = row.topic;
+        sel.insertBefore(opt, after ? [...sel.options].find(o => o.value === after) : null);
+        if (!selTopic) {{ sel.value = row.topic; loadChart(); }}
       }}
-      if (!seenTopics.includes(current) && seenTopics.length) sel.value = seenTopics[0];
-      else sel.value = current;
+      const p = row.payload || {{}};
+      tr.innerHTML = '<td>'+row.topic+'</td>'+
+                     '<td>'+(p.temperature ?? '')+'</td>'+
+                     '<td>'+(p.humidity ?? '')+'</td>'+
+                     '<td>'+(row.size_bytes ?? '')+'</td>';
     }}
 
-    async function refreshChart() {{
+    async function loadChart() {{
       ensureChart();
-      const selTopic = document.getElementById('topicSel').value;
+      selTopic = document.getElementById('topicSel').value;
       if (!selTopic) return;
-      const res = await fetch('/telemetry/history?topic='+encodeURIComponent(selTopic)+'&n=120');
+      const since = Date.now()/1000 - 3600;
+      const res = await fetch('/telemetry/history?topic='+encodeURIComponent(selTopic)+
+                              '&since='+since+'&max_points='+CHART_MAX+'&mode=lttb&layout=columns');
       if (!res.ok) return;
       const hist = await res.json();
-      chartData.labels = hist.map(p => new Date(p.ts*1000).toLocaleTimeString());
-      const temp = hist.map(p => p.temperature ?? null);
-      const hum  = hist.map(p => p.humidity ?? null);
-      chartData.datasets[0].data = temp;
-      chartData.datasets[1].data = hum;
+      chartData.labels = hist.ts.map(t => new Date(t*1000).toLocaleTimeString());
+      chartData.datasets[0].data = hist.temperature;
+      chartData.datasets[1].data = hist.humidity;
       chart.update();
     }}
 
-    async function tick() {{
-      await refreshTableAndTopics();
-      await refreshChart();
+    function appendPoint(row) {{
+      const p = row.payload || {{}};
+      chartData.labels.push(new Date(row.ts*1000).toLocaleTimeString());
+      chartData.datasets[0].data.push(p.temperature ?? null);
+      chartData.datasets[1].data.push(p.humidity ?? null);
+      if (chartData.labels.length > CHART_MAX) {{
+        chartData.labels.shift();
+        chartData.datasets.forEach(d => d.data.shift());
+      }}
+      if (!redraw) {{ redraw = true; requestAnimationFrame(() => {{ redraw = false; chart.update(); }}); }}
     }}
-    tick();
-    setInterval(tick, 1500);
+
+    document.getElementById('topicSel').addEventListener('change', loadChart);
+
+    const es = new EventSource('/telemetry/stream');
+    es.addEventListener('snapshot', e => {{
+      const data = JSON.parse(e.data);
+      for (const t of Object.keys(data).sort()) renderRow(data[t]);
+      if (selTopic) loadChart();     // reconnect: refill anything missed
+    }});
+    es.addEventListener('dropped', () => {{
+      if (selTopic) loadChart();     // events were lost: refill the chart from history
+    }});
+    es.addEventListener('latest', e => {{
+      const row = JSON.parse(e.data);
+      renderRow(row);
+      if (row.topic === selTopic && chart) appendPoint(row);
+    }});
   </script>
 </body>
 </html>
 """
+
+# Rendered once; served with ETag and precompressed variants
+DASHBOARD = StaticAsset(_dashboard_html().encode("utf-8"), "text/html; charset=utf-8")
+
+@app.get("/dashboard", response_class=HTMLResponse)
+def dashboard(request: Request):
+    return DASHBOARD.response(request)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Streaming bulk export for /telemetry/export.
+#
+# A source yields batches of (topic, ts, size_bytes, field...) tuples (see
+# TelemetryLog.scan and history_batches) and one of the encoders below turns
+# each batch into a bytes chunk as it arrives, so neither side ever holds
+# more than one batch. Formats:
+#   ndjson  one JSON object per line, missing readings omitted
+#   csv     header row, then one row per point, missing readings empty
+#   arrow   Arrow IPC stream, one record batch per chunk (pip install pyarrow)
+from __future__ import annotations
+import csv, io
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from api.history_store import HistoryStore
+from api.responses import dumps
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+Batch = List[Tuple[Any, ...]]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def history_batches(store: HistoryStore, topics: Iterable[str], since: Optional[float],
+                    until: Optional[float], chunk: int = 4096) -> Iterator[Batch]:
+    # Same batches as TelemetryLog.scan, from the in-memory rings (topic by topic).
+    for topic in topics:
+        cols = store.window(topic, since, until)
+        if cols is None:
+            continue
+        fields = [cols[f] for f in store.fields]
+        for a in range(0, len(cols["ts"]), chunk):
+            b = a + chunk
+            yield [(topic,) + r for r in zip(cols["ts"][a:b], cols["size_bytes"][a:b],
+                                             *(c[a:b] for c in fields))]
+
+
+def _select(fields: Sequence[str], keep: Optional[Sequence[str]]) -> List[Tuple[int, str]]:
+    # (tuple index, name) of the value columns to emit.
+    return [(3 + i, f) for i, f in enumerate(fields) if not keep or f in keep]
+
+
+def ndjson(batches: Iterable[Batch], fields: Sequence[str],
+           keep: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+    cols = _select(fields, keep)
+    for batch in batches:
+        lines = []
+        for r in batch:
+            rec: Dict[str, Any] = {"topic": r[0], "ts": r[1], "size_bytes": r[2]}
+            for i, f in cols:
+                if r[i] == r[i]:
+                    rec[f] = r[i]
+            lines.append(dumps(rec))
+        yield b"\n".join(lines) + b"\n"
+
+
+def csv_rows(batches: Iterable[Batch], fields: Sequence[str],
+             keep: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+    cols = _select(fields, keep)
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(["topic", "ts", "size_bytes"] + [f for _, f in cols])
+    for batch in batches:
+        for r in batch:
+            w.writerow([r[0], r[1], r[2]] + ["" if r[i] != r[i] else r[i] for i, _ in cols])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def arrow(batches: Iterable[Batch], fields: Sequence[str],
+          keep: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+    # Columns: topic (dictionary-encoded), ts (timestamp[s]), size_bytes, fields (NaN -> null).
+    cols = _select(fields, keep)
+    schema = pa.schema([("topic", pa.dictionary(pa.int32(), pa.string())),
+                        ("ts", pa.timestamp("s")), ("size_bytes", pa.uint32())]
+                       + [(f, pa.float64()) for _, f in cols])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    yield _take(sink)
+    for batch in batches:
+        data = [pa.array([r[0] for r in batch]).dictionary_encode(),
+                pa.array([r[1] for r in batch], pa.timestamp("s")),
+                pa.array([r[2] for r in batch], pa.uint32())]
+        for i, _ in cols:
+            data.append(pa.array([r[i] for r in batch], pa.float64(), from_pandas=True))
+        writer.write_batch(pa.record_batch(data, schema=schema))
+        yield _take(sink)
+    writer.close()
+    yield _take(sink)
+
+
+def _take(sink: io.BytesIO) -> bytes:
+    out = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return out
+
+
+ENCODERS = {"ndjson": ndjson, "csv": csv_rows, "arrow": arrow}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Columnar ring-buffer history for the API.
+#
+# Each topic keeps one timestamp column shared by every field column, all
+# backed by typed array.array buffers (8 bytes per value instead of a Python
+# dict per point). Missing readings are stored as NaN. Buffers grow on demand
+# up to the per-topic capacity and then wrap around, overwriting the oldest
+# point, so an idle topic never pays for its full capacity.
+from __future__ import annotations
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Any
+
+FIELDS = ("temperature", "humidity")
+NAN = float("nan")
+
+
+class _Ring:
+    __slots__ = ("ts", "size", "cols", "head", "cap", "appended")
+
+    def __init__(self, cap: int, fields: Iterable[str]):
+        self.ts = array("q")
+        self.size = array("I")
+        self.cols = {f: array("d") for f in fields}
+        self.head = 0          # oldest slot once the ring is full
+        self.cap = cap
+        self.appended = 0      # total points ever written, for cache invalidation
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append(self, ts: int, size: int, values: Dict[str, float]):
+        self.appended += 1
+        if len(self.ts) < self.cap:
+            self.ts.append(ts)
+            self.size.append(size)
+            for f, col in self.cols.items():
+                col.append(values.get(f, NAN))
+            return
+        i = self.head
+        self.ts[i] = ts
+        self.size[i] = size
+        for f, col in self.cols.items():
+            col[i] = values.get(f, NAN)
+        self.head = (i + 1) % self.cap
+
+    def take(self, col: array, start: int, stop: int) -> array:
+        # Copy logical points [start, stop) (0 = oldest) out of the ring.
+        n = len(col)
+        count = stop - start
+        p = (self.head + start) % n if n else 0
+        if p + count <= n:
+            return col[p:p + count]
+        return col[p:] + col[:count - (n - p)]
+
+    def bisect(self, t: float, right: bool = False) -> int:
+        # First logical index with ts >= t (or > t when right=True). The ring is
+        # two sorted runs, ts[head:] then ts[:head]: search the older one first.
+        find = bisect_right if right else bisect_left
+        n, h = len(self.ts), self.head
+        i = find(self.ts, t, h, n)
+        if i < n or not h:
+            return i - h
+        return (n - h) + find(self.ts, t, 0, h)
+
+    def nbytes(self) -> int:
+        total = self.ts.buffer_info()[1] * self.ts.itemsize
+        total += self.size.buffer_info()[1] * self.size.itemsize
+        for col in self.cols.values():
+            total += col.buffer_info()[1] * col.itemsize
+        return total
+
+
+class HistoryStore:
+    # Thread-safe: the MQTT thread appends while HTTP workers read slices.
+
+    def __init__(self, capacity: int, fields: Iterable[str] = FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._rings: Dict[str, _Ring] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self._rings
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return list(self._rings)
+
+    def append(self, topic: str, ts: int, size: int, values: Dict[str, float]):
+        with self._lock:
+            ring = self._rings.get(topic)
+            if ring is None:
+                ring = self._rings[topic] = _Ring(self.capacity, self.fields)
+            ring.append(ts, size, values)
+
+    def oldest(self, topic: str) -> Optional[int]:
+        # Timestamp of the oldest point still held for a topic.
+        with self._lock:
+            ring = self._rings.get(topic)
+            if ring is None or not len(ring):
+                return None
+            return ring.ts[ring.head]
+
+    def generation(self, topic: str) -> int:
+        # Changes whenever a point is appended to the topic (0 for unknown topics).
+        ring = self._rings.get(topic)
+        return ring.appended if ring is not None else 0
+
+    def wrapped(self, topic: str) -> bool:
+        # True once a topic has started overwriting its oldest points.
+        ring = self._rings.get(topic)
+        return ring is not None and len(ring) >= ring.cap
+
+    def tail(self, topic: str, n: int) -> Optional[Dict[str, array]]:
+        # Last n points as columns: {"ts": array, "size_bytes": array, <field>: array}
+        return self.window(topic, n=n)
+
+    def window(self, topic: str, since: Optional[float] = None, until: Optional[float] = None,
+               n: Optional[int] = None) -> Optional[Dict[str, array]]:
+        # Points with since <= ts <= until (either bound optional), keeping the
+        # newest n when n is given. Located by binary search on the ts column.
+        with self._lock:
+            ring = self._rings.get(topic)
+            if ring is None or not len(ring):
+                return None
+            start = ring.bisect(since) if since is not None else 0
+            stop = ring.bisect(until, right=True) if until is not None else len(ring)
+            stop = max(start, stop)
+            if n is not None:
+                start = max(start, stop - n)
+            cols = {
+                "ts": ring.take(ring.ts, start, stop),
+                "size_bytes": ring.take(ring.size, start, stop),
+            }
+            for f, col in ring.cols.items():
+                cols[f] = ring.take(col, start, stop)
+            return cols
+
+    def memory_report(self) -> Dict[str, Any]:
+        # Current footprint plus a projection for every known topic at capacity.
+        with self._lock:
+            rings = list(self._rings.values())
+        points = sum(len(r) for r in rings)
+        used = sum(r.nbytes() for r in rings)
+        row_bytes = 8 + 4 + 8 * len(self.fields)
+        return {
+            "topics": len(rings),
+            "points": points,
+            "capacity_per_topic": self.capacity,
+            "fields": list(self.fields),
+            "bytes_per_point": row_bytes,
+            "bytes_allocated": used,
+            "bytes_at_capacity": len(rings) * self.capacity * row_bytes,
+        }
+
+
+def columns_json(cols: Dict[str, array]) -> Dict[str, list]:
+    # Column arrays -> JSON-safe lists (NaN becomes null).
+    out = {"ts": cols["ts"].tolist(), "size_bytes": cols["size_bytes"].tolist()}
+    for f, col in cols.items():
+        if f in out:
+            continue
+        out[f] = [None if v != v else v for v in col.tolist()]
+    return out
+
+
+def rows_json(cols: Dict[str, array]) -> List[Dict[str, Any]]:
+    # Column arrays -> the original list-of-points shape, omitting missing fields.
+    fields = [f for f in cols if f not in ("ts", "size_bytes")]
+    data = [cols[f].tolist() for f in fields]
+    rows = []
+    for i, (ts, size) in enumerate(zip(cols["ts"].tolist(), cols["size_bytes"].tolist())):
+        rec = {"ts": ts, "size_bytes": size}
+        for f, col in zip(fields, data):
+            v = col[i]
+            if v == v:
+                rec[f] = v
+        rows.append(rec)
+    return rows
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Bounded hand-off between the MQTT network thread and ingest processing.
+#
+# The MQTT callback only calls submit(topic, payload, ts); a worker thread
+# drains the queue in batches and runs the (slower) decode/normalize/store
+# step, so socket reads and keepalives never wait on JSON parsing. When the
+# queue is full the overflow policy decides what gives:
+#   drop_oldest     discard the oldest queued message (keeps data fresh)
+#   block           make the producer wait for room (no loss, may stall); an
+#                   asyncio producer passes wait=False and pauses its reads
+#                   while has_room() is False instead
+#   count_and_drop  discard the new message (keeps the backlog intact)
+from __future__ import annotations
+import threading, time
+from collections import deque
+from typing import Callable, List, Optional, Tuple, Dict, Any
+
+POLICIES = ("drop_oldest", "block", "count_and_drop")
+
+Item = Tuple[str, bytes, float, bool]      # topic, payload, receive ts, retained
+
+
+class IngestPipeline:
+
+    def __init__(self, handler: Callable[[List[Item]], None], maxsize: int = 10000,
+                 batch_max: int = 256, policy: str = "drop_oldest",
+                 idle: Optional[Callable[[], None]] = None, idle_interval: float = 1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown ingest overflow policy '{policy}'")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.batch_max = batch_max
+        self.policy = policy
+        self.idle = idle
+        self.idle_interval = idle_interval
+        self._q: deque = deque()
+        self._cv = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        # counters (written under the condition lock or by the worker only)
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    # ---- producer side (MQTT callbacks) ----
+
+    def has_room(self) -> bool:
+        return len(self._q) < self.maxsize or self.policy != "block"
+
+    def submit(self, topic: str, payload: bytes, ts: float, wait: bool = True,
+               retained: bool = False) -> bool:
+        with self._cv:
+            if len(self._q) >= self.maxsize and (wait or self.policy != "block"):
+                if self.policy == "count_and_drop":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop_oldest":
+                    self._q.popleft()
+                    self.dropped += 1
+                else:
+                    self.blocked += 1
+                    while len(self._q) >= self.maxsize and self._running:
+                        self._cv.wait()
+            self._q.append((topic, payload, ts, retained))
+            self.enqueued += 1
+            if len(self._q) > self.max_depth:
+                self.max_depth = len(self._q)
+            self._cv.notify_all()
+        return True
+
+    # ---- consumer side (worker thread) ----
+
+    def _take(self) -> List[Item]:
+        with self._cv:
+            if not self._q and self._running:
+                self._cv.wait(self.idle_interval)
+            n = min(len(self._q), self.batch_max)
+            batch = [self._q.popleft() for _ in range(n)]
+            if batch and self.policy == "block":
+                self._cv.notify_all()
+            return batch
+
+    def _run(self):
+        while self._running or self._q:
+            batch = self._take()
+            if not batch:
+                if self.idle:
+                    self.idle()
+                continue
+            lag = time.time() - batch[0][2]
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            try:
+                self.handler(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"[INGEST] batch failed: {e}")
+            self.processed += len(batch)
+            self.batches += 1
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        # Stop accepting work and let the worker drain what is already queued.
+        with self._cv:
+            self._running = False
+            self._cv.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cv:
+            depth = len(self._q)
+            oldest = self._q[0][2] if self._q else None
+        return {
+            "policy": self.policy,
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "batches": self.batches,
+            "errors": self.errors,
+            "queue_lag_s": round(time.time() - oldest, 6) if oldest else 0.0,
+            "last_batch_lag_s": round(self.last_lag, 6),
+            "max_batch_lag_s": round(self.max_lag, 6),
+        }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Fan-out of live telemetry deltas to streaming (SSE) clients.
+#
+# publish() is called from the MQTT thread once per message; the event is
+# serialized once and handed to every subscriber whose MQTT-style filters
+# match. Each subscriber has its own bounded buffer, so a slow browser never
+# blocks ingest. What happens when that buffer is full is the drop policy:
+#   drop_oldest  keep the newest events, count the discarded ones
+#   coalesce     keep only the newest event per topic (dashboards)
+#   disconnect   close the stream; the client reconnects and resyncs
+# Under coalesce, a newer event replacing a pending one for the same topic is
+# counted as coalesced, not dropped: the client still gets that topic's latest
+# row. Only events lost outright (a full buffer) are reported to it as dropped.
+from __future__ import annotations
+import asyncio, threading
+from collections import OrderedDict, deque
+from typing import Iterable, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class Subscriber:
+    __slots__ = ("filters", "policy", "maxlen", "buf", "loop", "event",
+                 "dropped", "coalesced", "closed", "_wake_pending")
+
+    def __init__(self, filters: List[str], loop: asyncio.AbstractEventLoop,
+                 policy: str, maxlen: int):
+        self.filters = filters
+        self.policy = policy
+        self.maxlen = maxlen
+        self.buf = OrderedDict() if policy == "coalesce" else deque()
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._wake_pending = False
+
+    def matches(self, topic: str) -> bool:
+        return any(f == topic or topic_matches_sub(f, topic) for f in self.filters)
+
+    def offer(self, topic: str, data: str):
+        # Called with the hub lock held.
+        if self.policy == "coalesce":
+            if topic in self.buf:
+                self.buf.move_to_end(topic)
+                self.coalesced += 1
+            elif len(self.buf) >= self.maxlen:
+                self.buf.popitem(last=False)
+                self.dropped += 1
+            self.buf[topic] = data
+        elif len(self.buf) >= self.maxlen:
+            if self.policy == "disconnect":
+                self.closed = True
+            else:
+                self.buf.popleft()
+                self.dropped += 1
+                self.buf.append((topic, data))
+        else:
+            self.buf.append((topic, data))
+        if not self._wake_pending:
+            self._wake_pending = True
+            try:
+                self.loop.call_soon_threadsafe(self.event.set)
+            except RuntimeError:
+                self.closed = True      # event loop already gone
+
+    def drain(self) -> Tuple[List[Tuple[str, str]], int, int]:
+        # Called with the hub lock held; returns (events, dropped, coalesced) since last drain.
+        if self.policy == "coalesce":
+            items = list(self.buf.items())
+        else:
+            items = list(self.buf)
+        self.buf.clear()
+        dropped, self.dropped = self.dropped, 0
+        coalesced, self.coalesced = self.coalesced, 0
+        self._wake_pending = False
+        self.event.clear()
+        return items, dropped, coalesced
+
+
+class LiveHub:
+
+    def __init__(self, policy: str = "coalesce", maxlen: int = 512):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown live drop policy '{policy}'")
+        self.policy = policy
+        self.maxlen = maxlen
+        self._subs: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self.dropped_total = 0
+        self.coalesced_total = 0
+        self.disconnected_total = 0
+
+    def __bool__(self) -> bool:
+        # Cheap check so publishers can skip serialization with no viewers.
+        return bool(self._subs)
+
+    def subscribe(self, filters: Iterable[str], loop: asyncio.AbstractEventLoop,
+                  policy: Optional[str] = None) -> Subscriber:
+        sub = Subscriber(list(filters) or ["#"], loop, policy or self.policy, self.maxlen)
+        with self._lock:
+            self._subs = self._subs + [sub]
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self._subs = [s for s in self._subs if s is not sub]
+
+    def publish(self, topic: str, data: str):
+        with self._lock:
+            for sub in self._subs:
+                if not sub.closed and sub.matches(topic):
+                    sub.offer(topic, data)
+                    if sub.closed:
+                        self.disconnected_total += 1
+
+    def drain(self, sub: Subscriber) -> Tuple[List[Tuple[str, str]], int]:
+        # (events, events lost outright); coalesced ones only go to the totals.
+        with self._lock:
+            items, dropped, coalesced = sub.drain()
+            self.dropped_total += dropped
+            self.coalesced_total += coalesced
+            return items, dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                "clients": len(self._subs),
+                "policy": self.policy,
+                "buffer_per_client": self.maxlen,
+                "dropped_total": self.dropped_total,
+                "coalesced_total": self.coalesced_total,
+                "disconnected_total": self.disconnected_total,
+            }
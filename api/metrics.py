@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Prometheus text-format metrics with per-thread sharded counters.
+#
+# Hot paths (paho threads, the ingest worker, request handlers) only touch a
+# dict owned by the calling thread, so increments take no lock and never
+# contend; a scrape copies and sums the shards. Gauges that already live
+# elsewhere (queue depth, subscriber state, ...) are read at scrape time by
+# collector callbacks instead of being mirrored on every message.
+#
+# A histogram can also add totals from other processes at render time
+# (Histogram.remote), which is how the multi-worker API reports request
+# latency from every worker, not just the one that was scraped.
+from __future__ import annotations
+import bisect, threading, time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Sharded:
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.d
+        except AttributeError:
+            d = self._local.d = {}
+            with self._lock:
+                self._shards.append(d)
+            return d
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        return [d.copy() for d in shards]
+
+
+class Counter(_Sharded):
+
+    def inc(self, labels: Labels = (), v: float = 1):
+        d = self._shard()
+        d[labels] = d.get(labels, 0) + v
+
+    def render(self) -> Iterable[str]:
+        total: Dict[Labels, float] = {}
+        for d in self._snapshots():
+            for k, v in d.items():
+                total[k] = total.get(k, 0) + v
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for k in sorted(total):
+            yield f"{self.name}{_labels(self.labelnames, k)} {_num(total[k])}"
+
+
+class Histogram(_Sharded):
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(buckets)
+        # () -> other processes' totals() to add in, e.g. from shared memory
+        self.remote: Optional[Callable[[], Iterable[Dict[Labels, list]]]] = None
+
+    def observe(self, labels: Labels, v: float):
+        d = self._shard()
+        e = d.get(labels)
+        if e is None:
+            e = d[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+        e[bisect.bisect_left(self.bounds, v)] += 1
+        e[-1] += v
+
+    def totals(self, extra: Iterable[Dict[Labels, list]] = ()) -> Dict[Labels, list]:
+        # Bucket counts plus sum per label set, summed over the shards (and `extra`).
+        total: Dict[Labels, list] = {}
+        width = len(self.bounds) + 2
+        for d in (*self._snapshots(), *extra):
+            for k, e in d.items():
+                if len(e) != width:
+                    continue        # another bucket layout
+                acc = total.setdefault(k, [0] * width)
+                for i, x in enumerate(e):
+                    acc[i] += x
+        return total
+
+    def render(self) -> Iterable[str]:
+        extra: Iterable[Dict[Labels, list]] = ()
+        if self.remote is not None:
+            try:
+                extra = list(self.remote())
+            except Exception as e:
+                yield f"# {self.name} remote totals failed: {e}"
+        total = self.totals(extra)
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for k in sorted(total):
+            e = total[k]
+            cum = 0
+            for bound, n in zip(self.bounds, e):
+                cum += n
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, k, le)} {cum}"
+            cum += e[len(self.bounds)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, k, le)} {cum}"
+            yield f"{self.name}_sum{_labels(self.labelnames, k)} {_num(e[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, k)} {cum}"
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: List[_Sharded] = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        m = Counter(name, help, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def collector(self, name: str, help: str, kind: str = "gauge"):
+        # Decorator: fn() yields (labels, value) samples, read at scrape time.
+        def register(fn: Callable[[], Iterable[Sample]]):
+            self._collectors.append((name, help, kind, fn))
+            return fn
+        return register
+
+    def render(self, exclude: Sequence[_Sharded] = ()) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            if m not in exclude:
+                lines.extend(m.render())
+        for name, help, kind, fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                lines.append(f"# {name} collector failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    # ASGI middleware: request latency per matched route template, method and status.
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+
+        async def timed_send(msg):
+            if msg["type"] == "http.response.start":
+                # Time to response start: for streams (SSE) this excludes the stream itself
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                self.histogram.observe((path, scope["method"], str(msg["status"])),
+                                       time.perf_counter() - t0)
+            await send(msg)
+
+        await self.app(scope, receive, timed_send)
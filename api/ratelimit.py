@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Token-bucket rate limits for the API ingest, checked before a message is
+# queued or parsed.
+#
+# Every topic gets a bucket refilled at `topic_rate` messages/s up to
+# `topic_burst` (per-filter overrides resolved once per topic, like schema
+# lookups), and all topics share one global bucket. A message needs a token
+# from both, otherwise it is shed on the spot: no queueing, no JSON, no
+# history append, so one flooding node cannot crowd out the others. A rate
+# of 0 means unlimited. Memory is capped at `max_topics` buckets: when full,
+# idle buckets (refilled to their burst and not noisy, so dropping them loses
+# nothing) are evicted, at most once per SWEEP_S; only if none is idle do new
+# topics share one overflow bucket until the next sweep. A node cycling
+# through random topic names therefore cannot throttle sensors added later.
+#
+# A topic that shed in the last NOISY_S seconds counts as noisy and keeps
+# its last `sample_n` accepted messages (receive time, size, payload head)
+# for the admin endpoint, to see what the node is actually sending.
+#
+# Limits can be changed at runtime with configure(); existing buckets pick
+# up the new rate and burst immediately.
+from __future__ import annotations
+import threading, time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+NOISY_S = 60.0
+SWEEP_S = 1.0
+SAMPLE_BYTES = 256
+OVERFLOW = "<overflow>"
+
+
+def parse_overrides(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "team1/lab/+:50:100,team1/noisy:1:5" -> {filter: (rate, burst)}
+    out = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        flt, rate, burst = part.rsplit(":", 2)
+        out[flt.strip()] = (float(rate), float(burst))
+    return out
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp", "accepted", "shed", "noisy_until", "samples")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.stamp = now
+        self.accepted = 0
+        self.shed = 0
+        self.noisy_until = 0.0
+        self.samples: Optional[Deque[Tuple[float, int, str]]] = None
+
+    def refill(self, now: float) -> float:
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        return self.tokens
+
+
+class RateLimiter:
+
+    def __init__(self, topic_rate: float = 0.0, topic_burst: float = 0.0,
+                 global_rate: float = 0.0, global_burst: float = 0.0,
+                 overrides: Optional[Dict[str, Tuple[float, float]]] = None,
+                 sample_n: int = 5, max_topics: int = 10000):
+        self.max_topics = max_topics
+        self.sample_n = sample_n
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+        self.shed_topic = 0
+        self.shed_global = 0
+        self.evicted = 0
+        self._global: Optional[_Bucket] = None
+        self._next_sweep = 0.0
+        self.configure(topic_rate, topic_burst, global_rate, global_burst, overrides or {})
+
+    def configure(self, topic_rate: float, topic_burst: float, global_rate: float,
+                  global_burst: float, overrides: Dict[str, Tuple[float, float]]):
+        # Burst defaults to one second's worth of the rate.
+        now = time.monotonic()
+        with self._lock:
+            self.topic_rate = topic_rate
+            self.topic_burst = topic_burst or topic_rate
+            self.global_rate = global_rate
+            self.global_burst = global_burst or global_rate
+            self.overrides = dict(overrides)
+            self.enabled = bool(topic_rate or global_rate or any(r for r, _ in self.overrides.values()))
+            # Existing buckets keep their tokens (settled at the old rate), so a
+            # change never hands out a fresh burst
+            if self._global is None or not self._global.rate:
+                self._global = _Bucket(global_rate, self.global_burst, now)
+            else:
+                self._retune(self._global, global_rate, self.global_burst, now)
+            for topic, b in self._buckets.items():
+                self._retune(b, *self._limits(topic), now)
+
+    @staticmethod
+    def _retune(b: _Bucket, rate: float, burst: float, now: float):
+        b.refill(now)
+        b.rate, b.burst = rate, max(1.0, burst)
+        b.tokens = min(b.tokens, b.burst)
+
+    def limits(self) -> Dict[str, Any]:
+        # The configure() arguments currently in effect.
+        return {"topic_rate": self.topic_rate, "topic_burst": self.topic_burst,
+                "global_rate": self.global_rate, "global_burst": self.global_burst,
+                "overrides": dict(self.overrides)}
+
+    def _limits(self, topic: str) -> Tuple[float, float]:
+        for flt, (rate, burst) in self.overrides.items():
+            if topic_matches_sub(flt, topic):
+                return rate, burst or rate
+        return self.topic_rate, self.topic_burst
+
+    def _evict(self, now: float):
+        # Drop every bucket that carries no state: refilled to its burst, not noisy.
+        idle = [t for t, b in self._buckets.items() if b.noisy_until <= now
+                and (not b.rate or b.tokens + (now - b.stamp) * b.rate >= b.burst)]
+        for t in idle:
+            del self._buckets[t]
+        self.evicted += len(idle)
+
+    def _bucket(self, topic: str, now: float) -> _Bucket:
+        with self._lock:
+            b = self._buckets.get(topic)
+            if b is None:
+                if len(self._buckets) >= self.max_topics and now >= self._next_sweep:
+                    self._next_sweep = now + SWEEP_S
+                    self._evict(now)
+                if len(self._buckets) >= self.max_topics:
+                    topic = OVERFLOW
+                    b = self._buckets.get(topic)
+                if b is None:
+                    b = self._buckets[topic] = _Bucket(*self._limits(topic), now)
+            return b
+
+    def check(self, topic: str, payload: bytes, now: Optional[float] = None) -> Optional[str]:
+        # None to accept, or why the message is shed ("topic" or "global").
+        now = time.monotonic() if now is None else now
+        b = self._buckets.get(topic) or self._bucket(topic, now)
+        g = self._global
+        if b.rate and b.refill(now) < 1:
+            b.shed += 1
+            b.noisy_until = now + NOISY_S
+            self.shed_topic += 1
+            return "topic"
+        if g.rate and g.refill(now) < 1:
+            b.shed += 1
+            self.shed_global += 1
+            return "global"
+        if b.rate:
+            b.tokens -= 1
+        if g.rate:
+            g.tokens -= 1
+        b.accepted += 1
+        if b.noisy_until > now and self.sample_n:
+            if b.samples is None:
+                b.samples = deque(maxlen=self.sample_n)
+            b.samples.append((time.time(), len(payload),
+                              payload[:SAMPLE_BYTES].decode("utf-8", errors="replace")))
+        return None
+
+    def noisy(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return sum(1 for b in self._buckets.values() if b.noisy_until > now)
+
+    def describe(self, top: int = 20, samples: bool = True) -> Dict[str, Any]:
+        # Current limits, totals and the topics shedding the most (with their
+        # payload samples unless samples=False).
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._buckets.items())
+        worst = sorted((kv for kv in items if kv[1].shed), key=lambda kv: -kv[1].shed)[:top]
+        return {
+            "enabled": self.enabled,
+            "topic_rate": self.topic_rate, "topic_burst": self.topic_burst,
+            "global_rate": self.global_rate, "global_burst": self.global_burst,
+            "overrides": {f: list(v) for f, v in self.overrides.items()},
+            "tracked_topics": len(items), "max_topics": self.max_topics, "evicted": self.evicted,
+            "shed": {"topic": self.shed_topic, "global": self.shed_global},
+            "global_tokens": round(self._global.tokens, 2) if self.global_rate else None,
+            "noisy": [{
+                "topic": t, "rate": b.rate, "burst": b.burst, "accepted": b.accepted, "shed": b.shed,
+                "noisy": b.noisy_until > now,
+                "samples": [{"ts": ts, "size_bytes": n, **({"payload": p} if samples else {})}
+                            for ts, n, p in b.samples or ()],
+            } for t, b in worst],
+        }
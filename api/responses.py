@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Byte-level response helpers for the read endpoints.
+#
+# dumps() serializes straight to UTF-8 bytes with orjson when it is installed
+# (pip install orjson) and compact stdlib json otherwise (also for the values
+# orjson refuses, such as integers beyond 64 bits from a device payload).
+# Both write NaN and infinities as null, as orjson does, so the output is
+# always valid JSON for browsers. Endpoints hand the bytes to JSONBytes so
+# FastAPI skips its own validation/encoding pass.
+# StaticAsset holds a page rendered once at startup together with its ETag
+# and precompressed gzip (and brotli, if the module is installed) variants.
+from __future__ import annotations
+import gzip, hashlib, json, math
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODER = "orjson" if orjson else "json"
+GZIP_MIN_BYTES = 1024
+
+
+def _finite(obj: Any) -> Any:
+    # Copy of obj with non-finite floats replaced by None (only on the slow path).
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    try:
+        s = json.dumps(obj, separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+    except ValueError:      # NaN/Infinity somewhere
+        s = json.dumps(_finite(obj), separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+    return s.encode("utf-8")
+
+
+class JSONBytes(Response):
+    # Body is already serialized JSON bytes.
+    media_type = "application/json"
+
+
+def accepts(request: Request, coding: str) -> bool:
+    # Accept-Encoding lists the coding (or "*") with a q-value above 0.
+    star = False
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if name not in (coding, "*"):
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.partition("=")
+            if k.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if name == coding:
+            return q > 0
+        star = q > 0
+    return star
+
+
+def gzip_body(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=5, mtime=0)
+
+
+class StaticAsset:
+
+    def __init__(self, body: bytes, media_type: str, max_age: int = 300):
+        self.body = body
+        self.media_type = media_type
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        self.gzip = gzip.compress(body, compresslevel=9, mtime=0)
+        self.br = brotli.compress(body) if brotli else None
+        self.headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={max_age}",
+                        "Vary": "Accept-Encoding"}
+
+    def response(self, request: Request) -> Response:
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=self.headers)
+        if self.br is not None and accepts(request, "br"):
+            return Response(self.br, media_type=self.media_type,
+                            headers={**self.headers, "Content-Encoding": "br"})
+        if accepts(request, "gzip"):
+            return Response(self.gzip, media_type=self.media_type,
+                            headers={**self.headers, "Content-Encoding": "gzip"})
+        return Response(self.body, media_type=self.media_type, headers=self.headers)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Payload schema registry for the API ingest path.
+#
+# A schema file (API_SCHEMAS_FILE, JSON) maps MQTT topic filters to declared
+# payload fields:
+#
+#   {"schemas": [{
+#     "name": "dht22",
+#     "topics": ["sensors/+/dht"],
+#     "extra": "keep",                  # or "drop": unknown keys are removed
+#     "on_range": "reject",             # or "drop": out-of-range fields are removed,
+#                                       # unless required
+#     "fields": {
+#       "temperature": {"type": "float", "unit": "C", "min": -40, "max": 80,
+#                       "aliases": ["temp_c", {"name": "temp_f", "scale": 0.5556, "offset": -17.7778}]},
+#       "humidity":    {"type": "float", "unit": "%", "min": 0, "max": 100, "aliases": ["hum"]},
+#       "_ts":         {"type": "int", "required": false}
+#     }}]}
+#
+# Each schema is compiled once into a specialized Python function (the same
+# trick dataclasses uses): one straight-line block per field with its alias
+# lookups, conversion and range check inlined as constants, so a message only
+# runs the code for its own fields. The compiled function returns the
+# normalized payload and the numeric values for the history store. NaN and
+# infinite floats, and ints outside int64, are type errors whatever the
+# range settings, so they never reach history or stats. Topic ->
+# schema resolution is cached per topic; topics without a schema keep the
+# generic path in app.py.
+from __future__ import annotations
+import json, math, threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+TYPES = ("float", "int", "str", "bool")
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1     # history columns are int64/double
+_MISSING = object()
+
+
+class SchemaReject(ValueError):
+    # A payload that does not satisfy its schema; reason is a short counter label.
+
+    def __init__(self, reason: str, field: str = "", detail: str = ""):
+        super().__init__(f"{reason} {field}: {detail}".strip(": ").strip())
+        self.reason = reason
+        self.field = field
+
+
+def _float(v: Any) -> float:
+    if v.__class__ is bool or v is None:
+        raise TypeError("not a number")
+    return float(v)     # OverflowError past a double; "nan"/"inf" are caught after conversion
+
+
+def _int(v: Any) -> int:
+    if v.__class__ is bool or v is None:
+        raise TypeError("not an integer")
+    if v.__class__ is float and not v.is_integer():
+        raise TypeError("not an integer")
+    return int(v)
+
+
+def _bool(v: Any) -> bool:
+    if v.__class__ is bool:
+        return v
+    if v in (0, 1):
+        return bool(v)
+    raise TypeError("not a boolean")
+
+
+def _str(v: Any) -> str:
+    if v.__class__ is not str:
+        raise TypeError("not a string")
+    return v
+
+
+_CONVERT = {"float": "_float", "int": "_int", "str": "_str", "bool": "_bool"}
+_EXACT = {"float": "float", "int": "int", "str": "str", "bool": "bool"}
+
+
+def _aliases(spec: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+    out = []
+    for a in spec.get("aliases", []):
+        if isinstance(a, str):
+            out.append((a, 1.0, 0.0))
+        else:
+            out.append((a["name"], float(a.get("scale", 1.0)), float(a.get("offset", 0.0))))
+    return out
+
+
+def compile_normalizer(name: str, fields: Dict[str, Dict[str, Any]], extra: str = "keep",
+                       on_range: str = "reject",
+                       history_fields: Tuple[str, ...] = ()) -> Callable[[Any], Tuple[dict, dict]]:
+    # Generate def normalize(d) -> (payload, history_values) for one schema.
+    lines = ["def normalize(d):",
+             "    if d.__class__ is not dict:",
+             "        raise SchemaReject('not_object')"]
+    if extra == "drop":
+        lines.append("    out = {}")
+    else:
+        lines.append("    out = dict(d)")
+        # aliases are replaced by the canonical name
+        for f, spec in fields.items():
+            for a, _, _ in _aliases(spec):
+                lines.append(f"    out.pop({a!r}, None)")
+    lines.append("    vals = {}")
+    for f, spec in fields.items():
+        typ = spec.get("type", "float")
+        if typ not in TYPES:
+            raise ValueError(f"schema {name}: field {f}: unknown type {typ!r}")
+        lines.append(f"    v = d.get({f!r}, MISSING)")
+        for a, scale, offset in _aliases(spec):
+            lines.append("    if v is MISSING:")
+            lines.append(f"        v = d.get({a!r}, MISSING)")
+            if scale != 1.0 or offset != 0.0:
+                lines.append("        if v is not MISSING and v is not None:")
+                lines.append("            try:")
+                lines.append(f"                v = _float(v) * {scale!r} + {offset!r}")
+                lines.append("            except (TypeError, ValueError, OverflowError) as e:")
+                lines.append(f"                raise SchemaReject('type', {f!r}, str(e))")
+        lines.append("    if v is not MISSING and v is not None:")
+        lines.append(f"        if v.__class__ is not {_EXACT[typ]}:")
+        lines.append("            try:")
+        lines.append(f"                v = {_CONVERT[typ]}(v)")
+        lines.append("            except (TypeError, ValueError, OverflowError) as e:")
+        lines.append(f"                raise SchemaReject('type', {f!r}, str(e))")
+        # exact-type values skip the conversion, so these checks come after it
+        if typ == "float":
+            lines.append("        if not isfinite(v):")
+            lines.append(f"            raise SchemaReject('type', {f!r}, repr(v))")
+        elif typ == "int":
+            lines.append(f"        if v < {INT_MIN} or v > {INT_MAX}:")
+            lines.append(f"            raise SchemaReject('type', {f!r}, 'outside the int64 range')")
+        lo, hi = spec.get("min"), spec.get("max")
+        if lo is not None or hi is not None:
+            if typ not in ("float", "int"):
+                raise ValueError(f"schema {name}: field {f}: min/max need a float or int field")
+            cond = " or ".join(c for c in (f"v < {float(lo)!r}" if lo is not None else "",
+                                            f"v > {float(hi)!r}" if hi is not None else "") if c)
+            lines.append(f"        if {cond}:")
+            # a required field cannot be dropped: out of range is a reject either way
+            if on_range == "drop" and not spec.get("required"):
+                lines.append(f"            out.pop({f!r}, None)")
+                lines.append("            v = MISSING")
+            else:
+                lines.append(f"            raise SchemaReject('range', {f!r}, repr(v))")
+        lines.append("        if v is not MISSING:")
+        lines.append(f"            out[{f!r}] = v")
+        if f in history_fields and typ in ("float", "int"):
+            lines.append(f"            vals[{f!r}] = v")
+        if spec.get("required"):
+            lines.append("    else:")
+            lines.append(f"        raise SchemaReject('missing', {f!r})")
+    lines.append("    return out, vals")
+    ns = {"SchemaReject": SchemaReject, "MISSING": _MISSING, "_float": _float, "_int": _int,
+          "_str": _str, "_bool": _bool, "isfinite": math.isfinite}
+    exec(compile("\n".join(lines), f"<schema {name}>", "exec"), ns)
+    return ns["normalize"]
+
+
+class Schema:
+
+    def __init__(self, spec: Dict[str, Any], history_fields: Tuple[str, ...]):
+        self.name = spec["name"]
+        self.topics = list(spec["topics"])
+        self.fields = spec.get("fields", {})
+        self.extra = spec.get("extra", "keep")
+        self.on_range = spec.get("on_range", "reject")
+        if self.extra not in ("keep", "drop") or self.on_range not in ("reject", "drop"):
+            raise ValueError(f"schema {self.name}: extra must be keep|drop, on_range reject|drop")
+        self.normalize = compile_normalizer(self.name, self.fields, self.extra, self.on_range,
+                                            history_fields)
+        self.accepted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "topics": self.topics, "extra": self.extra,
+                "on_range": self.on_range, "fields": self.fields,
+                "accepted": self.accepted, "rejected": dict(self.rejected)}
+
+
+class SchemaRegistry:
+
+    def __init__(self, schemas: List[Dict[str, Any]] = (), history_fields: Tuple[str, ...] = ()):
+        self.schemas = [Schema(s, tuple(history_fields)) for s in schemas]
+        self._resolved: Dict[str, Optional[Schema]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, history_fields: Tuple[str, ...] = ()) -> "SchemaRegistry":
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        return cls(doc.get("schemas", []), history_fields)
+
+    def __len__(self) -> int:
+        return len(self.schemas)
+
+    def lookup(self, topic: str) -> Optional[Schema]:
+        # First schema whose filters match the topic (cached per topic).
+        try:
+            return self._resolved[topic]
+        except KeyError:
+            pass
+        found = next((s for s in self.schemas
+                      if any(topic_matches_sub(flt, topic) for flt in s.topics)), None)
+        with self._lock:
+            self._resolved[topic] = found
+        return found
+
+    def apply(self, schema: Schema, data: Any) -> Tuple[dict, dict]:
+        # Normalize, counting the outcome; raises SchemaReject.
+        try:
+            out = schema.normalize(data)
+        except SchemaReject as e:
+            schema.rejected[e.reason] = schema.rejected.get(e.reason, 0) + 1
+            raise
+        schema.accepted += 1
+        return out
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [s.describe() for s in self.schemas]
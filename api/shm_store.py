@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+# Shared-memory telemetry state for running the API with several worker processes.
+#
+# One process (the ingest writer, elected with an flock on <name>.lock) owns
+# the MQTT pool and writes; every other worker only maps the segments and
+# reads. Segments live in /dev/shm as <name>-history, <name>-latest,
+# <name>-status and <name>-control and outlive the processes, so a restarted writer picks the
+# rings up where they were (delete them to reset). Each worker, writer or
+# reader, also holds one <name>-w<i> slot (see WorkerSlots) for its own
+# per-process state.
+#
+#   SharedHistoryStore  the HistoryStore interface over fixed per-topic rings:
+#                       a topic table (name, head, len, appended, seqlock) and
+#                       ts/size/field columns of `capacity` slots per topic.
+#                       Readers copy slices straight out of the mapping and
+#                       retry if the writer touched the ring meanwhile.
+#   SharedBlob          a double-buffered bytes value with a version counter:
+#                       the writer fills the idle half and flips, readers copy
+#                       the active half and retry if the version moved.
+#   WorkerSlots         one SharedBlob per live worker, claimed with an flock,
+#                       so any worker can read what the others published.
+#   SharedLatestView    the LatestState reader interface over a SharedBlob
+#                       holding the composed snapshot body plus the offset of
+#                       every topic's fragment, so filtered pages, single rows
+#                       and SSE deltas are byte slices, never re-serialized.
+#
+# One writer, many readers, no locks: every multi-word update is bracketed by
+# a sequence counter that readers check before and after copying. The one
+# exception is the control blob, which readers write (under exclusive()) and
+# the writer polls, to forward runtime changes such as /admin/limits.
+from __future__ import annotations
+import fcntl, os, struct, tempfile, time
+from array import array
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from api.history_store import FIELDS
+from api.responses import gzip_body
+from api.schemas import loads
+from api.snapshot import LatestState
+
+MAGIC = b"PQSM"
+LAYOUT = 1
+NAME_MAX = 200
+_HDR = struct.Struct("<4sHHIII")            # magic, layout, fields, capacity, max_topics, ntopics
+_ENTRY = struct.Struct("<QQII")             # seq, appended, head, len
+ENTRY_SIZE = 256                            # entry header, name length (u16), name
+_BLOB = struct.Struct("<4sHHQIIII")         # magic, layout, pad, version, active, half, len0, len1
+_IDX = struct.Struct("<III")                # fragment offset, length, key length
+
+
+def _lock_path(name: str) -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"{name}.lock")
+
+
+def elect_writer(name: str):
+    # Non-blocking exclusive flock: returns the open lock file for the writer, None otherwise.
+    f = open(_lock_path(name), "a+")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+@contextmanager
+def exclusive(name: str):
+    # Blocking flock around a blob that several workers write (SharedBlob is single-writer).
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    with open(os.path.join(base, f"{name}.lock"), "a+") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def replaced(shm: shared_memory.SharedMemory) -> bool:
+    # True once the segment name points at a different (recreated) or no segment.
+    try:
+        return os.stat(f"/dev/shm/{shm.name}").st_ino != os.fstat(shm._fd).st_ino
+    except OSError:
+        return True
+
+
+def _open(name: str, size: int, create: bool) -> shared_memory.SharedMemory:
+    # Attach, or (writer) create. The segments must outlive any one process, so
+    # they are taken off the resource tracker, which would unlink them at exit.
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+        if create and shm.size < size:
+            shm.close()
+            shm.unlink()
+            raise FileNotFoundError
+    except FileNotFoundError:
+        if not create:
+            raise
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SharedHistoryStore:
+
+    def __init__(self, name: str, capacity: int, max_topics: int = 1024,
+                 fields: Iterable[str] = FIELDS, create: bool = False):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.max_topics = max_topics
+        self.row_bytes = 8 + 4 + 8 * len(self.fields)
+        self._table = 64
+        self._data = self._table + max_topics * ENTRY_SIZE
+        self._stride = capacity * self.row_bytes + (-capacity * 4) % 8
+        size = self._data + max_topics * self._stride
+        self.shm = _open(f"{name}-history", size, create)
+        self.buf = self.shm.buf
+        magic, layout, nf, cap, tmax, _ = _HDR.unpack_from(self.buf, 0)
+        if (magic, layout, nf, cap, tmax) != (MAGIC, LAYOUT, len(self.fields), capacity, max_topics):
+            if not create:
+                raise RuntimeError(f"shared history {name} has a different layout")
+            self.buf[:self._data] = bytes(self._data)
+            _HDR.pack_into(self.buf, 0, MAGIC, LAYOUT, len(self.fields), capacity, max_topics, 0)
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self.full_dropped = 0
+        self._sync_names()
+
+    # ---- layout ----
+
+    def _ntopics(self) -> int:
+        return _HDR.unpack_from(self.buf, 0)[5]
+
+    def _entry(self, i: int) -> int:
+        return self._table + i * ENTRY_SIZE
+
+    def _cols(self, i: int) -> Tuple[int, int, List[int]]:
+        # Byte offsets of the ts, size and field columns of topic i.
+        base = self._data + i * self._stride
+        size = base + self.capacity * 8
+        first = size + self.capacity * 4 + (-self.capacity * 4) % 8
+        return base, size, [first + k * self.capacity * 8 for k in range(len(self.fields))]
+
+    def _sync_names(self):
+        # Pick up topics the writer has added since the last call.
+        n = self._ntopics()
+        for i in range(len(self._names), n):
+            off = self._entry(i) + _ENTRY.size
+            ln = struct.unpack_from("<H", self.buf, off)[0]
+            name = bytes(self.buf[off + 2:off + 2 + ln]).decode("utf-8")
+            self._ids[name] = i
+            self._names.append(name)
+
+    def _id(self, topic: str) -> Optional[int]:
+        i = self._ids.get(topic)
+        if i is None:
+            self._sync_names()
+            i = self._ids.get(topic)
+        return i
+
+    # ---- writer ----
+
+    def append(self, topic: str, ts: int, size: int, values: Dict[str, float]):
+        i = self._ids.get(topic)
+        if i is None:
+            i = self._add_topic(topic)
+            if i is None:
+                return
+        e = self._entry(i)
+        seq, appended, head, n = _ENTRY.unpack_from(self.buf, e)
+        struct.pack_into("<Q", self.buf, e, seq + 1)          # odd: write in progress
+        if n < self.capacity:
+            slot = n
+            n += 1
+        else:
+            slot = head
+            head = (head + 1) % self.capacity
+        t_off, s_off, f_offs = self._cols(i)
+        struct.pack_into("<q", self.buf, t_off + slot * 8, ts)
+        struct.pack_into("<I", self.buf, s_off + slot * 4, size)
+        nan = float("nan")
+        for f, off in zip(self.fields, f_offs):
+            struct.pack_into("<d", self.buf, off + slot * 8, values.get(f, nan))
+        _ENTRY.pack_into(self.buf, e, seq + 2, appended + 1, head, n)
+
+    def _add_topic(self, topic: str) -> Optional[int]:
+        i = self._ntopics()
+        name = topic.encode("utf-8")
+        if i >= self.max_topics or len(name) > NAME_MAX:
+            self.full_dropped += 1
+            if self.full_dropped == 1:
+                print(f"[SHM] history table full ({self.max_topics} topics) or topic name too long; "
+                      f"'{topic}' and later ones are not kept in shared history")
+            return None
+        e = self._entry(i)
+        _ENTRY.pack_into(self.buf, e, 0, 0, 0, 0)
+        struct.pack_into("<H", self.buf, e + _ENTRY.size, len(name))
+        self.buf[e + _ENTRY.size + 2:e + _ENTRY.size + 2 + len(name)] = name
+        struct.pack_into("<I", self.buf, 16, i + 1)          # publish the entry last
+        self._ids[topic] = i
+        self._names.append(topic)
+        return i
+
+    # ---- readers (HistoryStore interface) ----
+
+    def __contains__(self, topic: str) -> bool:
+        return self._id(topic) is not None
+
+    def __len__(self) -> int:
+        return self._ntopics()
+
+    def topics(self) -> List[str]:
+        self._sync_names()
+        return list(self._names)
+
+    def _state(self, i: int) -> Tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self.buf, self._entry(i))
+
+    def generation(self, topic: str) -> int:
+        i = self._id(topic)
+        return self._state(i)[1] if i is not None else 0
+
+    def appended(self) -> List[int]:
+        # Appended counter of every topic, in table order (for delta polling).
+        return [self._state(i)[1] for i in range(self._ntopics())]
+
+    def wrapped(self, topic: str) -> bool:
+        i = self._id(topic)
+        return i is not None and self._state(i)[3] >= self.capacity
+
+    def oldest(self, topic: str) -> Optional[int]:
+        i = self._id(topic)
+        if i is None:
+            return None
+        _, _, head, n = self._state(i)
+        if not n:
+            return None
+        return struct.unpack_from("<q", self.buf, self._cols(i)[0] + head * 8)[0]
+
+    def tail(self, topic: str, n: int) -> Optional[Dict[str, array]]:
+        return self.window(topic, n=n)
+
+    def _bisect(self, t_off: int, head: int, n: int, t: float, right: bool = False) -> int:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            v = struct.unpack_from("<q", self.buf, t_off + ((head + mid) % self.capacity) * 8)[0]
+            if v < t or (right and v == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _take(self, typecode: str, off: int, width: int, head: int, start: int, stop: int) -> array:
+        out = array(typecode)
+        count = stop - start
+        p = (head + start) % self.capacity
+        first = min(count, self.capacity - p)
+        out.frombytes(self.buf[off + p * width:off + (p + first) * width])
+        if count > first:
+            out.frombytes(self.buf[off:off + (count - first) * width])
+        return out
+
+    def window(self, topic: str, since: Optional[float] = None, until: Optional[float] = None,
+               n: Optional[int] = None) -> Optional[Dict[str, array]]:
+        i = self._id(topic)
+        if i is None:
+            return None
+        t_off, s_off, f_offs = self._cols(i)
+        for _ in range(100):
+            seq, _, head, count = self._state(i)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            if not count:
+                return None
+            start = self._bisect(t_off, head, count, since) if since is not None else 0
+            stop = self._bisect(t_off, head, count, until, right=True) if until is not None else count
+            stop = max(start, stop)
+            if n is not None:
+                start = max(start, stop - n)
+            cols = {"ts": self._take("q", t_off, 8, head, start, stop),
+                    "size_bytes": self._take("I", s_off, 4, head, start, stop)}
+            for f, off in zip(self.fields, f_offs):
+                cols[f] = self._take("d", off, 8, head, start, stop)
+            if self._state(i)[0] == seq:
+                return cols
+        return None
+
+    def memory_report(self) -> Dict[str, Any]:
+        n = self._ntopics()
+        points = sum(self._state(i)[3] for i in range(n))
+        return {
+            "topics": n,
+            "points": points,
+            "capacity_per_topic": self.capacity,
+            "fields": list(self.fields),
+            "bytes_per_point": self.row_bytes,
+            "bytes_allocated": self._data + n * self._stride,
+            "bytes_at_capacity": n * self.capacity * self.row_bytes,
+            "shared_segment": self.shm.name,
+            "shared_bytes": self.shm.size,
+            "max_topics": self.max_topics,
+        }
+
+
+class SharedBlob:
+
+    def __init__(self, name: str, half_bytes: int, create: bool = False):
+        self.half = half_bytes
+        self.shm = _open(name, _BLOB.size + 2 * half_bytes, create)
+        self.buf = self.shm.buf
+        magic, layout, _, _, _, half, _, _ = _BLOB.unpack_from(self.buf, 0)
+        if (magic, layout, half) != (MAGIC, LAYOUT, half_bytes):
+            if not create:
+                raise RuntimeError(f"shared blob {name} has a different layout")
+            _BLOB.pack_into(self.buf, 0, MAGIC, LAYOUT, 0, 0, 0, half_bytes, 0, 0)
+        self.too_big = 0
+
+    def version(self) -> int:
+        return struct.unpack_from("<Q", self.buf, 8)[0]
+
+    def write(self, data: bytes) -> bool:
+        if len(data) > self.half:
+            self.too_big += 1
+            if self.too_big == 1:
+                print(f"[SHM] {self.shm.name}: {len(data)} bytes do not fit in {self.half}; "
+                      f"raise the segment size")
+            return False
+        _, _, _, version, active, _, len0, len1 = _BLOB.unpack_from(self.buf, 0)
+        idle = 1 - active
+        off = _BLOB.size + idle * self.half
+        self.buf[off:off + len(data)] = data
+        lens = [len0, len1]
+        lens[idle] = len(data)
+        struct.pack_into("<II", self.buf, 24, *lens)
+        struct.pack_into("<I", self.buf, 16, idle)
+        struct.pack_into("<Q", self.buf, 8, version + 1)
+        return True
+
+    def read(self) -> Tuple[int, bytes]:
+        for _ in range(100):
+            _, _, _, version, active, _, len0, len1 = _BLOB.unpack_from(self.buf, 0)
+            n = len1 if active else len0
+            off = _BLOB.size + active * self.half
+            data = bytes(self.buf[off:off + n])
+            if self.version() == version:
+                return version, data
+        return self.version(), b""
+
+
+class WorkerSlots:
+    # Slot i is the blob <name>-w<i>, owned by whichever live process holds the
+    # flock on <name>-w<i>.lock. Slots are claimed lowest first, so the lock
+    # files form a prefix; a slot whose lock can be taken is stale and skipped.
+
+    def __init__(self, name: str, half_bytes: int = 256 << 10, max_slots: int = 64):
+        self.name = name
+        self.half = half_bytes
+        self.max_slots = max_slots
+        self.index: Optional[int] = None
+        self.blob: Optional[SharedBlob] = None
+        self._lock = None
+        self._peers: Dict[int, SharedBlob] = {}
+
+    def claim(self) -> int:
+        for i in range(self.max_slots):
+            lock = elect_writer(f"{self.name}-w{i}")
+            if lock is not None:
+                self._lock, self.index = lock, i
+                self.blob = SharedBlob(f"{self.name}-w{i}", self.half, create=True)
+                self.blob.write(b"")
+                return i
+        raise RuntimeError(f"all {self.max_slots} worker slots of {self.name} are taken")
+
+    def write(self, data: bytes) -> bool:
+        return self.blob.write(data) if self.blob is not None else False
+
+    def others(self) -> Iterator[bytes]:
+        # What every other live worker last wrote (empty slots are skipped).
+        for i in range(self.max_slots):
+            if i == self.index:
+                continue
+            if not os.path.exists(_lock_path(f"{self.name}-w{i}")):
+                break
+            probe = elect_writer(f"{self.name}-w{i}")
+            if probe is not None:           # nobody holds it: the worker is gone
+                probe.close()
+                continue
+            blob = self._peers.get(i)
+            try:
+                if blob is None or replaced(blob.shm):
+                    blob = self._peers[i] = SharedBlob(f"{self.name}-w{i}", self.half)
+            except (FileNotFoundError, RuntimeError):
+                continue                    # claimed, blob not created yet
+            data = blob.read()[1]
+            if data:
+                yield data
+
+    def close(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+def encode_latest(state: LatestState) -> bytes:
+    # Writer side: the current snapshot body, its ETag and the offset of every fragment.
+    snap = state.snapshot()
+    frags = state.fragments(snap.data.items())
+    index = bytearray()
+    off = 1
+    for frag, split in frags:
+        index += _IDX.pack(off, len(frag), split)
+        off += len(frag) + 1
+    body = b"{" + b",".join(f for f, _ in frags) + b"}"
+    e = snap.etag.encode()
+    return struct.pack("<HI", len(e), len(frags)) + e + bytes(index) + body
+
+
+class _Rows(Mapping):
+    # Read-only {topic: row} over a latest blob; a row is parsed on first access.
+
+    def __init__(self, snap: "_SharedSnapshot"):
+        self._snap = snap
+        self._rows: Dict[str, Any] = {}
+
+    def __getitem__(self, topic: str) -> Any:
+        row = self._rows.get(topic)
+        if row is None:
+            row = self._rows[topic] = loads(self._snap.row(topic))
+        return row
+
+    def __contains__(self, topic: object) -> bool:
+        return topic in self._snap.spans
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snap.spans)
+
+    def __len__(self) -> int:
+        return len(self._snap.spans)
+
+
+class _SharedSnapshot:
+    # Snapshot interface over one decoded latest blob.
+
+    def __init__(self, version: int, etag: str, body: bytes, spans: Dict[str, Tuple[int, int, int]]):
+        self.version = version
+        self.etag = etag
+        self._body = body
+        self.spans = spans
+        self.data = _Rows(self)
+        self._gzip = None
+
+    def fragment(self, topic: str) -> bytes:
+        off, ln, _ = self.spans[topic]
+        return self._body[off:off + ln]
+
+    def row(self, topic: str) -> bytes:
+        off, ln, split = self.spans[topic]
+        return self._body[off + split:off + ln]
+
+    def body(self) -> bytes:
+        return self._body
+
+    def body_gzip(self) -> bytes:
+        if self._gzip is None:
+            self._gzip = gzip_body(self._body)
+        return self._gzip
+
+
+class SharedLatestView:
+    # Reader-side stand-in for LatestState: snapshot(), row_json(), compose().
+
+    def __init__(self, blob: SharedBlob):
+        self.blob = blob
+        self._keys: Dict[bytes, str] = {}
+        self._snap = _SharedSnapshot(0, '"shm-0"', b"{}", {})
+
+    def refresh(self) -> Optional[Tuple[_SharedSnapshot, _SharedSnapshot]]:
+        # Load a newer blob if there is one; returns (previous, current) when it changed.
+        if self.blob.version() == self._snap.version:
+            return None
+        version, data = self.blob.read()
+        if not data or version == self._snap.version:
+            return None
+        elen, n = struct.unpack_from("<HI", data, 0)
+        etag = data[6:6 + elen].decode()
+        base = 6 + elen + n * _IDX.size
+        body = data[base:]
+        spans = {}
+        for k in range(n):
+            off, ln, split = _IDX.unpack_from(data, 6 + elen + k * _IDX.size)
+            key = body[off:off + split - 1]
+            topic = self._keys.get(key)
+            if topic is None:
+                topic = self._keys[key] = loads(key)
+            spans[topic] = (off, ln, split)
+        prev, self._snap = self._snap, _SharedSnapshot(version, etag, body, spans)
+        return prev, self._snap
+
+    def snapshot(self) -> _SharedSnapshot:
+        return self._snap
+
+    def row_json(self, topic: str, row: Any = None) -> bytes:
+        return self._snap.row(topic)
+
+    def compose(self, items: Iterable[Tuple[str, Any]]) -> bytes:
+        snap = self._snap
+        return b"{" + b",".join(snap.fragment(t) for t, _ in items if t in snap.spans) + b"}"
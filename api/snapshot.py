@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Versioned copy-on-write view of the latest row per topic.
+#
+# The ingest worker is the only writer: it updates a private working dict and,
+# after a batch, publishes an immutable Snapshot with the next version number.
+# Each publish copies the whole map, so with min_interval set a batch only
+# publishes once that many seconds have passed since the last one; the worker
+# forces the pending changes out when it goes idle. Publishing is a single
+# attribute assignment, so HTTP readers grab the current snapshot without
+# taking a lock and always see one consistent version. Each
+# snapshot lazily caches its serialized JSON body, so repeated polls of an
+# unchanged map cost one dict lookup and a bytes copy (or a 304).
+#
+# The body is composed from per-topic '"topic":{row}' fragments cached on the
+# state and keyed by row identity, so a new version only re-serializes the
+# topics whose rows changed since the fragment was last built.
+#
+# save()/load() keep the map in a local snapshot file for warm starts: a
+# header, then per topic its length-prefixed '"topic":{row}' fragment. It is
+# written to a temp file and renamed over the old one, so a crash mid-write
+# leaves the previous snapshot intact. Loading joins the fragments and parses
+# them in a single call.
+from __future__ import annotations
+import json, os, struct, time
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from api.responses import dumps, gzip_body, orjson
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+Row = Dict[str, Any]
+FILE_MAGIC = b"PQLS"
+_FILE_HDR = struct.Struct("<4sHId")       # magic, layout, topics, saved at (epoch s)
+_FRAG = struct.Struct("<I")
+
+
+class Snapshot:
+    __slots__ = ("version", "data", "etag", "_state", "_body", "_gzip")
+
+    def __init__(self, version: int, data: Mapping[str, Row], epoch: str, state: "LatestState"):
+        self.version = version
+        self.data = data
+        self.etag = f'"{epoch}-{version}"'
+        self._state = state
+        self._body: Optional[bytes] = None
+        self._gzip: Optional[bytes] = None
+
+    def body(self) -> bytes:
+        # Two readers racing here both compute the same bytes; that is harmless.
+        if self._body is None:
+            self._body = self._state.compose(self.data.items())
+        return self._body
+
+    def body_gzip(self) -> bytes:
+        if self._gzip is None:
+            self._gzip = gzip_body(self.body())
+        return self._gzip
+
+
+class LatestState:
+
+    def __init__(self, min_interval: float = 0.0):
+        # Epoch keeps ETags from colliding across restarts.
+        self._epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self._work: Dict[str, Row] = {}
+        self._dirty = False
+        self.min_interval = min_interval
+        self._next_publish = 0.0
+        self._frags: Dict[str, Tuple[Row, bytes, int]] = {}
+        self._snap = Snapshot(0, MappingProxyType({}), self._epoch, self)
+
+    # ---- writer (ingest worker) ----
+
+    def set(self, topic: str, row: Row):
+        # Rows are replaced, never mutated, so published snapshots can share them.
+        self._work[topic] = row
+        self._dirty = True
+
+    def update(self, rows: Mapping[str, Row]):
+        self._work.update(rows)
+        self._dirty = True
+
+    def get(self, topic: str) -> Optional[Row]:
+        # Working (not yet published) row; ingest worker only.
+        return self._work.get(topic)
+
+    def publish(self, force: bool = False) -> Snapshot:
+        # Throttled to one copy per min_interval unless forced.
+        if self._dirty and (force or time.monotonic() >= self._next_publish):
+            self._dirty = False
+            self._next_publish = time.monotonic() + self.min_interval
+            self._snap = Snapshot(self._snap.version + 1,
+                                  MappingProxyType(dict(self._work)), self._epoch, self)
+        return self._snap
+
+    # ---- serialized fragments (any thread) ----
+
+    def _fragment(self, topic: str, row: Row) -> Tuple[Row, bytes, int]:
+        hit = self._frags.get(topic)
+        if hit is None or hit[0] is not row:
+            key = dumps(topic) + b":"
+            hit = self._frags[topic] = (row, key + dumps(row), len(key))
+        return hit
+
+    def row_json(self, topic: str, row: Row) -> bytes:
+        # One row as JSON bytes, shared with the map fragments.
+        _, frag, split = self._fragment(topic, row)
+        return frag[split:]
+
+    def fragments(self, items: Iterable[Tuple[str, Row]]) -> List[Tuple[bytes, int]]:
+        # ('"topic":{row}', offset of the row) per item, for the shared-memory export.
+        return [self._fragment(t, r)[1:] for t, r in items]
+
+    def compose(self, items: Iterable[Tuple[str, Row]]) -> bytes:
+        # {"topic": row, ...} for the given rows, from cached fragments.
+        return b"{" + b",".join(self._fragment(t, r)[1] for t, r in items) + b"}"
+
+    # ---- readers ----
+
+    def snapshot(self) -> Snapshot:
+        return self._snap
+
+
+def save(state: LatestState, path: str) -> int:
+    # Write the published snapshot to `path` atomically; returns the file size.
+    snap = state.snapshot()
+    frags = state.fragments(snap.data.items())
+    parts = [_FILE_HDR.pack(FILE_MAGIC, 1, len(frags), time.time())]
+    for frag, _ in frags:
+        parts.append(_FRAG.pack(len(frag)))
+        parts.append(frag)
+    data = b"".join(parts)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+
+def load(path: str) -> Tuple[Dict[str, Row], float]:
+    # ({topic: row}, saved at) from a snapshot file; ({}, 0) if missing or unreadable.
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, layout, n, saved = _FILE_HDR.unpack_from(data, 0)
+        if magic != FILE_MAGIC or layout != 1:
+            raise ValueError("not a latest snapshot file")
+        frags, off = [], _FILE_HDR.size
+        for _ in range(n):
+            ln = _FRAG.unpack_from(data, off)[0]
+            off += _FRAG.size
+            frags.append(data[off:off + ln])
+            off += ln
+        if off != len(data):
+            raise ValueError("truncated snapshot file")
+        return _loads(b"{" + b",".join(frags) + b"}"), saved
+    except FileNotFoundError:
+        return {}, 0.0
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[WARM] ignoring snapshot {path}: {e}")
+        return {}, 0.0
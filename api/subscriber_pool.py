@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# Pool of MQTT subscriber connections feeding one ingest pipeline.
+#
+# For every broker the pool opens `connections` paho clients with a unique
+# client id (<base>-<host>-<pid>-<n>), so two API instances never kick each
+# other off the broker. Topic filters are either partitioned round-robin
+# across the connections, or, with a shared group, every connection
+# subscribes to $share/<group>/<filter> and the broker load-balances
+# messages across all members (including other API replicas).
+#
+# The clients run on the caller's asyncio loop instead of paho threads: the
+# socket is registered with loop.add_reader/add_writer and paho's
+# loop_read/loop_write/loop_misc are driven from there. Only the blocking
+# connect (DNS, TCP, TLS handshake) runs in the default executor. Each
+# connection is a task that reconnects with bounded exponential backoff.
+# When `accept()` says the ingest queue is full, reads are paused so TCP
+# flow control pushes back on the broker instead of blocking the loop.
+from __future__ import annotations
+import asyncio, os, socket, ssl, threading
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+import paho.mqtt.client as mqtt
+
+
+def parse_brokers(spec: str, default_port: int) -> List[Tuple[str, int]]:
+    # "host[:port],host2[:port]" -> [(host, port), ...]
+    out = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        out.append((host, int(port) if port else default_port))
+    return out
+
+
+class _Conn:
+
+    def __init__(self, pool: "SubscriberPool", broker: Tuple[str, int], client_id: str,
+                 filters: List[str]):
+        self.pool = pool
+        self.broker = broker
+        self.client_id = client_id
+        self.filters = filters
+        self.connected = False
+        self.connects = 0
+        self.messages = 0
+        self.paused = 0
+        self.backoff = pool.min_backoff
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self._closed: Optional[asyncio.Event] = None
+        self._sock = None
+        self._reading = False
+        self._stopping = False
+        kw = {"clean_session": True} if pool.protocol != mqtt.MQTTv5 else {}
+        self.client = mqtt.Client(client_id=client_id, protocol=pool.protocol, **kw)
+        if pool.tls_context is not None:
+            self.client.tls_set_context(pool.tls_context)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_register_write
+        self.client.on_socket_unregister_write = self._on_unregister_write
+
+    # ---- paho callbacks (socket ones may fire on the executor thread during connect) ----
+
+    def _on_loop(self, fn, *args):
+        if threading.get_ident() == self.pool.loop_thread:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop(self._attach, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop(self._detach, sock)
+
+    def _on_register_write(self, client, userdata, sock):
+        self._on_loop(self._want_write, sock, True)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self._on_loop(self._want_write, sock, False)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            print(f"[MQTT] {self.client_id} connect failed rc={rc}")
+            return
+        self.connected = True
+        self.connects += 1
+        self.backoff = self.pool.min_backoff
+        subs = [(self.pool.subscription(f), self.pool.qos) for f in self.filters]
+        if subs:
+            client.subscribe(subs)
+        print(f"[MQTT] {self.client_id} connected to {self.broker[0]}:{self.broker[1]}, "
+              f"subscribed to: {', '.join(s for s, _ in subs)}")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected = False
+
+    def _on_message(self, client, userdata, msg):
+        self.messages += 1
+        self.pool.on_message(client, userdata, msg)
+
+    # ---- socket registration (loop thread only) ----
+
+    def _attach(self, sock):
+        self._sock = sock
+        self._reading = False
+        if self._stopping:
+            self.client.disconnect()    # connect finished after stop(): close it cleanly
+            return
+        self._resume()
+
+    def _detach(self, sock):
+        if self._sock is sock:
+            self._pause_reads()
+            try:
+                self.loop.remove_writer(sock)
+            except (ValueError, OSError):
+                pass
+            self._sock = None
+        if self._closed is not None:
+            self._closed.set()
+
+    def _want_write(self, sock, on: bool):
+        if sock is not self._sock:
+            return
+        if on:
+            self.loop.add_writer(sock, self.client.loop_write)
+        else:
+            self.loop.remove_writer(sock)
+
+    def _pause_reads(self):
+        if self._reading and self._sock is not None:
+            try:
+                self.loop.remove_reader(self._sock)
+            except (ValueError, OSError):
+                pass
+        self._reading = False
+
+    def _resume(self):
+        if self._sock is None or self._reading:
+            return
+        if not self.pool.accept():
+            self.loop.call_later(0.01, self._resume)
+            return
+        self.loop.add_reader(self._sock, self._readable)
+        self._reading = True
+
+    def _readable(self):
+        if not self.pool.accept():
+            # Ingest queue full: stop reading until it has room again.
+            self.paused += 1
+            self._pause_reads()
+            self.loop.call_later(0.01, self._resume)
+            return
+        rc = self.client.loop_read()
+        # TLS records already decrypted into the SSL buffer do not wake the selector
+        sock = self._sock
+        while rc == mqtt.MQTT_ERR_SUCCESS and sock is not None and sock is self._sock \
+                and getattr(sock, "pending", None) and sock.pending():
+            rc = self.client.loop_read()
+
+    # ---- lifecycle ----
+
+    async def run(self):
+        host, port = self.broker
+        while not self._stopping:
+            self._closed = asyncio.Event()
+            try:
+                await self.loop.run_in_executor(
+                    None, lambda: self.client.connect(host, port, keepalive=self.pool.keepalive))
+            except Exception as e:
+                print(f"[MQTT] {self.client_id} connect to {host}:{port} failed: {e}; "
+                      f"retry in {self.backoff:g} s")
+                await self._sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, self.pool.max_backoff)
+                continue
+            # Connected socket: keepalive/ping handling until it closes
+            while not self._closed.is_set():
+                if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                    break
+                try:
+                    await asyncio.wait_for(self._closed.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+            self.connected = False
+            if not self._stopping:
+                print(f"[MQTT] {self.client_id} connection lost; reconnect in {self.backoff:g} s")
+                await self._sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, self.pool.max_backoff)
+
+    async def _sleep(self, seconds: float):
+        # Backoff that ends early when the pool is stopping.
+        end = self.loop.time() + seconds
+        while not self._stopping and self.loop.time() < end:
+            await asyncio.sleep(min(0.25, end - self.loop.time()))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.task = loop.create_task(self.run(), name=f"mqtt-{self.client_id}")
+
+    async def stop(self, timeout: float = 2.0):
+        # Send DISCONNECT, wait for the socket to close, then end the reconnect task.
+        self._stopping = True
+        self._pause_reads()
+        if self._sock is not None and self._closed is not None:
+            self.client.disconnect()
+            try:
+                await asyncio.wait_for(self._closed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+class SubscriberPool:
+
+    def __init__(self, brokers: List[Tuple[str, int]], filters: List[str],
+                 on_message: Callable, tls_context: Optional[ssl.SSLContext] = None,
+                 connections: int = 1, client_id: str = "api-subscriber",
+                 shared_group: str = "", protocol: int = mqtt.MQTTv311,
+                 qos: int = 0, keepalive: int = 60,
+                 accept: Optional[Callable[[], bool]] = None,
+                 min_backoff: float = 1.0, max_backoff: float = 30.0):
+        self.on_message = on_message
+        self.accept = accept or (lambda: True)
+        self.tls_context = tls_context
+        self.shared_group = shared_group
+        self.protocol = protocol
+        self.qos = qos
+        self.keepalive = keepalive
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.filters = filters
+        self.loop_thread: Optional[int] = None
+        self.conns: List[_Conn] = []
+
+        connections = max(1, connections)
+        if not shared_group and connections > len(filters):
+            print(f"[MQTT] {connections} connections but only {len(filters)} filter(s); "
+                  f"set API_MQTT_SHARED_GROUP to spread one filter across connections")
+            connections = len(filters)
+        base = f"{client_id}-{socket.gethostname()}-{os.getpid()}"
+        n = 0
+        for broker in brokers:
+            for i in range(connections):
+                part = filters if shared_group else filters[i::connections]
+                self.conns.append(_Conn(self, broker, f"{base}-{n}", part))
+                n += 1
+
+    def subscription(self, flt: str) -> str:
+        return f"$share/{self.shared_group}/{flt}" if self.shared_group else flt
+
+    async def start(self):
+        # Must be awaited on the loop that will own the sockets.
+        loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        for c in self.conns:
+            c.start(loop)
+
+    async def stop(self, timeout: float = 2.0):
+        await asyncio.gather(*(c.stop(timeout) for c in self.conns), return_exceptions=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [{
+            "client_id": c.client_id,
+            "broker": f"{c.broker[0]}:{c.broker[1]}",
+            "filters": [self.subscription(f) for f in c.filters],
+            "connected": c.connected,
+            "connects": c.connects,
+            "messages": c.messages,
+            "read_pauses": c.paused,
+            "backoff_s": c.backoff,
+        } for c in self.conns]
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# Append-only, segment-based telemetry log for the API.
+#
+# Layout of the log directory:
+#   topics.jsonl        one JSON string per line; line number = topic id
+#   seg-00000001.log    16-byte header + fixed-width records, oldest first
+#
+# A record is <topic_id:u32><ts:i64><size_bytes:u32><field:f64>... in the same
+# field order as the history store, with NaN for missing readings. Writes go
+# through a buffered file and are fsynced at most once per fsync interval.
+# When a segment reaches its size cap a new one is started and the oldest
+# segments beyond the retention count are deleted. Reads mmap the segments
+# and unpack records in place.
+#
+# A sealed segment gets a seg-NNNNNNNN.idx next to it: for every topic id the
+# positions of its records in the segment and the last one, so a topic's
+# window and the newest row per topic (restore_latest) unpack only the
+# records they return instead of walking every segment. The writer keeps the
+# same index in memory for the segment it is appending to; a missing or stale
+# index (a crash before sealing, an older log) is rebuilt on first read and
+# saved by the writer. With readonly=True (the HTTP workers of a
+# multi-process API) nothing is written and new topics are picked up from
+# topics.jsonl on each read; records show up once the writer has flushed them.
+from __future__ import annotations
+import json, mmap, os, struct, threading, time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
+
+from api.history_store import FIELDS
+
+MAGIC = b"PQTL"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+IDX_MAGIC = b"PQTI"
+IDX_HEAD = struct.Struct("<4sHxxII")      # magic, version, records in the segment, topics
+IDX_ENTRY = struct.Struct("<IIII")        # topic id, records, offset of its positions, last position
+
+
+class TelemetryLog:
+
+    def __init__(self, directory: str, fields: Iterable[str] = FIELDS,
+                 segment_bytes: int = 8 << 20, retention_segments: int = 16,
+                 fsync_interval: float = 1.0, readonly: bool = False):
+        self.dir = Path(directory)
+        self.readonly = readonly
+        if not readonly:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        self.fields = tuple(fields)
+        self.rec = struct.Struct("<IqI" + "d" * len(self.fields))
+        self._tid = struct.Struct(f"<I{self.rec.size - 4}x")   # topic id column only
+        self.segment_bytes = segment_bytes
+        self.retention = max(1, retention_segments)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._path: Optional[Path] = None
+        self._pos: Dict[int, array] = {}          # active segment: topic id -> record positions
+        self._nrec = 0
+        self._idx_cache: Dict[str, Tuple[int, Dict[int, Tuple[int, int, int]], Optional[Dict[int, array]]]] = {}
+
+        # Topic dictionary
+        self._topic_ids: Dict[str, int] = {}
+        self._topics: List[str] = []
+        self._tpos = 0
+        self._load_topics()
+        if readonly:
+            return
+        self._tfile = open(self.dir / "topics.jsonl", "a", encoding="utf-8")
+
+        # Always start a fresh segment so a torn tail from a crash is never appended to.
+        segs = self._segments()
+        self._seq = int(segs[-1].stem.split("-")[1]) + 1 if segs else 1
+        self._open_segment()
+
+    def _load_topics(self):
+        # Read topic lines appended since the last call (complete lines only).
+        tpath = self.dir / "topics.jsonl"
+        try:
+            with open(tpath, "rb") as f:
+                f.seek(self._tpos)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                topic = json.loads(line)
+                self._topic_ids[topic] = len(self._topics)
+                self._topics.append(topic)
+        self._tpos += end
+
+    # ---- write path ----
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.dir.glob("seg-*.log"))
+
+    def _open_segment(self):
+        self._path = self.dir / f"seg-{self._seq:08d}.log"
+        self._f = open(self._path, "ab")
+        self._f.write(HEADER.pack(MAGIC, VERSION, len(self.fields)))
+        self._size = HEADER.size
+        self._pos = {}
+        self._nrec = 0
+
+    def _rotate(self):
+        self._f.flush(); os.fsync(self._f.fileno()); self._f.close()
+        self._write_index(self._path, self._nrec, self._pos)
+        self._seq += 1
+        self._open_segment()
+        for old in self._segments()[:-self.retention]:
+            for p in (old, old.with_suffix(".idx")):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+
+    def _topic_id(self, topic: str) -> int:
+        tid = self._topic_ids.get(topic)
+        if tid is None:
+            tid = self._topic_ids[topic] = len(self._topics)
+            self._topics.append(topic)
+            self._tfile.write(json.dumps(topic) + "\n")
+            self._tfile.flush()
+            os.fsync(self._tfile.fileno())     # rare; records are useless without their topic
+        return tid
+
+    def append(self, topic: str, ts: int, size: int, values: Dict[str, float]):
+        nan = float("nan")
+        with self._lock:
+            tid = self._topic_id(topic)
+            rec = self.rec.pack(tid, ts, size, *[values.get(f, nan) for f in self.fields])
+            self._f.write(rec)
+            self._size += len(rec)
+            pos = self._pos.get(tid)
+            if pos is None:
+                pos = self._pos[tid] = array("I")
+            pos.append(self._nrec)
+            self._nrec += 1
+            self._dirty = True
+            if self._size >= self.segment_bytes:
+                self._rotate()
+                self._dirty = False
+                self._last_sync = time.monotonic()
+            elif time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        if self.readonly:
+            return
+        with self._lock:
+            if self._dirty:
+                self._sync_locked()
+
+    def close(self):
+        if self.readonly:
+            return
+        with self._lock:
+            self._sync_locked()
+            self._f.close()
+            self._tfile.close()
+            self._write_index(self._path, self._nrec, self._pos)
+
+    # ---- read path ----
+
+    def _mapped(self) -> List[Tuple[Path, mmap.mmap, int]]:
+        # (path, mmap, record count) for every readable segment, oldest first.
+        with self._lock:
+            if self.readonly:
+                self._load_topics()
+            else:
+                self._f.flush()
+            paths = self._segments()
+        names = {p.name for p in paths}
+        for key in [k for k in self._idx_cache if k not in names]:
+            self._idx_cache.pop(key, None)
+        out = []
+        for p in paths:
+            seg = self._map(p)
+            if seg is not None:
+                out.append((p,) + seg)
+        return out
+
+    def _map(self, path: Path) -> Optional[Tuple[mmap.mmap, int]]:
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size + self.rec.size:
+                    return None
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None     # deleted by retention in the meantime
+        magic, ver, nf = HEADER.unpack_from(m, 0)
+        if magic != MAGIC or ver != VERSION or nf != len(self.fields):
+            m.close()
+            return None
+        return m, (size - HEADER.size) // self.rec.size
+
+    # ---- per-segment topic index ----
+
+    def _write_index(self, seg: Path, count: int, pos: Dict[int, array]):
+        # seg-N.idx: header, one entry per topic id, then the position arrays.
+        if not count:
+            return
+        tids = sorted(pos)
+        off = IDX_HEAD.size + len(tids) * IDX_ENTRY.size
+        head, body = [IDX_HEAD.pack(IDX_MAGIC, VERSION, count, len(tids))], []
+        for tid in tids:
+            a = pos[tid]
+            head.append(IDX_ENTRY.pack(tid, len(a), off, a[-1]))
+            body.append(a.tobytes())
+            off += len(a) * a.itemsize
+        tmp = seg.with_name(f"{seg.stem}.idx.{os.getpid()}")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(b"".join(head + body))
+            os.replace(tmp, seg.with_suffix(".idx"))
+        except OSError as e:
+            print(f"[LOG] writing {seg.stem}.idx failed: {e}")
+
+    def _read_index(self, seg: Path, count: int) -> Optional[Dict[int, Tuple[int, int, int]]]:
+        # {topic id: (records, offset of positions, last position)}, None if missing or stale.
+        try:
+            with open(seg.with_suffix(".idx"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < IDX_HEAD.size:
+            return None
+        magic, ver, n, ntopics = IDX_HEAD.unpack_from(data, 0)
+        end = IDX_HEAD.size + ntopics * IDX_ENTRY.size
+        if magic != IDX_MAGIC or ver != VERSION or n != count or len(data) < end:
+            return None
+        table = {tid: (k, off, last) for tid, k, off, last in IDX_ENTRY.iter_unpack(data[IDX_HEAD.size:end])}
+        if len(data) != end + 4 * sum(k for k, _, _ in table.values()):
+            return None             # torn write
+        return table
+
+    def _build_index(self, m: mmap.mmap, count: int) -> Dict[int, array]:
+        pos: Dict[int, array] = {}
+        with memoryview(m) as mv, mv[HEADER.size:HEADER.size + count * self.rec.size] as view:
+            for i, (tid,) in enumerate(self._tid.iter_unpack(view)):
+                a = pos.get(tid)
+                if a is None:
+                    a = pos[tid] = array("I")
+                a.append(i)
+        return pos
+
+    def _index(self, seg: Path, m: mmap.mmap, count: int):
+        # (table, positions): the segment's index table, plus the position arrays
+        # when they are in memory (active or unsaved segment) rather than in seg-N.idx.
+        if seg == self._path:
+            with self._lock:
+                arrays = dict(self._pos)
+        else:
+            hit = self._idx_cache.get(seg.name)
+            if hit is not None and hit[0] == count:
+                return hit[1], hit[2]
+            table = self._read_index(seg, count)
+            arrays = None
+            if table is None:
+                arrays = self._build_index(m, count)
+                if not self.readonly:
+                    self._write_index(seg, count, arrays)
+                    table = self._read_index(seg, count)
+                    if table is not None:
+                        arrays = None
+        if arrays is not None:
+            # the writer may have appended past `count` since the segment was mapped
+            table = {}
+            for tid, a in arrays.items():
+                k = bisect_left(a, count)
+                if k:
+                    table[tid] = (k, 0, a[k - 1])
+        if seg != self._path:
+            self._idx_cache[seg.name] = (count, table, arrays)
+        return table, arrays
+
+    def _positions(self, seg: Path, table, arrays, tid: int) -> array:
+        if arrays is not None:
+            return arrays.get(tid, array("I"))
+        a = array("I")
+        ent = table.get(tid)
+        if ent is not None:
+            try:
+                with open(seg.with_suffix(".idx"), "rb") as f:
+                    a.frombytes(os.pread(f.fileno(), ent[0] * a.itemsize, ent[1]))
+            except OSError:
+                pass            # deleted by retention in the meantime
+        return a
+
+    def _ts_at(self, m: mmap.mmap, i: int) -> int:
+        return struct.unpack_from("<q", m, HEADER.size + i * self.rec.size + 4)[0]
+
+    def _bisect(self, m: mmap.mmap, count: int, t: float, right: bool = False) -> int:
+        # Records are appended in ingest order, so ts is non-decreasing per segment.
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            v = self._ts_at(m, mid)
+            if v < t or (right and v == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            if self.readonly:
+                self._load_topics()
+            return list(self._topics)
+
+    def window(self, topic: str, since: Optional[float] = None, until: Optional[float] = None,
+               n: Optional[int] = None) -> Optional[Dict[str, array]]:
+        # Same contract as HistoryStore.window, served from the mmapped segments.
+        with self._lock:
+            if self.readonly:
+                self._load_topics()
+            tid = self._topic_ids.get(topic)
+        if tid is None:
+            return None
+        segs = self._mapped()
+        chunks = []
+        have = 0
+        try:
+            # Newest segment first so a plain "last n" read stops early.
+            for seg, m, count in reversed(segs):
+                if since is not None and count and self._ts_at(m, count - 1) < since:
+                    break
+                if until is not None and count and self._ts_at(m, 0) > until:
+                    continue
+                a = self._bisect(m, count, since) if since is not None else 0
+                b = count if until is None else self._bisect(m, count, until, right=True)
+                if b <= a:
+                    continue
+                table, arrays = self._index(seg, m, count)
+                if tid not in table:
+                    continue
+                pos = self._positions(seg, table, arrays, tid)
+                i, j = bisect_left(pos, a), bisect_left(pos, b)
+                if n is not None and since is None:
+                    i = max(i, j - (n - have))
+                rows = [self.rec.unpack_from(m, HEADER.size + p * self.rec.size) for p in pos[i:j]]
+                chunks.append(rows)
+                have += len(rows)
+                if n is not None and since is None and have >= n:
+                    break
+        finally:
+            for _, m, _ in segs:
+                m.close()
+        rows = [r for chunk in reversed(chunks) for r in chunk]
+        if n is not None:
+            rows = rows[-n:]
+        cols = {"ts": array("q", (r[1] for r in rows)),
+                "size_bytes": array("I", (r[2] for r in rows))}
+        for k, f in enumerate(self.fields):
+            cols[f] = array("d", (r[3 + k] for r in rows))
+        return cols
+
+    def scan(self, topics: Iterable[str], since: Optional[float] = None,
+             until: Optional[float] = None,
+             chunk: int = 4096) -> Iterator[List[Tuple[Any, ...]]]:
+        # Every record of the given topics in [since, until], oldest first, as
+        # lists of (topic, ts, size_bytes, field...) tuples. At most one segment
+        # is mapped at a time and at most `chunk` records are unpacked per
+        # batch, so memory stays flat however much history the range covers.
+        with self._lock:
+            if self.readonly:
+                self._load_topics()
+            else:
+                self._f.flush()
+            names = {self._topic_ids[t]: t for t in topics if t in self._topic_ids}
+            paths = self._segments()
+        if not names:
+            return
+        step = chunk * self.rec.size
+        for p in paths:
+            seg = self._map(p)
+            if seg is None:
+                continue
+            m, count = seg
+            try:
+                if since is not None and self._ts_at(m, count - 1) < since:
+                    continue
+                if until is not None and self._ts_at(m, 0) > until:
+                    break
+                a = self._bisect(m, count, since) if since is not None else 0
+                b = count if until is None else self._bisect(m, count, until, right=True)
+                lo, hi = HEADER.size + a * self.rec.size, HEADER.size + b * self.rec.size
+                for off in range(lo, hi, step):
+                    with memoryview(m) as mv, mv[off:min(off + step, hi)] as view:
+                        rows = [(names[r[0]],) + r[1:] for r in self.rec.iter_unpack(view)
+                                if r[0] in names]
+                    if rows:
+                        yield rows
+            finally:
+                m.close()
+
+    def restore_latest(self) -> Dict[str, Dict[str, Any]]:
+        # The newest record of every topic, from the segment indexes newest
+        # segment first (one record unpacked per topic); LATEST-shaped rows.
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            topics = list(self._topics)
+        segs = self._mapped()
+        try:
+            for seg, m, count in reversed(segs):
+                table, _ = self._index(seg, m, count)
+                for tid, (_, _, last) in table.items():
+                    topic = topics[tid] if tid < len(topics) else None
+                    if topic is None or topic in found:
+                        continue
+                    r = self.rec.unpack_from(m, HEADER.size + last * self.rec.size)
+                    payload = {f: v for f, v in zip(self.fields, r[3:]) if v == v}
+                    found[topic] = {"topic": topic, "payload": payload,
+                                    "size_bytes": r[2], "ts": r[1], "restored": True}
+                if len(found) == len(topics):
+                    break
+        finally:
+            for _, m, _ in segs:
+                m.close()
+        return found
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# Topic trie for MQTT-style queries over the topics the API has seen.
+#
+# One node per topic level. Queries walk only the branches a filter can
+# match, in level-wise sorted order, so a "+"/"#" filter, a prefix listing or
+# one page of a cursor scan costs time proportional to what it returns (plus
+# the depth of the trie), not to the total number of topics.
+#
+# Order is by the tuple of levels ("a/b" sorts before "a-c"), and a cursor is
+# simply the last topic of the previous page.
+from __future__ import annotations
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("children", "terminal", "count", "_sorted")
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = {}
+        self.terminal = False
+        self.count = 0              # topics in this subtree
+        self._sorted: Optional[List[str]] = None
+
+    def keys(self) -> List[str]:
+        if self._sorted is None:
+            self._sorted = sorted(self.children)
+        return self._sorted
+
+
+def valid_filter(flt: str) -> bool:
+    levels = flt.split("/")
+    for i, lvl in enumerate(levels):
+        if "#" in lvl and (lvl != "#" or i != len(levels) - 1):
+            return False
+        if "+" in lvl and lvl != "+":
+            return False
+    return True
+
+
+class TopicIndex:
+
+    def __init__(self):
+        self._root = _Node()
+        self._topics = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._topics)
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self._topics
+
+    def insert(self, topic: str) -> bool:
+        # Returns True when the topic is new. Cheap set check for known topics.
+        if topic in self._topics:
+            return False
+        with self._lock:
+            if topic in self._topics:
+                return False
+            node = self._root
+            node.count += 1
+            for lvl in topic.split("/"):
+                child = node.children.get(lvl)
+                if child is None:
+                    child = node.children[lvl] = _Node()
+                    node._sorted = None
+                node = child
+                node.count += 1
+            node.terminal = True
+            self._topics.add(topic)
+            return True
+
+    def match(self, flt: str = "#", limit: Optional[int] = None,
+              cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        # Topics matching an MQTT filter, sorted, after `cursor`, at most `limit`.
+        # Returns (topics, next_cursor); next_cursor is None on the last page.
+        levels = flt.split("/")
+        after = tuple(cursor.split("/")) if cursor is not None else None
+        out: List[str] = []
+        want = limit + 1 if limit is not None else None
+        with self._lock:
+            self._walk(self._root, (), levels, 0, after, out, want)
+        if want is not None and len(out) > limit:
+            out = out[:limit]
+            return out, out[-1]
+        return out, None
+
+    def _walk(self, node: _Node, path: Tuple[str, ...], levels: List[str], i: int,
+              after: Optional[Tuple[str, ...]], out: List[str], want: Optional[int]) -> bool:
+        # Depth-first in sorted order; returns True once `want` results are collected.
+        if i == len(levels):
+            if node.terminal and (after is None or path > after):
+                out.append("/".join(path))
+            return want is not None and len(out) >= want
+        lvl = levels[i]
+        if lvl == "#":
+            # "a/#" also matches "a" itself
+            if i > 0 and node.terminal and (after is None or path > after):
+                out.append("/".join(path))
+                if want is not None and len(out) >= want:
+                    return True
+            keys = node.keys()
+        elif lvl == "+":
+            keys = node.keys()
+        else:
+            keys = [lvl] if lvl in node.children else []
+        for k in keys:
+            if i == 0 and k.startswith("$") and lvl in ("+", "#"):
+                continue            # wildcards never match $SYS-style topics
+            sub = path + (k,)
+            if after is not None and sub < after[:len(sub)]:
+                continue            # whole subtree sorts before the cursor
+            child = node.children[k]
+            if lvl == "#":
+                if child.terminal and (after is None or sub > after):
+                    out.append("/".join(sub))
+                    if want is not None and len(out) >= want:
+                        return True
+                if self._walk_all(child, sub, after, out, want):
+                    return True
+                continue
+            if self._walk(child, sub, levels, i + 1, after, out, want):
+                return True
+        return False
+
+    def _walk_all(self, node: _Node, path: Tuple[str, ...], after, out, want) -> bool:
+        for k in node.keys():
+            sub = path + (k,)
+            if after is not None and sub < after[:len(sub)]:
+                continue
+            child = node.children[k]
+            if child.terminal and (after is None or sub > after):
+                out.append("/".join(sub))
+                if want is not None and len(out) >= want:
+                    return True
+            if self._walk_all(child, sub, after, out, want):
+                return True
+        return False
+
+    def children(self, prefix: str = "") -> List[Dict[str, object]]:
+        # Immediate child levels under a topic prefix, with subtree topic counts.
+        with self._lock:
+            node = self._root
+            if prefix:
+                for lvl in prefix.split("/"):
+                    node = node.children.get(lvl)
+                    if node is None:
+                        return []
+            base = prefix + "/" if prefix else ""
+            return [{"name": k, "path": base + k, "topics": node.children[k].count,
+                     "is_topic": node.children[k].terminal} for k in node.keys()]
@@ -1,6 +1,10 @@
-import os, ssl, json, threading, time
+import os, sys, json, threading, time
+from pathlib import Path
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))   # repo root, for common/
+from common.client_tls import client_context
+
 # Read settings from environment
 MQTT_HOST   = os.getenv("MQTT_HOST", "localhost")
 MQTT_PORT   = int(os.getenv("MQTT_PORT", "8884"))      # PQC mTLS listener
@@ -31,16 +35,11 @@ def start_mqtt_thread():
     def runner():
         client = mqtt.Client(client_id="api-subscriber", clean_session=True, protocol=mqtt.MQTTv311)
 
-        # mTLS context (TLS 1.3 preferred if available)
+        # mTLS context (TLS 1.3), shared and resuming sessions across the reconnect loop
         if CAFILE:
-            ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=CAFILE)
-            if CERTFILE and KEYFILE:
-                ctx.load_cert_chain(certfile=CERTFILE, keyfile=KEYFILE)
-            try:
-                ctx.minimum_version = ssl.TLSVersion.TLSv1_3
-            except Exception:
-                pass
-            client.tls_set_context(ctx)
+            have_cert = CERTFILE and KEYFILE
+            client.tls_set_context(client_context(CAFILE, CERTFILE if have_cert else None,
+                                                  KEYFILE if have_cert else None))
 
         client.on_connect = _on_connect
         client.on_message = _on_message
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Bytes on the wire and encode/parse cost: stamped JSON vs binary records.
+#
+#   python3 bench/codec_bench.py [--n 20000] [--batch 50] [--json]
+#
+# "bridge" is the per-reading work in the serial bridge (stamp() for JSON,
+# encode_json_line() for records); "api" is the per-reading work in the API
+# ingest (json.loads + field renaming, or record decode). Wire bytes include
+# the MQTT PUBLISH fixed header, topic and QoS 1 packet id, not TLS framing.
+import argparse, json, random, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "software" / "serial_bridge"))
+from common.record_codec import encode_json_line, decode, TOPIC_SUFFIX
+from batching import stamp
+
+TOPIC = "team1/sensor"
+
+
+def mqtt_overhead(topic: str, payload_len: int) -> int:
+    rest = 2 + len(topic) + 2 + payload_len
+    return 1 + (1 if rest < 128 else 2 if rest < 16384 else 3) + rest - payload_len
+
+
+def normalize_json(payload: bytes):
+    data = json.loads(payload.decode("utf-8", errors="replace"))
+    if "temp_c" in data and "temperature" not in data:
+        data["temperature"] = data.get("temp_c")
+    if "hum" in data and "humidity" not in data:
+        data["humidity"] = data.get("hum")
+    return data
+
+
+def per_op_us(fn, items) -> float:
+    t0 = time.perf_counter()
+    for x in items:
+        fn(x)
+    return (time.perf_counter() - t0) / len(items) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare JSON and binary record payloads")
+    ap.add_argument("--n", type=int, default=20000, help="readings per measurement")
+    ap.add_argument("--batch", type=int, default=50, help="readings per batched message")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    ts = int(time.time() * 1000)
+    lines = [b'{"temp_c": %.1f, "hum": %.1f}' % (15 + random.random() * 15, 30 + random.random() * 40)
+             for _ in range(args.n)]
+    js = [stamp(l, ts) for l in lines]
+    rec = [encode_json_line(l, ts) for l in lines]
+
+    out = {"readings": args.n, "batch": args.batch}
+    for name, topic, msgs, sep, enc, dec in (
+            ("json", TOPIC, js, b"\n", lambda l: stamp(l, ts), normalize_json),
+            ("record", TOPIC + TOPIC_SUFFIX, rec, b"", lambda l: encode_json_line(l, ts), decode)):
+        payload = sum(len(m) for m in msgs) / len(msgs)
+        batched = [sep.join(msgs[i:i + args.batch]) for i in range(0, len(msgs), args.batch)]
+        out[name] = {
+            "payload_bytes": round(payload, 1),
+            "wire_bytes": round(payload + mqtt_overhead(topic, int(payload)), 1),
+            "batched_wire_bytes_per_reading": round(
+                sum(len(b) + mqtt_overhead(topic, len(b)) for b in batched) / len(msgs), 2),
+            "bridge_us": round(per_op_us(enc, lines), 3),
+            "api_us": round(per_op_us(dec, msgs), 3),
+        }
+    out["record_vs_json_bytes"] = round(out["record"]["wire_bytes"] / out["json"]["wire_bytes"], 3)
+
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return
+    print(f"{args.n} readings, batches of {args.batch}")
+    print(f"{'':8} {'payload B':>10} {'wire B':>8} {'batched B/rdg':>14} {'bridge us':>10} {'api us':>8}")
+    for name in ("json", "record"):
+        r = out[name]
+        print(f"{name:8} {r['payload_bytes']:>10} {r['wire_bytes']:>8} "
+              f"{r['batched_wire_bytes_per_reading']:>14} {r['bridge_us']:>10} {r['api_us']:>8}")
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# End-to-end gateway benchmark: synthetic sensors -> broker -> api/app.py ingest.
+#
+#   python3 bench/gateway_bench.py --topics 8 --rate 50 --duration 20 --out results.json
+#
+# Starts a broker (the in-process stand-in from mini_broker.py in its own
+# process, a local `mosquitto`, or an existing HOST:PORT), imports the API
+# in this process with a plain-TCP subscriber pool, serves it with uvicorn,
+# and then runs for --warmup + --duration seconds:
+#   - publisher processes send `topics x rate` readings/s, either straight to
+#     the broker (--mode direct, like the DHT11 scripts) or through the serial
+#     bridge main loop fed by a fake serial port (--mode bridge, honouring the
+#     BRIDGE_* env vars such as BRIDGE_BATCH_WINDOW_MS);
+#   - a prober process issues --http-rate API requests/s.
+# Reported: ingest msgs/s and readings/s, latency from the reading's _ts to
+# the end of the ingest batch that stored it, API process CPU and RSS, and
+# HTTP latency percentiles. Results are printed and written as JSON.
+import argparse, http.client, json, multiprocessing as mp, os, re, resource, shutil
+import socket, subprocess, sys, threading, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+TS_RE = re.compile(rb'"_ts":\s*(\d+)')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in ps} | {"max": None, "count": 0}
+    v = sorted(values)
+    out = {f"p{p}": round(v[min(len(v) - 1, int(p / 100 * len(v)))], 3) for p in ps}
+    return out | {"max": round(v[-1], 3), "count": len(v)}
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+# ---- child processes (spawned, so env is set before anything is imported) ----
+
+def run_broker(port: int):
+    sys.path.insert(0, str(ROOT / "bench"))
+    from mini_broker import MiniBroker
+    import asyncio
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(MiniBroker("127.0.0.1", port).serve())
+    loop.run_forever()
+
+
+def firmware_line(i: int, pad: int) -> bytes:
+    line = b'{"temp_c": %.1f, "hum": %.1f' % (20 + (i % 50) / 10, 40 + (i % 30) / 10)
+    if pad > 0:
+        line += b', "pad": "' + b"x" * pad + b'"'
+    return line + b"}"
+
+
+class FakeSerial:
+    # Serial port stand-in emitting firmware lines at a fixed rate.
+
+    def __init__(self, rate: float, pad: int):
+        self.timeout = 1
+        self.interval = 1.0 / rate
+        self.next = time.monotonic()
+        self.pad = pad
+        self.lines = 0
+        self.in_waiting = 0
+
+    def read(self, n: int = 1) -> bytes:
+        now = time.monotonic()
+        if now < self.next:
+            time.sleep(min(self.next - now, self.timeout))
+            now = time.monotonic()
+        out = []
+        while self.next <= now and len(out) < 1000:
+            out.append(firmware_line(self.lines, self.pad) + b"\n")
+            self.lines += 1
+            self.next += self.interval
+        return b"".join(out)
+
+
+def run_publisher(idx: int, cfg: dict, host: str, port: int, t_end: float, q):
+    os.environ.pop("BRIDGE_SPOOL_DIR", None)
+    os.environ["BRIDGE_STATS_INTERVAL"] = "0"
+    os.environ["BRIDGE_PAYLOAD_ENCODING"] = cfg["encoding"]
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "software" / "serial_bridge"))
+    import paho.mqtt.client as mqtt
+    from common.record_codec import encode, TOPIC_SUFFIX
+
+    topics = [f"bench/{t}" for t in range(cfg["topics"])][idx::cfg["publishers"]]
+
+    def client(name, configure=None):
+        c = mqtt.Client(client_id=f"bench-pub-{idx}-{name}")
+        (configure or (lambda c: c.max_inflight_messages_set(1000)))(c)
+        c.connect(host, port, keepalive=30)
+        c.loop_start()
+        return c
+
+    sent = 0
+    if cfg["mode"] == "bridge":
+        from batching import run_bridge, configure_client
+        sers = []
+
+        def bridge(topic):
+            c = client(topic.replace("/", "-"), configure_client)
+            ser = FakeSerial(cfg["rate"], cfg["pad"])
+            sers.append(ser)
+            run_bridge(ser, c, topic, lambda: time.time() < t_end)
+            c.loop_stop(); c.disconnect()
+
+        threads = [threading.Thread(target=bridge, args=(t,)) for t in topics]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        sent = sum(s.lines for s in sers)
+    else:
+        c = client("direct")
+        wire = [t + TOPIC_SUFFIX if cfg["encoding"] == "record" else t for t in topics]
+        interval = 1.0 / cfg["rate"]
+        nxt = time.monotonic()
+        while time.time() < t_end:
+            for topic in wire:
+                ts_ms = int(time.time() * 1000)
+                if cfg["encoding"] == "record":
+                    payload = encode(20 + (sent % 50) / 10, 40.0, ts_ms)
+                else:
+                    line = firmware_line(sent, cfg["pad"])
+                    payload = line[:-1] + b', "_ts": %d}' % ts_ms
+                c.publish(topic, payload, qos=cfg["qos"])
+                sent += 1
+            nxt += interval
+            time.sleep(max(0.0, nxt - time.monotonic()))
+        c.loop_stop(); c.disconnect()
+    q.put(("publisher", idx, sent))
+
+
+def run_prober(api_port: int, rate: float, t_start: float, t_end: float, q):
+    paths = ["/telemetry/latest", "/telemetry/history?topic=bench/0&n=120",
+             "/telemetry/latest?filter=bench/%2B&limit=50", "/ingest/stats"]
+    conn = http.client.HTTPConnection("127.0.0.1", api_port, timeout=5)
+    lat, errors, i = [], 0, 0
+    nxt = time.monotonic()
+    while time.time() < t_end:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            r = conn.getresponse()
+            r.read()
+            if r.status >= 500:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn = http.client.HTTPConnection("127.0.0.1", api_port, timeout=5)
+        if time.time() >= t_start:
+            lat.append((time.perf_counter() - t0) * 1000)
+        nxt += 1.0 / rate
+        time.sleep(max(0.0, nxt - time.monotonic()))
+    q.put(("prober", lat, errors))
+
+
+# ---- main process: broker setup, API under test, measurement ----
+
+def start_broker(spec: str):
+    if spec == "inproc":
+        port = free_port()
+        p = mp.get_context("spawn").Process(target=run_broker, args=(port,), daemon=True)
+        p.start()
+        stop = p.terminate
+    elif spec == "mosquitto":
+        if not shutil.which("mosquitto"):
+            sys.exit("mosquitto not found on PATH; use --broker inproc or HOST:PORT")
+        port = free_port()
+        p = subprocess.Popen(["mosquitto", "-p", str(port)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        stop = p.terminate
+    else:
+        host, _, port = spec.rpartition(":")
+        return host or "127.0.0.1", int(port), lambda: None
+    for _ in range(100):                            # wait until it accepts connections
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return "127.0.0.1", port, stop
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the gateway ingest path")
+    ap.add_argument("--broker", default="inproc", help="inproc, mosquitto or HOST:PORT (plain TCP)")
+    ap.add_argument("--mode", choices=("direct", "bridge"), default="direct")
+    ap.add_argument("--encoding", choices=("json", "record"), default="json")
+    ap.add_argument("--topics", type=int, default=4)
+    ap.add_argument("--rate", type=float, default=50, help="readings/s per topic")
+    ap.add_argument("--pad", type=int, default=0, help="extra payload bytes per JSON reading")
+    ap.add_argument("--qos", type=int, choices=(0, 1), default=1, help="publish QoS (direct mode)")
+    ap.add_argument("--publishers", type=int, default=1, help="publisher processes")
+    ap.add_argument("--connections", type=int, default=1, help="API subscriber connections")
+    ap.add_argument("--http-rate", type=float, default=20, help="API requests/s (0 disables)")
+    ap.add_argument("--warmup", type=float, default=2)
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--out", default="", help="write results JSON here")
+    args = ap.parse_args()
+    args.publishers = max(1, min(args.publishers, args.topics))
+
+    host, port, stop_broker = start_broker(args.broker)
+
+    # API under test, subscribed over plain TCP to the benchmark topics
+    os.environ.update({"API_MQTT_BROKER_HOST": host, "API_MQTT_BROKER_PORT": str(port),
+                       "API_MQTT_TOPIC_FILTER": "bench/#", "API_MQTT_CA_CERT": ""})
+    os.environ.pop("API_TELEMETRY_LOG_DIR", None)
+    sys.path.insert(0, str(ROOT))
+    import api.app as gw
+    # Plain-TCP pool injected before startup; the app's lifespan starts it on its loop
+    gw.POOL = gw.make_pool(None, connections=args.connections, client_id="bench-api", qos=1)
+
+    # Latency probe: wrap the ingest handler and read _ts from every stored reading
+    lat, stored = [], [0]
+    handler = gw.PIPELINE.handler
+
+    def timed(batch):
+        handler(batch)
+        now_ms = time.time() * 1000
+        for item in batch:
+            payload = item[1]
+            if payload[:1] == b"\xb1":
+                stamps = [int.from_bytes(payload[i + 2:i + 10], "little", signed=True)
+                          for i in range(0, len(payload), 14)]
+            else:
+                stamps = [int(m) for m in TS_RE.findall(payload)]
+            stored[0] += len(stamps)
+            lat.extend(now_ms - s for s in stamps)
+    gw.PIPELINE.handler = timed
+
+    # uvicorn runs the app (and with it the MQTT ingest) even without the HTTP prober
+    import uvicorn
+    api_port = free_port()
+    server = uvicorn.Server(uvicorn.Config(gw.app, host="127.0.0.1", port=api_port,
+                                           log_level="warning"))
+    api_thread = threading.Thread(target=server.run, daemon=True)
+    api_thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    deadline = time.time() + 10
+    while not any(c["connected"] for c in gw.POOL.stats()) and time.time() < deadline:
+        time.sleep(0.05)
+
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    t_start = time.time() + args.warmup
+    t_end = t_start + args.duration
+    cfg = {k: getattr(args, k) for k in ("mode", "encoding", "topics", "rate", "pad", "qos", "publishers")}
+    procs = [ctx.Process(target=run_publisher, args=(i, cfg, host, port, t_end, q))
+             for i in range(args.publishers)]
+    if args.http_rate > 0:
+        procs.append(ctx.Process(target=run_prober, args=(api_port, args.http_rate, t_start, t_end, q)))
+    for p in procs:
+        p.start()
+
+    # Measurement window: snapshot counters at t_start and t_end
+    time.sleep(max(0.0, t_start - time.time()))
+    stats0 = gw.PIPELINE.stats()
+    lat_mark, stored0 = len(lat), stored[0]
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    rss_peak = rss_mb()
+    while time.time() < t_end:
+        time.sleep(0.5)
+        rss_peak = max(rss_peak, rss_mb())
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    stats1 = gw.PIPELINE.stats()
+    lat_window = lat[lat_mark:]
+    readings = stored[0] - stored0
+
+    published, http_lat, http_errors = 0, [], 0
+    for _ in procs:
+        msg = q.get(timeout=60)
+        if msg[0] == "publisher":
+            published += msg[2]
+        else:
+            http_lat, http_errors = msg[1], msg[2]
+    for p in procs:
+        p.join(10)
+    server.should_exit = True      # lifespan shutdown disconnects the pool and drains the queue
+    api_thread.join(30)
+    stop_broker()
+
+    msgs = stats1["processed"] - stats0["processed"]
+    result = {
+        "config": vars(args),
+        "broker": f"{args.broker} ({host}:{port})",
+        "published_readings": published,
+        "ingest": {
+            "messages": msgs,
+            "readings": readings,
+            "msgs_per_s": round(msgs / wall, 1),
+            "readings_per_s": round(readings / wall, 1),
+            "dropped": stats1["dropped"] - stats0["dropped"],
+            "max_depth": stats1["max_depth"],
+            "errors": stats1["errors"] - stats0["errors"],
+        },
+        "latency_ms": percentiles(lat_window),
+        "api_process": {
+            "cpu_percent": round(cpu / wall * 100, 1),
+            "rss_mb_peak": round(rss_peak, 1),
+            "ru_maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "http_ms": percentiles(http_lat) | {"errors": http_errors},
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"[BENCH] wrote {args.out}")
+
+
+if __name__ == "__main__": main()
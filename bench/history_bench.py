@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# History window and downsampling cost: slice/bisect reducers vs per-point loops.
+#
+#   python3 bench/history_bench.py [--points 100000] [--max-points 500] [--nan 0.05] [--json]
+#
+# Fills one topic's ring (wrapped, so windows span both runs), then times a
+# time-range window, minmax buckets, LTTB and the LTTB gather against the
+# per-point Python loops they replaced, which are kept below as the baseline.
+# Every result is checked against the baseline before it is timed.
+import argparse, json, math, random, sys, time
+from array import array
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from api.history_store import HistoryStore
+from api.downsample import minmax_buckets, lttb_indices, take
+
+
+# ---- baseline: the per-point implementations ----
+
+def loop_bisect(ring, t, right=False):
+    lo, hi = 0, len(ring.ts)
+    n = hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = ring.ts[(ring.head + mid) % n]
+        if v < t or (right and v == t):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def loop_minmax(cols, max_points, t0=None, t1=None):
+    ts = cols["ts"]
+    fields = [f for f in cols if f not in ("ts", "size_bytes")]
+    out = {"ts": [], "count": []}
+    for f in fields:
+        out[f + "_min"] = []; out[f + "_max"] = []; out[f + "_mean"] = []
+    t0 = ts[0] if t0 is None else t0
+    t1 = ts[-1] if t1 is None else t1
+    width = max((t1 - t0) / max_points, 1e-9)
+    nb = max_points
+    count = [0] * nb
+    lo = {f: [math.inf] * nb for f in fields}
+    hi = {f: [-math.inf] * nb for f in fields}
+    sm = {f: [0.0] * nb for f in fields}
+    n = {f: [0] * nb for f in fields}
+    for i, t in enumerate(ts):
+        b = min(max(int((t - t0) / width), 0), nb - 1)
+        count[b] += 1
+        for f in fields:
+            v = cols[f][i]
+            if v != v:
+                continue
+            if v < lo[f][b]: lo[f][b] = v
+            if v > hi[f][b]: hi[f][b] = v
+            sm[f][b] += v
+            n[f][b] += 1
+    for b in range(nb):
+        if not count[b]:
+            continue
+        out["ts"].append(t0 + b * width)
+        out["count"].append(count[b])
+        for f in fields:
+            k = n[f][b]
+            out[f + "_min"].append(lo[f][b] if k else None)
+            out[f + "_max"].append(hi[f][b] if k else None)
+            out[f + "_mean"].append(sm[f][b] / k if k else None)
+    return out
+
+
+def loop_lttb(ts, ys, threshold):
+    idx = [i for i, y in enumerate(ys) if y == y]
+    if len(idx) <= threshold:
+        return idx
+    picked = [idx[0]]
+    every = (len(idx) - 2) / (threshold - 2)
+    a = idx[0]
+    for b in range(threshold - 2):
+        start = int(b * every) + 1
+        stop = int((b + 1) * every) + 1
+        nxt = idx[stop:min(int((b + 2) * every) + 1, len(idx))] or [idx[-1]]
+        ax = sum(ts[j] for j in nxt) / len(nxt)
+        ay = sum(ys[j] for j in nxt) / len(nxt)
+        px, py = ts[a], ys[a]
+        best, best_area = idx[start], -1.0
+        for j in idx[start:stop]:
+            area = abs((px - ax) * (ys[j] - py) - (px - ts[j]) * (ay - py))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(idx[-1])
+    return picked
+
+
+def loop_take(cols, indices):
+    return {k: array(col.typecode, (col[i] for i in indices)) for k, col in cols.items()}
+
+
+# ---- harness ----
+
+def best_ms(fn, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def close(a, b):
+    # Equal lists, allowing last-bit differences in float sums.
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(close(a[k], b[k]) for k in a)
+    return len(a) == len(b) and all(
+        x == y or (x is not None and y is not None and math.isclose(x, y, rel_tol=1e-12))
+        for x, y in zip(a, b))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare history reducers with per-point loops")
+    ap.add_argument("--points", type=int, default=100000, help="points held for the topic")
+    ap.add_argument("--max-points", type=int, default=500, help="downsampling target")
+    ap.add_argument("--nan", type=float, default=0.05, help="share of missing readings")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    store = HistoryStore(args.points)
+    t, temp = 1_700_000_000, 20.0
+    for i in range(args.points + args.points // 3):      # wrap the ring
+        t += rnd.choice((1, 1, 2))
+        temp += rnd.uniform(-0.2, 0.2)
+        vals = {"humidity": 40 + rnd.random() * 10}
+        if rnd.random() >= args.nan:
+            vals["temperature"] = round(temp, 2)
+        store.append("t/a", t, 30, vals)
+    ring = store._rings["t/a"]
+    lo, hi = ring.ts[ring.head] + 1000, t - 1000
+    cols = store.window("t/a", lo, hi)
+    idx = lttb_indices(cols["ts"], cols["temperature"], args.max_points)
+
+    assert (ring.bisect(lo), ring.bisect(hi, True)) == (loop_bisect(ring, lo), loop_bisect(ring, hi, True))
+    assert close(minmax_buckets(cols, args.max_points, lo, hi), loop_minmax(cols, args.max_points, lo, hi))
+    assert idx == loop_lttb(cols["ts"], cols["temperature"], args.max_points)
+    assert take(cols, idx) == loop_take(cols, idx)
+
+    cases = {
+        "bisect": (lambda: (ring.bisect(lo), ring.bisect(hi, True)),
+                   lambda: (loop_bisect(ring, lo), loop_bisect(ring, hi, True))),
+        "minmax": (lambda: minmax_buckets(cols, args.max_points, lo, hi),
+                   lambda: loop_minmax(cols, args.max_points, lo, hi)),
+        "lttb": (lambda: lttb_indices(cols["ts"], cols["temperature"], args.max_points),
+                 lambda: loop_lttb(cols["ts"], cols["temperature"], args.max_points)),
+        "take": (lambda: take(cols, idx), lambda: loop_take(cols, idx)),
+    }
+    out = {"points": len(cols["ts"]), "max_points": args.max_points, "nan": args.nan}
+    for name, (new, old) in cases.items():
+        reps = args.repeat * (200 if name == "bisect" else 1)
+        n_ms, o_ms = best_ms(new, reps), best_ms(old, reps)
+        out[name] = {"ms": round(n_ms, 4), "loop_ms": round(o_ms, 4), "speedup": round(o_ms / n_ms, 1)}
+
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return
+    print(f"{out['points']} points in the window -> {args.max_points}, {args.nan:.0%} missing")
+    print(f"{'':8} {'ms':>9} {'loop ms':>9} {'speedup':>8}")
+    for name in cases:
+        r = out[name]
+        print(f"{name:8} {r['ms']:>9} {r['loop_ms']:>9} {r['speedup']:>7}x")
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Minimal in-process MQTT 3.1.1 broker for benchmarks and dev boxes without mosquitto.
+#
+# Plain TCP only. Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE (including
+# $share/<group>/<filter>, round-robin within a group), PUBLISH at QoS 0/1
+# with PUBACK, retained messages (sent on SUBSCRIBE to plain filters),
+# PINGREQ and DISCONNECT. No sessions, wills or QoS 2: just enough to push
+# realistic traffic through paho clients.
+#
+#   python3 bench/mini_broker.py --port 1883
+import argparse, asyncio, itertools, struct, threading
+from typing import Dict, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b, n = n % 128, n // 128
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _str(buf: bytes, i: int) -> Tuple[str, int]:
+    n = struct.unpack_from("!H", buf, i)[0]
+    return buf[i + 2:i + 2 + n].decode("utf-8"), i + 2 + n
+
+
+class _Session:
+
+    def __init__(self, broker: "MiniBroker", writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.writer = writer
+        self.client_id = ""
+        self.subs: Dict[str, int] = {}          # filter (without $share prefix) -> qos
+        self.shared: Dict[str, Tuple[str, int]] = {}   # "$share/g/f" -> (group, qos)
+        self._ids = itertools.cycle(range(1, 65536))
+
+    def send_publish(self, topic: str, payload: bytes, qos: int, retain: bool = False):
+        t = topic.encode("utf-8")
+        body = struct.pack("!H", len(t)) + t
+        if qos:
+            body += struct.pack("!H", next(self._ids))
+        body += payload
+        self.writer.write(bytes([0x30 | (qos << 1) | retain]) + _varint(len(body)) + body)
+
+
+class MiniBroker:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.sessions: List[_Session] = []
+        self.groups: Dict[Tuple[str, str], itertools.count] = {}
+        self.retained: Dict[str, Tuple[bytes, int]] = {}
+        self.received = 0
+        self.delivered = 0
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---- routing ----
+
+    def route(self, topic: str, payload: bytes, qos: int) -> List[asyncio.StreamWriter]:
+        self.received += 1
+        out = []
+        groups: Dict[Tuple[str, str], List[Tuple[_Session, int]]] = {}
+        for s in self.sessions:
+            best = -1
+            for flt, sq in s.subs.items():
+                if sq > best and topic_matches_sub(flt, topic):
+                    best = sq
+            if best >= 0:
+                s.send_publish(topic, payload, min(qos, best))
+                out.append(s.writer)
+            for key, (group, sq) in s.shared.items():
+                flt = key.split("/", 2)[2]
+                if topic_matches_sub(flt, topic):
+                    groups.setdefault((group, flt), []).append((s, sq))
+        for key, members in groups.items():
+            n = next(self.groups.setdefault(key, itertools.count()))
+            s, sq = members[n % len(members)]
+            s.send_publish(topic, payload, min(qos, sq))
+            out.append(s.writer)
+        self.delivered += len(out)
+        return out
+
+    # ---- connection handling ----
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        head = (await reader.readexactly(1))[0]
+        n, mult = 0, 1
+        while True:
+            b = (await reader.readexactly(1))[0]
+            n += (b & 0x7F) * mult
+            if not b & 0x80:
+                break
+            mult *= 128
+        return head, await reader.readexactly(n) if n else b""
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        s = _Session(self, writer)
+        try:
+            while True:
+                head, body = await self._read_packet(reader)
+                kind = head >> 4
+                if kind == 1:                           # CONNECT
+                    _, i = _str(body, 0)
+                    s.client_id, _ = _str(body, i + 4)
+                    writer.write(b"\x20\x02\x00\x00")
+                    self.sessions.append(s)
+                elif kind == 3:                         # PUBLISH
+                    qos = (head >> 1) & 3
+                    topic, i = _str(body, 0)
+                    if qos:
+                        pid = body[i:i + 2]
+                        i += 2
+                        writer.write(b"\x40\x02" + pid)
+                    if head & 1:                        # retain: an empty payload clears it
+                        if body[i:]:
+                            self.retained[topic] = (body[i:], min(qos, 1))
+                        else:
+                            self.retained.pop(topic, None)
+                    for w in self.route(topic, body[i:], min(qos, 1)):
+                        if w.transport.get_write_buffer_size() > 1 << 20:
+                            await w.drain()             # slow subscriber: push back on the publisher
+                elif kind == 8:                         # SUBSCRIBE
+                    pid, i, granted, plain = body[:2], 2, bytearray(), []
+                    while i < len(body):
+                        flt, i = _str(body, i)
+                        qos = min(body[i] & 3, 1)
+                        i += 1
+                        if flt.startswith("$share/"):
+                            s.shared[flt] = (flt.split("/", 2)[1], qos)
+                        else:
+                            s.subs[flt] = qos
+                            plain.append((flt, qos))
+                        granted.append(qos)
+                    writer.write(b"\x90" + _varint(2 + len(granted)) + pid + bytes(granted))
+                    for topic, (payload, rq) in list(self.retained.items()):
+                        q = max((fq for flt, fq in plain if topic_matches_sub(flt, topic)), default=-1)
+                        if q >= 0:
+                            s.send_publish(topic, payload, min(rq, q), retain=True)
+                elif kind == 10:                        # UNSUBSCRIBE
+                    pid, i = body[:2], 2
+                    while i < len(body):
+                        flt, i = _str(body, i)
+                        s.subs.pop(flt, None)
+                        s.shared.pop(flt, None)
+                    writer.write(b"\xb0\x02" + pid)
+                elif kind == 12:                        # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:                        # DISCONNECT
+                    break
+                # PUBACK (4) from subscribers needs no action
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if s in self.sessions:
+                self.sessions.remove(s)
+            writer.close()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    def start_thread(self) -> "MiniBroker":
+        # Run on a private event loop in a daemon thread; returns once listening.
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="mini-broker", daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Minimal MQTT 3.1.1 broker")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1883)
+    args = ap.parse_args()
+    broker = MiniBroker(args.host, args.port)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(broker.serve())
+    print(f"[BROKER] listening on {args.host}:{broker.port}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# TLS 1.3 mTLS handshake benchmark: classic vs PQC/hybrid key exchange and certificates.
+#
+#   source scripts/pqc_env.sh
+#   python3 bench/tls_handshake_bench.py \
+#       --groups X25519,X25519MLKEM768,MLKEM768 --sigs ec,ML-DSA-65 \
+#       --concurrency 1,8,32 --handshakes 50 --out tls.json
+#
+# For every certificate algorithm in --sigs a throwaway CA, server and client
+# chain is generated with `openssl`, and for every key-exchange group an
+# `openssl s_server` restricted to that group is started (single-threaded,
+# like mosquitto). Client workers run in a child Python process whose
+# OPENSSL_CONF pins the same group (and loads --provider-module if given),
+# drive handshakes over memory BIOs and record, per handshake:
+#   - wall-clock latency (full handshakes and PSK-ticket resumptions),
+#   - bytes sent/received until the handshake completes,
+#   - client CPU, and s_server CPU from /proc/<pid>/stat.
+# With --connect HOST:PORT --ca/--cert/--key the clients target an existing
+# listener (e.g. the broker on 8884) instead; server CPU is then not reported.
+# Python's ssl module must be linked against an OpenSSL that can negotiate
+# the groups (3.5+, or 3.x with oqsprovider).
+import argparse, json, os, shutil, socket, ssl, subprocess, sys, tempfile, threading, time
+
+PROVIDER_CONF = """
+[provider_sect]
+default = default_sect
+oqsprovider = oqs_sect
+[default_sect]
+activate = 1
+[oqs_sect]
+module = {module}
+activate = 1
+"""
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in ps}
+    v = sorted(values)
+    return {f"p{p}": round(v[min(len(v) - 1, int(p / 100 * len(v)))], 3) for p in ps}
+
+
+def write_conf(path, group, module):
+    # OpenSSL config pinning the key-exchange group for every SSL_CTX in the process.
+    lines = ["openssl_conf = openssl_init", "[openssl_init]", "ssl_conf = ssl_sect"]
+    if module:
+        lines.append("providers = provider_sect")
+    lines += ["[ssl_sect]", "system_default = system_default_sect",
+              "[system_default_sect]", "MinProtocol = TLSv1.3"]
+    if group:
+        lines.append(f"Groups = {group}")
+    text = "\n".join(lines) + "\n"
+    if module:
+        text += PROVIDER_CONF.format(module=module)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def newkey(sig):
+    if sig in ("ec", "ecdsa", "P-256"):
+        return ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"]
+    if sig.startswith("rsa"):
+        return ["-newkey", sig if ":" in sig else "rsa:2048"]
+    return ["-newkey", sig]
+
+
+def make_chain(openssl, env, d, sig):
+    # CA + server (SAN localhost/127.0.0.1) + client certificate, all with `sig` keys.
+    def run(*args):
+        subprocess.run([openssl, *args], cwd=d, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    with open(os.path.join(d, "san.ext"), "w") as f:
+        f.write("subjectAltName=DNS:localhost,IP:127.0.0.1\n")
+    run("req", "-x509", "-new", *newkey(sig), "-nodes", "-keyout", "ca.key", "-out", "ca.crt",
+        "-subj", "/CN=bench-ca", "-days", "2")
+    for name, ext in (("server", ["-extfile", "san.ext"]), ("client", [])):
+        run("req", "-new", *newkey(sig), "-nodes", "-keyout", f"{name}.key", "-out", f"{name}.csr",
+            "-subj", f"/CN={'localhost' if name == 'server' else 'bench-client'}")
+        run("x509", "-req", "-in", f"{name}.csr", "-CA", "ca.crt", "-CAkey", "ca.key",
+            "-CAcreateserial", "-out", f"{name}.crt", "-days", "2", *ext)
+    sizes = {n: os.path.getsize(os.path.join(d, n)) for n in ("ca.crt", "server.crt", "client.crt")}
+    return {"ca": os.path.join(d, "ca.crt"), "cert": os.path.join(d, "client.crt"),
+            "key": os.path.join(d, "client.key"), "server_cert": os.path.join(d, "server.crt"),
+            "server_key": os.path.join(d, "server.key"), "pem_bytes": sizes}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(openssl, env, chain, group, port):
+    p = subprocess.Popen([openssl, "s_server", "-accept", str(port), "-tls1_3", "-quiet",
+                          "-cert", chain["server_cert"], "-key", chain["server_key"],
+                          "-CAfile", chain["ca"], "-Verify", "1", "-groups", group],
+                         env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE)
+    for _ in range(100):
+        if p.poll() is not None:
+            raise RuntimeError(f"s_server exited: {p.stderr.read().decode(errors='replace')[-300:]}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return p
+        except OSError:
+            time.sleep(0.05)
+    p.kill()
+    raise RuntimeError("s_server did not start")
+
+
+def proc_cpu_s(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+# ---- client side (runs in a child process with the pinned OPENSSL_CONF) ----
+
+def handshake(ctx, addr, host, session=None):
+    # One handshake over memory BIOs; returns (seconds, sent, received, SSLObject).
+    sock = socket.create_connection(addr, timeout=10)
+    inc, out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    obj = ctx.wrap_bio(inc, out, server_hostname=host, session=session)
+    sent = recv = 0
+    t0 = time.perf_counter()
+    try:
+        while True:
+            try:
+                obj.do_handshake()
+                break
+            except ssl.SSLWantReadError:
+                data = out.read()
+                if data:
+                    sock.sendall(data)
+                    sent += len(data)
+                chunk = sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("server closed during handshake")
+                recv += len(chunk)
+                inc.write(chunk)
+        data = out.read()
+        if data:
+            sock.sendall(data)
+            sent += len(data)
+        dt = time.perf_counter() - t0
+        # TLS 1.3 tickets arrive after the handshake; read them for resumption.
+        sock.settimeout(0.2)
+        try:
+            inc.write(sock.recv(65536))
+            obj.read(1)
+        except (socket.timeout, ssl.SSLWantReadError, ssl.SSLZeroReturnError, OSError):
+            pass
+        return dt, sent, recv, obj
+    finally:
+        sock.close()
+
+
+def client_main(spec):
+    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=spec["ca"])
+    ctx.load_cert_chain(spec["cert"], spec["key"])
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_3
+    addr, host = (spec["host"], spec["port"]), spec["server_name"]
+    lock = threading.Lock()
+    lat, sent, recv, errors, reused = [], [], [], [], 0
+
+    def worker():
+        nonlocal reused
+        session = None
+        if spec["resume"]:
+            try:
+                session = handshake(ctx, addr, host)[3].session
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                return
+        for _ in range(spec["handshakes"]):
+            try:
+                dt, s, r, obj = handshake(ctx, addr, host, session)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                lat.append(dt * 1000); sent.append(s); recv.append(r)
+                reused += obj.session_reused
+            if spec["resume"] and obj.session is not None:
+                session = obj.session
+
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(spec["concurrency"])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    n = len(lat)
+    print(json.dumps({
+        "handshakes": n,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "resumed": reused,
+        "handshakes_per_s": round(n / wall, 1) if wall else None,
+        "latency_ms": percentiles(lat),
+        "bytes_sent": round(sum(sent) / n, 1) if n else None,
+        "bytes_received": round(sum(recv) / n, 1) if n else None,
+        "client_cpu_ms": round(cpu * 1000 / n, 3) if n else None,
+        "openssl": ssl.OPENSSL_VERSION,
+    }))
+
+
+def run_clients(conf, spec):
+    env = dict(os.environ, OPENSSL_CONF=conf)
+    p = subprocess.run([sys.executable, os.path.abspath(__file__), "--client", json.dumps(spec)],
+                       env=env, capture_output=True, text=True)
+    if p.returncode != 0:
+        return {"errors": 1, "first_error": p.stderr.strip()[-300:]}
+    return json.loads(p.stdout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark TLS 1.3 mTLS handshakes")
+    ap.add_argument("--groups", default="X25519,X25519MLKEM768,MLKEM768")
+    ap.add_argument("--sigs", default="ec,ML-DSA-65", help="certificate key algorithms")
+    ap.add_argument("--concurrency", default="1,8", help="comma-separated client thread counts")
+    ap.add_argument("--handshakes", type=int, default=50, help="handshakes per client thread")
+    ap.add_argument("--openssl", default=shutil.which("openssl") or "openssl",
+                    help="openssl binary for cert generation and s_server")
+    ap.add_argument("--provider-module", default=os.getenv("OQS_PROVIDER_MODULE", ""),
+                    help="path to oqsprovider.so when the OpenSSL build needs it")
+    ap.add_argument("--connect", default="", help="HOST:PORT of an existing TLS listener")
+    ap.add_argument("--ca"); ap.add_argument("--cert"); ap.add_argument("--key")
+    ap.add_argument("--server-name", default="localhost")
+    ap.add_argument("--out", default="", help="write results JSON here")
+    ap.add_argument("--client", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.client:
+        return client_main(json.loads(args.client))
+
+    groups = [g for g in args.groups.split(",") if g]
+    conc = [int(c) for c in args.concurrency.split(",") if c]
+    tmp = tempfile.mkdtemp(prefix="tlsbench-")
+    results = []
+    try:
+        if args.connect:
+            host, _, port = args.connect.rpartition(":")
+            chains = {"given": {"ca": args.ca, "cert": args.cert, "key": args.key}}
+        else:
+            host, port = "127.0.0.1", 0
+            chains = {}
+            for sig in args.sigs.split(","):
+                d = os.path.join(tmp, sig.replace(":", "_"))
+                os.makedirs(d)
+                env = dict(os.environ, OPENSSL_CONF=write_conf(os.path.join(tmp, "gen.cnf"), "", args.provider_module))
+                try:
+                    chains[sig] = make_chain(args.openssl, env, d, sig)
+                except subprocess.CalledProcessError as e:
+                    print(f"[TLS] skipping {sig}: {e.stderr.decode(errors='replace').strip()[-200:]}")
+
+        for sig, chain in chains.items():
+            for group in groups:
+                conf = write_conf(os.path.join(tmp, f"{group}.cnf"), group, args.provider_module)
+                server = None
+                if not args.connect:
+                    port = free_port()
+                    try:
+                        server = start_server(args.openssl, dict(os.environ, OPENSSL_CONF=conf),
+                                              chain, group, port)
+                    except RuntimeError as e:
+                        print(f"[TLS] skipping {sig}/{group}: {e}")
+                        continue
+                try:
+                    for n in conc:
+                        for resume in (False, True):
+                            spec = {"host": host, "port": int(port), "server_name": args.server_name,
+                                    "ca": chain["ca"], "cert": chain["cert"], "key": chain["key"],
+                                    "concurrency": n, "handshakes": args.handshakes, "resume": resume}
+                            cpu0 = proc_cpu_s(server.pid) if server else None
+                            r = run_clients(conf, spec)
+                            if server and r.get("handshakes"):
+                                r["server_cpu_ms"] = round((proc_cpu_s(server.pid) - cpu0) * 1000
+                                                           / (r["handshakes"] + (n if resume else 0)), 3)
+                            r.update({"sig": sig, "group": group, "concurrency": n,
+                                      "mode": "resumed" if resume else "full"})
+                            if "pem_bytes" in chain:
+                                r["pem_bytes"] = chain["pem_bytes"]
+                            results.append(r)
+                            lat = r.get("latency_ms", {})
+                            print(f"[TLS] {sig:>10} {group:>16} x{n:<3} {r['mode']:>7}: "
+                                  f"p50 {lat.get('p50')} ms, p99 {lat.get('p99')} ms, "
+                                  f"{r.get('handshakes_per_s')} hs/s, "
+                                  f"{r.get('bytes_sent')}/{r.get('bytes_received')} B, "
+                                  f"client {r.get('client_cpu_ms')} ms, server {r.get('server_cpu_ms')} ms"
+                                  + (f", {r['errors']} errors ({r.get('first_error')})" if r.get("errors") else ""))
+                finally:
+                    if server:
+                        server.kill()
+                        server.wait()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"openssl": args.openssl, "results": results}, f, indent=2)
+        print(f"[TLS] wrote {args.out}")
+
+
+if __name__ == "__main__": main()
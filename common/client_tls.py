@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Shared client-side TLS for every MQTT client in the repo.
+#
+# client_context() builds one SSLContext per (CA, cert, key, options) and
+# hands the same object back on later calls, so certificates and CA chains
+# are parsed once per process. The context remembers the latest session
+# ticket per server (host, port) and offers it on the next connection, so
+# paho's reconnects after a broker blip resume the TLS 1.3 session (PSK)
+# instead of repeating the full PQC key exchange and ML-DSA chain
+# verification. Every handshake is timed; stats() reports counts, the
+# resumption hit rate and average full/resumed handshake times.
+#
+#   ctx = client_context(CA, CRT, KEY)
+#   client.tls_set_context(ctx)
+import os, ssl, threading, time
+from typing import Any, Dict, Optional, Tuple
+
+TLS_LOG = os.getenv("MQTT_TLS_LOG", "1") == "1"
+
+_contexts: Dict[Tuple, "ClientTLSContext"] = {}
+_lock = threading.Lock()
+
+
+def _server_key(sock, server_hostname: Optional[str]) -> Tuple[str, int]:
+    host, port = sock.getpeername()[:2]
+    return (server_hostname or host, port)
+
+
+class _TrackedSSLSocket(ssl.SSLSocket):
+    # Times the handshake and hands new session tickets back to the context.
+
+    _want_ticket = 0
+
+    def do_handshake(self, block=False):
+        t0 = time.perf_counter()
+        try:
+            super().do_handshake(block)
+        except Exception:
+            self.context._record(None, 0.0)
+            raise
+        ms = (time.perf_counter() - t0) * 1000
+        self.context._record(self, ms)
+        self._want_ticket = 4       # TLS 1.3 tickets arrive with the first reads
+        self._save_session()
+
+    def _save_session(self):
+        try:
+            session = self.session
+            if session is not None and session.has_ticket:
+                self.context._sessions[_server_key(self, self.server_hostname)] = session
+                self._want_ticket = 0
+                return
+        except (OSError, ValueError):
+            pass
+        self._want_ticket = max(0, self._want_ticket - 1)
+
+    def recv(self, buflen=1024, flags=0):
+        data = super().recv(buflen, flags)
+        if self._want_ticket:
+            self._save_session()
+        return data
+
+    def recv_into(self, buffer, nbytes=None, flags=0):
+        n = super().recv_into(buffer, nbytes, flags)
+        if self._want_ticket:
+            self._save_session()
+        return n
+
+
+class ClientTLSContext(ssl.SSLContext):
+    sslsocket_class = _TrackedSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._sessions: Dict[Tuple[str, int], ssl.SSLSession] = {}
+        self._stats_lock = threading.Lock()
+        self.handshakes = self.resumed = self.failures = 0
+        self.full_ms = self.resumed_ms = self.last_ms = 0.0
+
+    def wrap_socket(self, sock, *args, session=None, **kwargs):
+        if session is None and not kwargs.get("server_side"):
+            try:
+                session = self._sessions.get(_server_key(sock, kwargs.get("server_hostname")))
+            except OSError:
+                session = None
+        return super().wrap_socket(sock, *args, session=session, **kwargs)
+
+    def _record(self, sock: Optional[ssl.SSLSocket], ms: float):
+        with self._stats_lock:
+            if sock is None:
+                self.failures += 1
+                return
+            reused = sock.session_reused
+            self.handshakes += 1
+            self.last_ms = ms
+            if reused:
+                self.resumed += 1
+                self.resumed_ms += ms
+            else:
+                self.full_ms += ms
+        if TLS_LOG:
+            print(f"[TLS] {sock.server_hostname or sock.getpeername()[0]} "
+                  f"{'resumed' if reused else 'full'} handshake {ms:.1f} ms ({sock.version()})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            full = self.handshakes - self.resumed
+            return {
+                "handshakes": self.handshakes,
+                "resumed": self.resumed,
+                "failures": self.failures,
+                "resumption_rate": round(self.resumed / self.handshakes, 3) if self.handshakes else None,
+                "full_avg_ms": round(self.full_ms / full, 2) if full else None,
+                "resumed_avg_ms": round(self.resumed_ms / self.resumed, 2) if self.resumed else None,
+                "last_ms": round(self.last_ms, 2),
+                "cached_sessions": len(self._sessions),
+            }
+
+
+def client_context(ca: Optional[str] = None, cert: Optional[str] = None, key: Optional[str] = None,
+                   verify: bool = True, check_hostname: bool = True,
+                   tls13: bool = True) -> ClientTLSContext:
+    # Cached client context: mTLS when cert/key are given, TLS 1.3 only unless tls13=False.
+    cache_key = (ca, cert, key, verify, check_hostname, tls13)
+    with _lock:
+        ctx = _contexts.get(cache_key)
+        if ctx is not None:
+            return ctx
+        ctx = ClientTLSContext(ssl.PROTOCOL_TLS_CLIENT)
+        if verify:
+            if ca:
+                ctx.load_verify_locations(cafile=str(ca))
+            else:
+                ctx.load_default_certs()
+            ctx.check_hostname = check_hostname
+        else:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        if cert:
+            ctx.load_cert_chain(certfile=str(cert), keyfile=str(key) if key else None)
+        if tls13:
+            try:
+                ctx.minimum_version = ssl.TLSVersion.TLSv1_3
+            except Exception:
+                pass
+        _contexts[cache_key] = ctx
+        return ctx
+
+
+def stats() -> Dict[str, Any]:
+    # Handshake counters summed over every context this process has built.
+    with _lock:
+        ctxs = list(_contexts.values())
+    out = {"contexts": len(ctxs), "handshakes": 0, "resumed": 0, "failures": 0, "cached_sessions": 0}
+    full_ms = resumed_ms = 0.0
+    for c in ctxs:
+        s = c.stats()
+        for k in ("handshakes", "resumed", "failures", "cached_sessions"):
+            out[k] += s[k]
+        full_ms += c.full_ms
+        resumed_ms += c.resumed_ms
+    full = out["handshakes"] - out["resumed"]
+    out["resumption_rate"] = round(out["resumed"] / out["handshakes"], 3) if out["handshakes"] else None
+    out["full_avg_ms"] = round(full_ms / full, 2) if full else None
+    out["resumed_avg_ms"] = round(resumed_ms / out["resumed"], 2) if out["resumed"] else None
+    return out
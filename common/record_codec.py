@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Compact binary telemetry record shared by the publishers and the API.
+#
+# One reading is 14 bytes, little-endian:
+#   magic 0xB1 | flags (1 = temperature, 2 = humidity present) | _ts ms (int64)
+#   | temperature in 1/100 degC (int16) | humidity in 1/100 % (uint16)
+# A batched message is just records back to back. 0xB1 can never start a
+# UTF-8 JSON payload, so receivers can also tell the formats apart by the
+# first byte.
+#
+# Publishers mark the format by publishing to "<topic>/bin"; the API strips
+# the suffix (only when the payload starts with the magic byte, so a JSON
+# publisher that happens to use such a topic keeps it) and stores the reading
+# under the plain topic. Records on other topics are recognized by sniffing.
+#
+# Values are clamped to the field ranges; NaN and infinite readings count as
+# missing, and a reading with neither field is not encoded at all.
+import json, math, struct
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = 0xB1
+TOPIC_SUFFIX = "/bin"
+REC = struct.Struct("<BBqhH")
+HAS_TEMP, HAS_HUM = 1, 2
+
+
+def _finite(v: Any) -> bool:
+    try:
+        return isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+    except OverflowError:       # ints too large for a float
+        return False
+
+
+def _scaled(v: float, lo: int, hi: int) -> int:
+    # v in 1/100 units, clamped; huge finite values overflow to inf once scaled.
+    x = v * 100
+    if not math.isfinite(x):
+        return hi if x > 0 else lo
+    return max(lo, min(hi, round(x)))
+
+
+def encode(temperature: Optional[float], humidity: Optional[float], ts_ms: int) -> Optional[bytes]:
+    # One record, or None when neither value is a finite number.
+    flags = 0
+    t = h = 0
+    if _finite(temperature):
+        flags |= HAS_TEMP
+        t = _scaled(temperature, -32768, 32767)
+    if _finite(humidity):
+        flags |= HAS_HUM
+        h = _scaled(humidity, 0, 65535)
+    if not flags:
+        return None
+    return REC.pack(MAGIC, flags, ts_ms, t, h)
+
+
+def encode_json_line(line: bytes, ts_ms: int) -> Optional[bytes]:
+    # Firmware line '{"temp_c": 21.0, "hum": 40}' -> one record, None if unusable.
+    try:
+        d = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(d, dict):
+        return None
+    return encode(d.get("temperature", d.get("temp_c")), d.get("humidity", d.get("hum")), ts_ms)
+
+
+def is_record(payload: bytes) -> bool:
+    return len(payload) >= REC.size and payload[0] == MAGIC and len(payload) % REC.size == 0
+
+
+def decode(payload: bytes) -> List[Dict[str, Any]]:
+    # One or more records -> normalized rows with temperature/humidity/_ts.
+    if not is_record(payload):
+        raise ValueError(f"not a {REC.size}-byte record stream ({len(payload)} bytes)")
+    rows = []
+    for magic, flags, ts_ms, t, h in REC.iter_unpack(payload):
+        if magic != MAGIC:
+            raise ValueError("bad record magic")
+        row: Dict[str, Any] = {"_ts": ts_ms}
+        if flags & HAS_TEMP:
+            row["temperature"] = t / 100
+        if flags & HAS_HUM:
+            row["humidity"] = h / 100
+        rows.append(row)
+    return rows
+
+
+def split_topic(topic: str, payload: bytes) -> Tuple[str, bool]:
+    # ("team1/sensor/bin", <records>) -> ("team1/sensor", True)
+    if topic.endswith(TOPIC_SUFFIX) and payload[:1] == bytes((MAGIC,)):
+        return topic[:-len(TOPIC_SUFFIX)], True
+    return topic, False
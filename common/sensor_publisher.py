@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Sampling and publish policy shared by the DHT publishers.
+#
+# A reading is taken from a pluggable backend on a worker thread with a
+# timeout, so a stuck or retrying driver never blocks the loop (a read that
+# overruns is left to finish and later reads are skipped until it has). A
+# reading is published only when a field moved by more than its deadband
+# since the last *published* value, or when SENSOR_HEARTBEAT_S passed without
+# a publish, so the API still sees the node alive. The sampling interval
+# adapts: it starts at SENSOR_SAMPLE_MIN_S, grows by SENSOR_SAMPLE_GROWTH
+# after every reading inside the deadband up to SENSOR_SAMPLE_MAX_S, and
+# drops back to the minimum as soon as a change is published.
+#
+# Backends (SENSOR_BACKEND):
+#   dht11, dht22  adafruit-circuitpython-dht on GPIO SENSOR_PIN (default)
+#   legacy        the older Adafruit_DHT driver, single read() without retries
+#   sim           random-walk readings for running on a dev box without a sensor
+#
+#   pub = SensorPublisher.from_env(lambda t, h: client.publish(TOPIC, ...))
+#   pub.run()
+import math, os, random, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional, Tuple
+
+Reading = Tuple[float, float]      # (temperature, humidity)
+
+
+def parse_deadband(spec: str) -> Dict[str, float]:
+    # "temperature:0.5,humidity:2" -> {"temperature": 0.5, "humidity": 2.0}
+    out = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if part:
+            field, delta = part.split(":")
+            out[field.strip()] = float(delta)
+    return out
+
+
+# ---- backends: read() -> (temperature, humidity), RuntimeError on a failed read ----
+
+class CircuitPythonDHT:
+
+    def __init__(self, pin: int, model: str = "dht11"):
+        import board, adafruit_dht
+        cls = adafruit_dht.DHT22 if model == "dht22" else adafruit_dht.DHT11
+        self.device = cls(getattr(board, f"D{pin}"))
+
+    def read(self) -> Reading:
+        t, h = self.device.temperature, self.device.humidity
+        if t is None or h is None:
+            raise RuntimeError("incomplete sensor read")
+        return t, h
+
+
+class LegacyDHT:
+
+    def __init__(self, pin: int, model: str = "dht11"):
+        import Adafruit_DHT
+        self.driver = Adafruit_DHT
+        self.sensor = Adafruit_DHT.DHT22 if model == "dht22" else Adafruit_DHT.DHT11
+        self.pin = pin
+
+    def read(self) -> Reading:
+        # read(), not read_retry(): retries are the publisher's job, with a timeout
+        h, t = self.driver.read(self.sensor, self.pin)
+        if t is None or h is None:
+            raise RuntimeError("sensor read failed")
+        return t, h
+
+
+class SimulatedDHT:
+    # Slow daily cycle plus a random walk, quantized like a DHT11.
+
+    def __init__(self, seed: Optional[int] = None, step: float = 1.0):
+        self.rng = random.Random(seed)
+        self.step = step
+        self.drift = 0.0
+
+    def read(self) -> Reading:
+        self.drift = max(-3.0, min(3.0, self.drift + self.rng.gauss(0, 0.05)))
+        phase = 2 * math.pi * (time.time() % 86400) / 86400
+        t = 21 + 3 * math.sin(phase) + self.drift
+        h = 45 - 8 * math.sin(phase) - 2 * self.drift
+        return round(t / self.step) * self.step, round(h / self.step) * self.step
+
+
+def make_backend(name: str, pin: int = 4):
+    if name in ("dht11", "dht22"):
+        return CircuitPythonDHT(pin, name)
+    if name == "legacy":
+        return LegacyDHT(pin, os.getenv("SENSOR_MODEL", "dht11"))
+    if name == "sim":
+        return SimulatedDHT()
+    raise ValueError(f"unknown SENSOR_BACKEND '{name}' (dht11, dht22, legacy, sim)")
+
+
+class TimedReader:
+    # Backend reads on one worker thread; read() gives up after `timeout` seconds.
+
+    def __init__(self, backend, timeout: float = 3.0):
+        self.backend = backend
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor-read")
+        self._pending = None
+        self.timeouts = 0
+        self.failures = 0
+
+    def read(self) -> Optional[Reading]:
+        fut = self._pending
+        if fut is None:
+            fut = self._pool.submit(self.backend.read)
+        elif not fut.done():
+            return None         # the overrunning read is still going
+        self._pending = None
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            self._pending = fut
+            print(f"[SENSOR] read timed out after {self.timeout:g} s")
+        except RuntimeError as e:
+            self.failures += 1
+            print(f"[SENSOR] {e}")
+        return None
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SensorPublisher:
+
+    def __init__(self, reader: TimedReader, publish: Callable[[float, float], None],
+                 deadband: Optional[Dict[str, float]] = None, heartbeat: float = 300.0,
+                 min_interval: float = 2.0, max_interval: float = 30.0, growth: float = 1.5,
+                 stats_interval: float = 60.0):
+        self.reader = reader
+        self.publish = publish
+        self.deadband = {"temperature": 0.0, "humidity": 0.0, **(deadband or {})}
+        self.heartbeat = heartbeat
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.growth = max(1.0, growth)
+        self.interval = min_interval
+        self.stats_interval = stats_interval
+        self.last: Optional[Dict[str, float]] = None
+        self.last_publish = 0.0
+        self.samples = self.published = self.suppressed = self.heartbeats = 0
+        self._stop = threading.Event()
+        self._stats_t0 = time.monotonic()
+
+    @classmethod
+    def from_env(cls, publish: Callable[[float, float], None], backend=None) -> "SensorPublisher":
+        if backend is None:
+            backend = make_backend(os.getenv("SENSOR_BACKEND", "dht11"),
+                                   int(os.getenv("SENSOR_PIN", os.getenv("DHT11_PIN", "4"))))
+        return cls(TimedReader(backend, float(os.getenv("SENSOR_READ_TIMEOUT_S", "3"))), publish,
+                   deadband=parse_deadband(os.getenv("SENSOR_DEADBAND", "temperature:0.5,humidity:2")),
+                   heartbeat=float(os.getenv("SENSOR_HEARTBEAT_S", "300")),
+                   min_interval=float(os.getenv("SENSOR_SAMPLE_MIN_S", "2")),
+                   max_interval=float(os.getenv("SENSOR_SAMPLE_MAX_S", "30")),
+                   growth=float(os.getenv("SENSOR_SAMPLE_GROWTH", "1.5")),
+                   stats_interval=float(os.getenv("SENSOR_STATS_INTERVAL", "60")))
+
+    def decide(self, values: Dict[str, float], now: float) -> Optional[str]:
+        # Why this reading should be published ("first", "change", "heartbeat"), or None.
+        if self.last is None:
+            return "first"
+        for f, v in values.items():
+            if abs(v - self.last.get(f, math.inf)) > self.deadband.get(f, 0.0):
+                return "change"
+        if now - self.last_publish >= self.heartbeat:
+            return "heartbeat"
+        return None
+
+    def step(self) -> float:
+        # One sample (and maybe one publish); returns the seconds to wait before the next.
+        reading = self.reader.read()
+        now = time.monotonic()
+        if reading is None:
+            return self.min_interval
+        self.samples += 1
+        values = {"temperature": reading[0], "humidity": reading[1]}
+        reason = self.decide(values, now)
+        if reason is None:
+            self.suppressed += 1
+            self.interval = min(self.max_interval, self.interval * self.growth)
+        else:
+            self.publish(*reading)
+            self.published += 1
+            self.last = values
+            self.last_publish = now
+            if reason == "heartbeat":
+                self.heartbeats += 1
+            else:
+                self.interval = self.min_interval
+        # Never sleep past the next heartbeat
+        due = self.last_publish + self.heartbeat - now
+        return max(self.min_interval, min(self.interval, due))
+
+    def stats(self) -> Dict[str, float]:
+        return {"samples": self.samples, "published": self.published,
+                "suppressed": self.suppressed, "heartbeats": self.heartbeats,
+                "read_failures": self.reader.failures, "read_timeouts": self.reader.timeouts,
+                "interval_s": round(self.interval, 2)}
+
+    def _report(self):
+        if self.stats_interval <= 0 or time.monotonic() - self._stats_t0 < self.stats_interval:
+            return
+        s = self.stats()
+        print(f"[SENSOR] {s['samples']} samples, {s['published']} published "
+              f"({s['heartbeats']} heartbeats), {s['suppressed']} within deadband, "
+              f"{s['read_failures']} failed / {s['read_timeouts']} timed-out reads, "
+              f"interval {s['interval_s']:g} s")
+        self._stats_t0 = time.monotonic()
+
+    def run(self):
+        # Until stop() or KeyboardInterrupt.
+        try:
+            while not self._stop.is_set():
+                wait = self.step()
+                self._report()
+                self._stop.wait(wait)
+        finally:
+            self.reader.close()
+
+    def stop(self):
+        self._stop.set()
@@ -1,4 +1,5 @@
-import ssl, paho.mqtt.client as mqtt
+import paho.mqtt.client as mqtt
+from common.client_tls import client_context
 
 HOST="localhost"; PORT=8884; TOPIC="team1/#"
 CA  = "/home/erikosmundsen13/post-quantum-iot-gateway/artifacts/tls/ca/ca.crt"
@@ -12,12 +13,7 @@ def on_connect(c,u,f,rc,p=None):
 def on_msg(c,u,m):
     print(m.topic, m.payload.decode("utf-8","ignore"))
 
-ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=CA)
-ctx.load_cert_chain(certfile=CRT, keyfile=KEY)
-try:
-    ctx.minimum_version = ssl.TLSVersion.TLSv1_3
-except Exception:
-    pass
+ctx = client_context(CA, CRT, KEY)
 
 cli = mqtt.Client(client_id="api-subscriber", clean_session=True, protocol=mqtt.MQTTv311)
 cli.tls_set_context(ctx)
@@ -1,9 +1,8 @@
 import time
 import json
-import board
-import adafruit_dht
 import paho.mqtt.client as mqtt
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -12,11 +11,22 @@ load_dotenv()
 
 # Get project root (two folders up from this file)
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(BASE_DIR))
+from common.record_codec import encode as encode_record, TOPIC_SUFFIX
+from common.client_tls import client_context
+from common.sensor_publisher import SensorPublisher, make_backend
 
 # MQTT settings (from .env or fallback)
 BROKER = os.getenv("BROKER", "localhost")
 TOPIC  = os.getenv("TOPIC", "team1/sensor")
 
+# "json" (default) or "record": 14-byte binary records on <topic>/bin
+RECORDS = os.getenv("PAYLOAD_ENCODING", "json") == "record"
+
+# Publish as retained last-value messages, so a (re)starting API gets every
+# sensor's current reading on subscribe instead of waiting for the next one
+RETAIN = os.getenv("MQTT_RETAIN", "0") == "1"
+
 # TLS certificate paths (absolute paths)
 CA  = BASE_DIR / "artifacts/tls/ca/ca.crt"
 CRT = BASE_DIR / "artifacts/tls/client/client.crt"
@@ -27,18 +37,15 @@ print("CA path:", CA)
 print("CRT path:", CRT)
 print("KEY path:", KEY)
 
-# Setup DHT11
-dhtDevice = adafruit_dht.DHT11(board.D4)
+# Setup DHT11 on GPIO4 (SENSOR_BACKEND=sim runs without the sensor)
+sensor = make_backend(os.getenv("SENSOR_BACKEND", "dht11"), 4)
 
 # Setup MQTT client with TLS
-import ssl
 client = mqtt.Client()
 
-# Use a custom SSL context that disables cert verification
-context = ssl.create_default_context()
-context.check_hostname = False
-context.verify_mode = ssl.CERT_NONE
-context.load_cert_chain(certfile=str(CRT), keyfile=str(KEY))
+# Shared client context (no server cert verification, as before); paho's
+# automatic reconnects resume the TLS session instead of a full handshake
+context = client_context(None, CRT, KEY, verify=False, tls13=False)
 
 client.tls_set_context(context)
 
@@ -46,26 +53,28 @@ client.connect(BROKER, 8884)
 print("Connected to MQTT broker.")
 client.loop_start()
 
-try:
-    while True:
-        try:
-            temperature_c = dhtDevice.temperature
-            humidity = dhtDevice.humidity
+def publish(temperature_c, humidity):
+    if RECORDS:
+        payload = encode_record(temperature_c, humidity, int(time.time() * 1000))
+        if payload is None:
+            print("Skipping non-numeric reading:", temperature_c, humidity)
+            return
+        print("Publishing:", temperature_c, humidity, f"({len(payload)} bytes)")
+        client.publish(TOPIC + TOPIC_SUFFIX, payload, retain=RETAIN)
+    else:
+        payload = json.dumps({
+            "temperature": temperature_c,
+            "humidity": humidity
+        })
+        print("Publishing:", payload)
+        client.publish(TOPIC, payload, retain=RETAIN)
 
-            if humidity is not None and temperature_c is not None:
-                payload = json.dumps({
-                    "temperature": temperature_c,
-                    "humidity": humidity
-                })
-                print("Publishing:", payload)
-                client.publish(TOPIC, payload)
-            else:
-                print("Incomplete sensor read.")
-
-        except RuntimeError as e:
-            print("Sensor error:", e)
-        time.sleep(2)
+# Publishes on change beyond SENSOR_DEADBAND or every SENSOR_HEARTBEAT_S,
+# sampling every SENSOR_SAMPLE_MIN_S..SENSOR_SAMPLE_MAX_S seconds
+publisher = SensorPublisher.from_env(publish, sensor)
 
+try:
+    publisher.run()
 except KeyboardInterrupt:
     print("Stopping script...")
 finally:
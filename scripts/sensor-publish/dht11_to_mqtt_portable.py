@@ -1,9 +1,8 @@
 import time
 import json
-import board
-import adafruit_dht
 import paho.mqtt.client as mqtt
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -12,6 +11,10 @@ load_dotenv()
 
 # Get project root (two folders up from this file)
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(BASE_DIR))
+from common.record_codec import encode as encode_record, TOPIC_SUFFIX
+from common.client_tls import client_context
+from common.sensor_publisher import SensorPublisher, make_backend
 
 # MQTT settings (from .env or fallback)
 BROKER = os.getenv("MQTT_BROKER_HOST", "localhost")
@@ -19,6 +22,13 @@ PORT = int(os.getenv("MQTT_BROKER_PORT", "8884"))
 TOPIC = os.getenv("MQTT_TOPIC", "team1/sensor")
 CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "dht11-portable")
 
+# "json" (default) or "record": 14-byte binary records on <topic>/bin
+RECORDS = os.getenv("MQTT_PAYLOAD_ENCODING", "json") == "record"
+
+# Publish as retained last-value messages, so a (re)starting API gets every
+# sensor's current reading on subscribe instead of waiting for the next one
+RETAIN = os.getenv("MQTT_RETAIN", "0") == "1"
+
 # TLS certificate paths (absolute paths)
 CA = os.getenv("MQTT_CA_CERT")
 CRT = os.getenv("MQTT_CLIENT_CERT")
@@ -29,24 +39,18 @@ print("CA path:", CA)
 print("CRT path:", CRT)
 print("KEY path:", KEY)
 
-# Setup DHT11
+# Setup DHT11 (SENSOR_BACKEND=dht11|dht22|legacy|sim; sim runs without the sensor)
 DHT_PIN = int(os.getenv("DHT11_PIN", "4"))
 
-# Convert pin number to board pin
-pin = getattr(board, f"D{DHT_PIN}")
-
-dhtDevice = adafruit_dht.DHT11(pin)
+sensor = make_backend(os.getenv("SENSOR_BACKEND", "dht11"), DHT_PIN)
 
 
 # Setup MQTT client with TLS
-import ssl
 client = mqtt.Client(client_id=CLIENT_ID)
 
-# Use a custom SSL context that disables cert verification
-context = ssl.create_default_context()
-context.check_hostname = False
-context.verify_mode = ssl.CERT_NONE
-context.load_cert_chain(certfile=str(CRT), keyfile=str(KEY))
+# Shared client context (no server cert verification, as before); paho's
+# automatic reconnects resume the TLS session instead of a full handshake
+context = client_context(None, CRT, KEY, verify=False, tls13=False)
 
 client.tls_set_context(context)
 
@@ -54,26 +58,28 @@ client.connect(BROKER, PORT)
 print("Connected to MQTT broker.")
 client.loop_start()
 
-try:
-    while True:
-        try:
-            temperature_c = dhtDevice.temperature
-            humidity = dhtDevice.humidity
-
-            if humidity is not None and temperature_c is not None:
-                payload = json.dumps({
-                    "temperature": temperature_c,
-                    "humidity": humidity
-                })
-                print("Publishing:", payload)
-                client.publish(TOPIC, payload)
-            else:
-                print("Incomplete sensor read.")
-
-        except RuntimeError as e:
-            print("Sensor error:", e)
-        time.sleep(2)
+def publish(temperature_c, humidity):
+    if RECORDS:
+        payload = encode_record(temperature_c, humidity, int(time.time() * 1000))
+        if payload is None:
+            print("Skipping non-numeric reading:", temperature_c, humidity)
+            return
+        print("Publishing:", temperature_c, humidity, f"({len(payload)} bytes)")
+        client.publish(TOPIC + TOPIC_SUFFIX, payload, retain=RETAIN)
+    else:
+        payload = json.dumps({
+            "temperature": temperature_c,
+            "humidity": humidity
+        })
+        print("Publishing:", payload)
+        client.publish(TOPIC, payload, retain=RETAIN)
+
+# Publishes on change beyond SENSOR_DEADBAND or every SENSOR_HEARTBEAT_S,
+# sampling every SENSOR_SAMPLE_MIN_S..SENSOR_SAMPLE_MAX_S seconds
+publisher = SensorPublisher.from_env(publish, sensor)
 
+try:
+    publisher.run()
 except KeyboardInterrupt:
     print("Stopping script...")
 finally:
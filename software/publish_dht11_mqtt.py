@@ -1,18 +1,17 @@
-import Adafruit_DHT
-import time
+import os
+import sys
 import paho.mqtt.client as mqtt
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))   # repo root, for common/
+from common.sensor_publisher import SensorPublisher, make_backend
 
-SENSOR = Adafruit_DHT.DHT11
 PIN = 4
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_TOPIC = "sensor/data"
 
-def read_sensor():
-    humidity, temperature = Adafruit_DHT.read_retry(SENSOR, PIN)
-    return humidity, temperature
-
 def publish_data(client, humidity, temperature):
     payload = f"Temperature: {temperature:.1f}°C, Humidity: {humidity:.1f}%"
     client.publish(MQTT_TOPIC, payload)
@@ -21,18 +20,20 @@ def publish_data(client, humidity, temperature):
 def main():
     client = mqtt.Client()
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+
+    # Adafruit_DHT without read_retry; the publisher retries with a timeout and
+    # only publishes changes beyond SENSOR_DEADBAND (plus a SENSOR_HEARTBEAT_S heartbeat).
+    sensor = make_backend(os.getenv("SENSOR_BACKEND", "legacy"), PIN)
+    publisher = SensorPublisher.from_env(lambda t, h: publish_data(client, h, t), sensor)
 
     print("Publishing DHT11 data to MQTT... Press Ctrl+C to stop.")
     try:
-        while True:
-            humidity, temperature = read_sensor()
-            if humidity is not None and temperature is not None:
-                publish_data(client, humidity, temperature)
-            else:
-                print("Sensor read failed. Retrying...")
-            time.sleep(2)
+        publisher.run()
     except KeyboardInterrupt:
         print("Stopped.")
+    finally:
+        client.loop_stop()
         client.disconnect()
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Bulk-read, batching main loop shared by the serial bridges.
+#
+# Serial input is read in whatever chunk size is waiting and framed into
+# lines in one bytearray. A JSON-object line is checked with json.loads
+# (BRIDGE_VALIDATE=1, the default) or, with BRIDGE_VALIDATE=0, only for
+# balanced quotes/braces and stray control bytes, so garbled serial lines are
+# dropped here and never overwrite a topic's latest row at the API. It is then
+# stamped with "_ts" (unless the device sent one) by splicing bytes before the
+# closing brace, so lines are never re-encoded. Stamped lines are either published one by one
+# (BRIDGE_BATCH_WINDOW_MS=0, the old behaviour) or coalesced for up to the
+# window / BRIDGE_BATCH_MAX lines into one newline-delimited message, which
+# the API splits back into individual readings. With
+# BRIDGE_PAYLOAD_ENCODING=record each reading is instead converted to a 14-byte
+# binary record (common/record_codec.py) and published to "<topic>/bin";
+# batches are then records back to back. QoS 1 publishes are
+# pipelined up to MQTT_MAX_INFLIGHT unacknowledged messages. With
+# BRIDGE_SPOOL_DIR set, publishes go through the disk spool (spool.py) so a
+# broker outage does not lose readings or grow memory.
+import os, re, sys, json, time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from spool import configure_queue, make_publisher, RETAIN
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))   # repo root, for common/
+from common.record_codec import encode_json_line, TOPIC_SUFFIX
+
+BATCH_WINDOW_MS = int(os.getenv("BRIDGE_BATCH_WINDOW_MS", "0"))
+BATCH_MAX = int(os.getenv("BRIDGE_BATCH_MAX", "50"))
+VALIDATE = os.getenv("BRIDGE_VALIDATE", "1") == "1"
+MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", "100"))
+STATS_INTERVAL = float(os.getenv("BRIDGE_STATS_INTERVAL", "10"))
+RECORDS = os.getenv("BRIDGE_PAYLOAD_ENCODING", "json") == "record"
+SEP = b"" if RECORDS else b"\n"
+
+
+class LineFramer:
+    # Accumulates raw serial bytes and hands back complete, stripped lines.
+
+    def __init__(self, max_line: int = 4096):
+        self.buf = bytearray()
+        self.max_line = max_line
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self.buf += data
+        end = self.buf.rfind(b"\n")
+        if end < 0:
+            if len(self.buf) > self.max_line:
+                self.buf.clear()        # no newline in sight: garbage or wrong baud
+            return []
+        chunk = bytes(self.buf[:end])
+        del self.buf[:end + 1]
+        return [l.strip() for l in chunk.split(b"\n")]
+
+
+_CONTROL = re.compile(rb"[\x00-\x08\x0b-\x1f\x7f]")
+
+
+def plausible(line: bytes) -> bool:
+    # Cheap check for truncated or merged serial lines: balanced quotes and
+    # braces/brackets, no control bytes.
+    if (line.count(b'"') - line.count(b'\\"')) & 1:
+        return False
+    if line.count(b"{") != line.count(b"}") or line.count(b"[") != line.count(b"]"):
+        return False
+    return _CONTROL.search(line) is None
+
+
+def stamp(line: bytes, ts_ms: int) -> Optional[bytes]:
+    # '{"temp_c":21.0}' -> '{"temp_c":21.0,"_ts":<ms>}' without re-encoding.
+    if not (line.startswith(b"{") and line.endswith(b"}")):
+        return None
+    if VALIDATE:
+        try:
+            json.loads(line)
+        except ValueError as e:
+            print(f"[JSON] bad line: {e}", file=sys.stderr)
+            return None
+    elif not plausible(line):
+        print(f"[JSON] bad line: {line[:80]!r}", file=sys.stderr)
+        return None
+    if b'"_ts"' in line:
+        return line                 # the device's own timestamp wins
+    body = line[1:-1].strip()
+    sep = b"," if body else b""
+    return b"{" + body + sep + b'"_ts":' + str(ts_ms).encode() + b"}"
+
+
+def frame(line: bytes, ts_ms: int) -> Optional[bytes]:
+    # One reading in the configured wire format, or None to skip the line.
+    if RECORDS:
+        return encode_json_line(line, ts_ms) if line.startswith(b"{") else None
+    return stamp(line, ts_ms)
+
+
+def wire_topic(topic: str) -> str:
+    return topic + TOPIC_SUFFIX if RECORDS else topic
+
+
+class RateMeter:
+    # Prints readings/s, messages/s and acked/s every STATS_INTERVAL seconds.
+
+    def __init__(self, interval: float = STATS_INTERVAL):
+        self.interval = interval
+        self.readings = self.messages = self.acked = 0
+        self.t0 = time.monotonic()
+
+    def on_publish(self, *_):
+        self.acked += 1
+
+    def tick(self):
+        dt = time.monotonic() - self.t0
+        if self.interval <= 0 or dt < self.interval:
+            return
+        print(f"[RATE] {self.readings / dt:.1f} readings/s, {self.messages / dt:.1f} msgs/s, "
+              f"{self.acked / dt:.1f} acked/s")
+        self.readings = self.messages = self.acked = 0
+        self.t0 = time.monotonic()
+
+
+def configure_client(cli):
+    # Before connecting: pipeline QoS 1 publishes instead of the paho default of
+    # 20 in flight, and cap the publish queue when spooling.
+    cli.max_inflight_messages_set(MAX_INFLIGHT)
+    configure_queue(cli)
+
+
+def run_bridge(ser, cli, topic: str, running: Callable[[], bool],
+               publish: Optional[Callable[[str, bytes], None]] = None):
+    spooler = make_publisher(cli) if publish is None else None
+    if spooler:
+        publish = spooler.publish
+    publish = publish or (lambda t, p: cli.publish(t, p, qos=1, retain=RETAIN))
+    topic = wire_topic(topic)
+    framer = LineFramer()
+    meter = RateMeter()
+    cli.on_publish = meter.on_publish
+    pending: List[bytes] = []
+    window = BATCH_WINDOW_MS / 1000.0
+    deadline = 0.0
+    if window > 0:
+        ser.timeout = min(ser.timeout or 1, window)   # wake up in time to flush
+
+    def flush():
+        nonlocal pending
+        if pending:
+            publish(topic, SEP.join(pending))
+            meter.messages += 1
+            pending = []
+
+    while running():
+        data = ser.read(ser.in_waiting or 1)
+        now = time.time()
+        if data:
+            ts_ms = int(now * 1000)
+            for line in framer.feed(data):
+                rec = frame(line, ts_ms)
+                if rec is None:
+                    continue
+                meter.readings += 1
+                if window <= 0:
+                    publish(topic, rec)
+                    meter.messages += 1
+                    continue
+                if not pending:
+                    deadline = now + window
+                pending.append(rec)
+                if len(pending) >= BATCH_MAX:
+                    flush()
+        if pending and now >= deadline:
+            flush()
+        if spooler:
+            spooler.pump()
+        meter.tick()
+    flush()
+    if spooler:
+        spooler.spool.close()
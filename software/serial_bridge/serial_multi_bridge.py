@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Multi-device serial bridge: one asyncio process supervising many serial ports
+# and publishing all of them over a single shared mTLS MQTT connection.
+#
+# Ports are discovered with SERIAL_GLOB (comma-separated globs) and rescanned
+# every SERIAL_RESCAN_S seconds, so hot-plugged boards are picked up and
+# unplugged ones are retried with exponential backoff until they disappear.
+# Each port is read non-blocking on the event loop and published to its own
+# topic: an explicit SERIAL_TOPIC_MAP entry, or MQTT_TOPIC_TEMPLATE with
+# {name} set to the device name (ttyACM0 -> team1/ttyACM0).
+#
+# Line framing, _ts stamping, payload encoding and batching are the same as
+# the single-port bridge (see batching.py), and so is the BRIDGE_SPOOL_DIR disk
+# spool for broker outages (see spool.py). For a dev box without hardware:
+#   python3 serial_multi_bridge.py --simulate 4
+# opens 4 pseudo-terminal pairs, feeds synthetic readings into the master
+# sides and bridges the slave sides exactly like real devices.
+#
+# MQTT_CAFILE, MQTT_CLIENT_CERT and MQTT_CLIENT_KEY are required; --plaintext
+# skips TLS for a local test broker only and says so at startup.
+import os, sys, glob, time, signal, asyncio, random, termios, tty, fcntl, struct, argparse
+import paho.mqtt.client as mqtt
+from batching import (LineFramer, frame, wire_topic, RateMeter, configure_client,
+                      BATCH_WINDOW_MS, BATCH_MAX, SEP)
+from spool import make_publisher, RETAIN
+from common.client_tls import client_context
+
+# === Portable configuration ===
+
+SERIAL_GLOB = os.getenv("SERIAL_GLOB", "/dev/ttyACM*,/dev/ttyUSB*")
+SERIAL_BAUD = int(os.getenv("SERIAL_BAUD", "9600"))
+RESCAN_S = float(os.getenv("SERIAL_RESCAN_S", "5"))
+TOPIC_TEMPLATE = os.getenv("MQTT_TOPIC_TEMPLATE", "team1/{name}")
+TOPIC_MAP = dict(
+    item.split("=", 1) for item in os.getenv("SERIAL_TOPIC_MAP", "").split(",") if "=" in item
+)
+
+MQTT_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_BROKER_PORT", "8884"))
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "serial-multi-bridge")
+MQTT_CAFILE = os.getenv("MQTT_CAFILE")
+MQTT_CLIENT_CERT = os.getenv("MQTT_CLIENT_CERT")
+MQTT_CLIENT_KEY = os.getenv("MQTT_CLIENT_KEY")
+
+SPEED = getattr(termios, f"B{SERIAL_BAUD}", None)      # checked in main()
+
+
+def topic_for(path):
+    return TOPIC_MAP.get(path) or TOPIC_TEMPLATE.format(name=os.path.basename(path))
+
+
+def open_port(path):
+    # Raw, non-blocking tty at SERIAL_BAUD; pulse DTR like the single-port bridge.
+    # Blocks for the DTR pulse: run it in an executor, not on the event loop.
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[4] = attrs[5] = SPEED
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        try:
+            dtr = struct.pack("I", termios.TIOCM_DTR)
+            fcntl.ioctl(fd, termios.TIOCMBIC, dtr); time.sleep(0.1)
+            fcntl.ioctl(fd, termios.TIOCMBIS, dtr)
+        except OSError:
+            pass                            # pty or adapter without modem lines
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+class Port:
+    # One supervised serial device: read loop plus reconnect/backoff.
+
+    def __init__(self, bridge, path):
+        self.bridge = bridge
+        self.path = path
+        self.topic = wire_topic(topic_for(path))
+        self.framer = LineFramer()
+        self.pending = []
+        self.flush_handle = None
+        self.readings = 0
+        self.reopens = 0
+
+    def _flush(self):
+        self.flush_handle = None
+        if self.pending:
+            self.bridge.publish(self.topic, SEP.join(self.pending))
+            self.pending = []
+
+    def _on_data(self, data):
+        ts_ms = int(time.time() * 1000)
+        for line in self.framer.feed(data):
+            rec = frame(line, ts_ms)
+            if rec is None:
+                continue
+            self.readings += 1
+            self.bridge.meter.readings += 1
+            if BATCH_WINDOW_MS <= 0:
+                self.bridge.publish(self.topic, rec)
+                continue
+            self.pending.append(rec)
+            if len(self.pending) >= BATCH_MAX:
+                if self.flush_handle:
+                    self.flush_handle.cancel()
+                self._flush()
+            elif self.flush_handle is None:
+                loop = asyncio.get_running_loop()
+                self.flush_handle = loop.call_later(BATCH_WINDOW_MS / 1000.0, self._flush)
+
+    async def _read_until_closed(self, fd) -> bool:
+        # Read until EOF/error; True if any data arrived.
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+        got_data = False
+
+        def readable():
+            nonlocal got_data
+            try:
+                data = os.read(fd, 4096)
+            except BlockingIOError:
+                return
+            except OSError as e:                # EIO on unplug / pty hangup
+                data = b""
+                print(f"[SER] {self.path}: {e}", file=sys.stderr)
+            if not data:
+                if not closed.done():
+                    closed.set_result(None)
+                return
+            got_data = True
+            self._on_data(data)
+
+        loop.add_reader(fd, readable)
+        try:
+            await closed
+        finally:
+            loop.remove_reader(fd)
+        return got_data
+
+    async def run(self):
+        backoff = 1
+        loop = asyncio.get_running_loop()
+        while self.bridge.running and os.path.exists(self.path):
+            try:
+                fd = await loop.run_in_executor(None, open_port, self.path)
+            except OSError as e:
+                print(f"[SER] open {self.path} failed: {e}; retry in {backoff}s", file=sys.stderr)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            print(f"[SER] {self.path}@{SERIAL_BAUD} -> {self.topic}")
+            try:
+                got_data = await self._read_until_closed(fd)
+            finally:
+                os.close(fd)
+                self._flush()
+            self.reopens += 1
+            # Only a port that delivered data resets the backoff; one that opens
+            # and hits EOF straight away is retried like a failed open.
+            if got_data:
+                backoff = 1
+            await asyncio.sleep(backoff)
+            if not got_data:
+                backoff = min(backoff * 2, 30)
+        print(f"[SER] {self.path} gone")
+
+
+class MultiBridge:
+
+    def __init__(self, globs, tls=True):
+        self.globs = globs
+        self.tls = tls
+        self.ports = {}
+        self.running = True
+        self.meter = RateMeter()
+        self.cli = None
+        self.spooler = None
+
+    def open_mqtt(self):
+        c = mqtt.Client(client_id=MQTT_CLIENT_ID, clean_session=True)
+        if self.tls:
+            c.tls_set_context(client_context(MQTT_CAFILE, MQTT_CLIENT_CERT, MQTT_CLIENT_KEY, tls13=False))
+        configure_client(c)
+        c.reconnect_delay_set(min_delay=1, max_delay=30)
+        c.on_publish = self.meter.on_publish
+        c.connect_async(MQTT_HOST, MQTT_PORT, keepalive=30)
+        c.loop_start()
+        self.cli = c
+        self.spooler = make_publisher(c)
+
+    def publish(self, topic, payload):
+        if self.spooler:
+            self.spooler.publish(topic, payload)
+        else:
+            self.cli.publish(topic, payload, qos=1, retain=RETAIN)
+        self.meter.messages += 1
+
+    def scan(self):
+        found = set()
+        for pattern in self.globs:
+            found.update(glob.glob(pattern))
+        return found
+
+    async def run(self):
+        self.open_mqtt()
+        scheme = "mqtts" if self.tls else "mqtt"
+        print(f"[RUN] {', '.join(self.globs)} -> {scheme}://{MQTT_HOST}:{MQTT_PORT}")
+        if not self.tls:
+            print("[RUN] WARNING: --plaintext: MQTT traffic is NOT encrypted or authenticated",
+                  file=sys.stderr)
+        tasks = {}
+        last_scan = 0.0
+        while self.running:
+            if time.monotonic() - last_scan >= RESCAN_S:
+                last_scan = time.monotonic()
+                for path in sorted(self.scan()):
+                    task = tasks.get(path)
+                    if task is None or task.done():
+                        port = self.ports.get(path) or Port(self, path)
+                        self.ports[path] = port
+                        tasks[path] = asyncio.create_task(port.run())
+            self.meter.tick()
+            if self.spooler:
+                self.spooler.pump()
+            await asyncio.sleep(0.1 if self.spooler else 1.0)
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        if self.spooler:
+            self.spooler.spool.close()
+        self.cli.loop_stop(); self.cli.disconnect()
+
+    def stop(self, *_):
+        self.running = False
+
+
+def simulate(n):
+    # Create n pty pairs and keep writing fake DHT readings into the masters.
+    import pty, threading
+    paths, masters = [], []
+    for _ in range(n):
+        m, s = pty.openpty()
+        paths.append(os.ttyname(s)); masters.append(m)
+
+    def feed():
+        while True:
+            for m in masters:
+                line = '{"temp_c": %.1f, "hum": %.1f}\n' % (
+                    20 + random.random() * 5, 40 + random.random() * 10)
+                try:
+                    os.write(m, line.encode())
+                except OSError:
+                    pass
+            time.sleep(float(os.getenv("SIM_INTERVAL_S", "1")))
+
+    threading.Thread(target=feed, daemon=True).start()
+    print(f"[SIM] simulated devices: {', '.join(paths)}")
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bridge many serial ports to MQTT")
+    ap.add_argument("--simulate", type=int, default=0,
+                    help="bridge N pseudo-terminals fed with synthetic readings")
+    ap.add_argument("--plaintext", action="store_true",
+                    help="connect without TLS (local test broker only)")
+    args = ap.parse_args()
+    if SPEED is None:
+        ap.error(f"SERIAL_BAUD={SERIAL_BAUD} is not a baud rate termios supports")
+    if not args.plaintext and not (MQTT_CAFILE and MQTT_CLIENT_CERT and MQTT_CLIENT_KEY):
+        ap.error("set MQTT_CAFILE, MQTT_CLIENT_CERT and MQTT_CLIENT_KEY "
+                 "(or pass --plaintext for a local test broker)")
+    globs = [g.strip() for g in SERIAL_GLOB.split(",") if g.strip()]
+    if args.simulate:
+        globs = simulate(args.simulate)
+    bridge = MultiBridge(globs, tls=not args.plaintext)
+    loop = asyncio.new_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, bridge.stop)
+    loop.run_until_complete(bridge.run())
+
+
+if __name__ == "__main__": main()
@@ -1,6 +1,8 @@
-import os, sys, json, time, signal
+import os, sys, time, signal
 import serial
 import paho.mqtt.client as mqtt
+from batching import run_bridge, configure_client
+from common.client_tls import client_context   # batching puts the repo root on sys.path
 
 SERIAL_PORT = os.getenv("SERIAL_PORT", "/dev/ttyACM0")
 SERIAL_BAUD = int(os.getenv("SERIAL_BAUD", "115200"))
@@ -32,31 +34,20 @@ def open_serial():
             time.sleep(1)
 
 def open_mqtt():
+    # connect_async + loop_start: paho keeps (re)connecting in the background, so
+    # the bridge reads (and, with BRIDGE_SPOOL_DIR, spools) before the broker is up.
     c=mqtt.Client(client_id="serial-publisher", clean_session=True)
-    c.tls_set(ca_certs=CAFILE)
-    while running:
-        try:
-            c.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
-            c.loop_start()
-            return c
-        except Exception as e:
-            print(f"[MQTT] connect failed: {e}; retrying...", file=sys.stderr)
-            time.sleep(1)
+    c.tls_set_context(client_context(CAFILE, tls13=False))
+    configure_client(c)
+    c.reconnect_delay_set(min_delay=1, max_delay=30)
+    c.connect_async(MQTT_HOST, MQTT_PORT, keepalive=30)
+    c.loop_start()
+    return c
 
 def main():
     ser=open_serial(); cli=open_mqtt()
     print(f"[RUN] {SERIAL_PORT}@{SERIAL_BAUD} -> mqtts://{MQTT_HOST}:{MQTT_PORT}/{MQTT_TOPIC}")
-    while running:
-        line=ser.readline()
-        if not line: continue
-        line=line.strip()
-        if not(line.startswith(b"{") and line.endswith(b"}")): continue
-        try:
-            payload=json.loads(line.decode("utf-8"))
-        except Exception as e:
-            print(f"[JSON] bad line: {e}", file=sys.stderr); continue
-        payload["_ts"]=int(time.time()*1000)
-        cli.publish(MQTT_TOPIC, json.dumps(payload), qos=1)
+    run_bridge(ser, cli, MQTT_TOPIC, lambda: running)
     ser.close(); cli.loop_stop(); cli.disconnect()
 
 if __name__=="__main__": main()
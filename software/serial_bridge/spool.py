@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# Store-and-forward disk spool for the serial bridges.
+#
+# While the broker is unreachable, or paho's bounded publish queue is full,
+# readings are appended to spool-NNNNNNNN.seg files in BRIDGE_SPOOL_DIR
+# instead of piling up in memory. Once anything is spooled, every new reading
+# goes to the spool too, so the broker always receives readings in _ts order.
+# After reconnecting the spool is replayed oldest first at up to
+# BRIDGE_SPOOL_DRAIN_RATE messages/s. A segment is deleted once all of its
+# QoS 1 publishes are acknowledged, and the acknowledged position is kept in
+# a cursor file so a restart resumes where it stopped. Total size
+# (BRIDGE_SPOOL_MAX_MB) and age (BRIDGE_SPOOL_MAX_AGE_H) are capped by
+# dropping the oldest segments.
+#
+# Record format: <payload_len:u32><topic_len:u16><topic utf-8><payload>
+import os, glob, struct, time
+from collections import deque
+from typing import List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+SPOOL_DIR = os.getenv("BRIDGE_SPOOL_DIR", "")
+SPOOL_MAX_MB = float(os.getenv("BRIDGE_SPOOL_MAX_MB", "64"))
+SPOOL_SEGMENT_KB = int(os.getenv("BRIDGE_SPOOL_SEGMENT_KB", "1024"))
+SPOOL_MAX_AGE_H = float(os.getenv("BRIDGE_SPOOL_MAX_AGE_H", "72"))
+SPOOL_DRAIN_RATE = float(os.getenv("BRIDGE_SPOOL_DRAIN_RATE", "200"))
+SPOOL_QUEUE_MAX = int(os.getenv("BRIDGE_SPOOL_QUEUE_MAX", "1000"))
+STATS_INTERVAL = float(os.getenv("BRIDGE_STATS_INTERVAL", "10"))
+# Retained publishes: the broker keeps each topic's last message for new subscribers
+RETAIN = os.getenv("MQTT_RETAIN", "0") == "1"
+
+REC = struct.Struct("<IH")
+
+
+class DiskSpool:
+
+    def __init__(self, directory: str, segment_bytes: int = 1 << 20,
+                 max_bytes: int = 64 << 20, max_age_s: float = 72 * 3600):
+        self.dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.dropped_records = 0
+        self._w = None                      # active write segment file
+        self._wseq = self._seqs()[-1] + 1 if self._seqs() else 1
+        self._rseq, self._roff = self._load_cursor()
+        self._rfile = None
+        self.records = sum(self._count(self._path(s), self._roff if s == self._rseq else 0)
+                           for s in self._seqs() if s >= self._rseq)
+
+    # ---- segments and cursor ----
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"spool-{seq:08d}.seg")
+
+    def _seqs(self) -> List[int]:
+        return sorted(int(os.path.basename(p)[6:14]) for p in glob.glob(os.path.join(self.dir, "spool-*.seg")))
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.dir, "cursor")) as f:
+                seq, off = f.read().split()
+                return int(seq), int(off)
+        except (OSError, ValueError):
+            seqs = self._seqs()
+            return (seqs[0] if seqs else 1), 0
+
+    def _save_cursor(self, seq: int, off: int):
+        tmp = os.path.join(self.dir, "cursor.tmp")
+        with open(tmp, "w") as f:
+            f.write(f"{seq} {off}\n")
+        os.replace(tmp, os.path.join(self.dir, "cursor"))
+
+    def _seal(self):
+        if self._w:
+            self._w.close()
+            self._w = None
+            self._wseq += 1
+
+    def size_bytes(self) -> int:
+        total = 0
+        for seq in self._seqs():
+            if seq >= self._rseq:
+                try:
+                    total += os.path.getsize(self._path(seq))
+                except OSError:
+                    pass
+        return max(0, total - self._roff)
+
+    def empty(self) -> bool:
+        return self.records == 0
+
+    # ---- write side ----
+
+    def append(self, topic: str, payload: bytes):
+        if self._w is None:
+            self._w = open(self._path(self._wseq), "ab")
+        t = topic.encode("utf-8")
+        self._w.write(REC.pack(len(payload), len(t)) + t + payload)
+        self._w.flush()
+        self.records += 1
+        if self._w.tell() >= self.segment_bytes:
+            self._seal()
+            self.enforce_caps()
+
+    def enforce_caps(self):
+        seqs = self._seqs()
+        now = time.time()
+        total = sum(os.path.getsize(self._path(s)) for s in seqs)
+        for seq in seqs[:-1]:               # never drop the segment being written
+            p = self._path(seq)
+            too_old = now - os.path.getmtime(p) > self.max_age_s
+            if total <= self.max_bytes and not too_old:
+                break
+            size = os.path.getsize(p)
+            if seq >= self._rseq:
+                lost = self._count(p, self._roff if seq == self._rseq else 0)
+                self.dropped_records += lost
+                self.records -= lost
+                self._close_reader()
+                self._rseq, self._roff = seq + 1, 0
+                self._save_cursor(self._rseq, 0)
+            os.remove(p)
+            total -= size
+            print(f"[SPOOL] dropped {os.path.basename(p)} (size/age cap)")
+
+    def _count(self, path: str, start: int = 0) -> int:
+        n = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            while True:
+                hdr = f.read(REC.size)
+                if len(hdr) < REC.size:
+                    return n
+                plen, tlen = REC.unpack(hdr)
+                f.seek(tlen + plen, os.SEEK_CUR)
+                n += 1
+
+    # ---- read side ----
+
+    def _close_reader(self):
+        if self._rfile:
+            self._rfile.close()
+            self._rfile = None
+
+    def read(self, max_n: int) -> List[Tuple[str, bytes, int, int, int]]:
+        # Next records as (topic, payload, seq, start_offset, end_offset), oldest
+        # first. The segment being written is read up to its current end (every
+        # append is flushed whole) and stays open for appends.
+        out = []
+        while len(out) < max_n:
+            active = self._rseq == self._wseq
+            if self._rseq > self._wseq or (active and self._w is None):
+                break
+            if self._rfile is None:
+                try:
+                    self._rfile = open(self._path(self._rseq), "rb")
+                    self._rfile.seek(self._roff)
+                except OSError:
+                    if active:
+                        break
+                    self._rseq, self._roff = self._rseq + 1, 0
+                    continue
+            hdr = self._rfile.read(REC.size)
+            plen, tlen = REC.unpack(hdr) if len(hdr) == REC.size else (0, 0)
+            body = self._rfile.read(tlen + plen) if len(hdr) == REC.size else b""
+            if len(hdr) < REC.size or len(body) < tlen + plen:
+                if active:                  # caught up with the writer
+                    self._rfile.seek(self._roff)
+                    break
+                self._close_reader()        # end of segment, or a torn tail from a crash
+                self._rseq, self._roff = self._rseq + 1, 0
+                continue
+            start, self._roff = self._roff, self._rfile.tell()
+            self.records -= 1
+            out.append((body[:tlen].decode("utf-8"), body[tlen:], self._rseq, start, self._roff))
+        return out
+
+    def rewind(self, seq: int, off: int, n: int):
+        # Put back the last n records read, the first of which starts at (seq, off).
+        self._close_reader()
+        self._rseq, self._roff = seq, off
+        self.records += n
+
+    def commit(self, seq: int, off: int):
+        # Everything before (seq, off) is acknowledged: drop finished segments.
+        for s in self._seqs():
+            if s < seq:
+                os.remove(self._path(s))
+        self._save_cursor(seq, off)
+
+    def close(self):
+        self._close_reader()
+        if self._w:
+            self._w.close()
+            self._w = None
+
+
+class SpoolingPublisher:
+    # Publishes directly while connected and idle; otherwise spools, then replays.
+
+    def __init__(self, cli, spool: DiskSpool, drain_rate: float = SPOOL_DRAIN_RATE,
+                 stats_interval: float = STATS_INTERVAL):
+        self.cli = cli
+        self.spool = spool
+        self.drain_rate = drain_rate
+        self.stats_interval = stats_interval
+        self.spooled = 0
+        self.replayed = 0
+        self._inflight = deque()            # (seq, end_offset, MQTTMessageInfo)
+        self._budget = 0.0
+        self._last = time.monotonic()
+        self._t0 = time.monotonic()
+        self._replayed_window = 0
+
+    def publish(self, topic: str, payload: bytes):
+        if self.cli.is_connected() and self.spool.empty() and not self._inflight:
+            info = self.cli.publish(topic, payload, qos=1, retain=RETAIN)
+            # NO_CONN still queues the message in paho (sent on reconnect); only a
+            # full queue means it was not taken
+            if info.rc != mqtt.MQTT_ERR_QUEUE_SIZE:
+                return
+        self.spool.append(topic, payload)
+        self.spooled += 1
+
+    def pump(self):
+        # Call often from the bridge loop: acks, paced replay, periodic report.
+        now = time.monotonic()
+        self._budget = min(self._budget + (now - self._last) * self.drain_rate,
+                           max(self.drain_rate, 1.0))
+        self._last = now
+        done = None
+        while self._inflight and self._inflight[0][2].is_published():
+            done = self._inflight.popleft()
+        if done:
+            self.spool.commit(done[0], done[1])
+        if self.cli.is_connected() and self._budget >= 1:
+            batch = self.spool.read(int(self._budget))
+            for i, (topic, payload, seq, start, off) in enumerate(batch):
+                info = self.cli.publish(topic, payload, qos=1, retain=RETAIN)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    # queue full or connection lost: keep the rest spooled for later
+                    self.spool.rewind(seq, start, len(batch) - i)
+                    break
+                self._inflight.append((seq, off, info))
+                self._budget -= 1
+                self.replayed += 1
+                self._replayed_window += 1
+        self._report(now)
+
+    def _report(self, now: float):
+        dt = now - self._t0
+        if self.stats_interval <= 0 or dt < self.stats_interval:
+            return
+        if self._replayed_window or not self.spool.empty():
+            print(f"[SPOOL] {self.spool.records} readings / "
+                  f"{self.spool.size_bytes() / 1024:.1f} KiB pending, "
+                  f"replay {self._replayed_window / dt:.1f} msgs/s, "
+                  f"spooled {self.spooled}, replayed {self.replayed}, "
+                  f"dropped {self.spool.dropped_records}")
+        self.spool.enforce_caps()
+        self._replayed_window = 0
+        self._t0 = now
+
+
+def configure_queue(cli):
+    # Cap paho's publish queue so that beyond it publish() fails and we spool.
+    # paho only accepts this before the first connect.
+    if SPOOL_DIR:
+        cli.max_queued_messages_set(SPOOL_QUEUE_MAX)
+
+
+def make_publisher(cli) -> Optional[SpoolingPublisher]:
+    # SpoolingPublisher from the BRIDGE_SPOOL_* env vars, or None when disabled.
+    if not SPOOL_DIR:
+        return None
+    spool = DiskSpool(SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_KB * 1024,
+                      max_bytes=int(SPOOL_MAX_MB * (1 << 20)),
+                      max_age_s=SPOOL_MAX_AGE_H * 3600)
+    print(f"[SPOOL] {SPOOL_DIR} (max {SPOOL_MAX_MB:g} MiB, drain {SPOOL_DRAIN_RATE:g} msgs/s)")
+    return SpoolingPublisher(cli, spool)
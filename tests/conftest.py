@@ -0,0 +1,7 @@
+# Shared pytest setup: run from the repo root without installing anything.
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "software", "serial_bridge"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
@@ -0,0 +1,69 @@
+# Rolling per-topic statistics and anomaly flags (api/aggregates.py).
+import random, statistics
+
+import pytest
+
+from api.aggregates import RollingStats, parse_limits
+
+
+def test_stats_match_a_direct_computation():
+    rnd = random.Random(3)
+    rs = RollingStats()
+    vals = [rnd.gauss(20, 2) for _ in range(500)]
+    for i, v in enumerate(vals):
+        rs.add("t", 1000 + i * 0.1, {"temperature": v})
+    s = rs.stats("t", 1049.9, window="1m")["temperature"]["1m"]
+    assert s["count"] == 500
+    assert s["mean"] == pytest.approx(statistics.mean(vals), abs=1e-4)
+    assert s["stddev"] == pytest.approx(statistics.stdev(vals), abs=1e-4)
+    assert (s["min"], s["max"]) == (min(vals), max(vals))
+
+
+def test_window_slides_out_old_buckets():
+    rs = RollingStats()
+    rs.add("t", 0, {"temperature": 100})
+    for i in range(60):
+        rs.add("t", 30 + i, {"temperature": 1})
+    s = rs.stats("t", 89)["temperature"]
+    assert s["1m"] == {"count": 60, "mean": 1.0, "min": 1, "max": 1, "stddev": 0.0}
+    assert s["1h"]["count"] == 61 and s["1h"]["max"] == 100
+    assert rs.stats("t", 200, window="1m")["temperature"]["1m"] == {"count": 0}
+
+
+def test_late_and_non_finite_readings():
+    rs = RollingStats()
+    rs.add("t", 100, {"temperature": 1.0})
+    rs.stats("t", 100)                                   # caches the closed buckets
+    rs.add("t", 99, {"temperature": 3.0, "humidity": float("nan")})
+    s = rs.stats("t", 100)
+    assert s["temperature"]["1m"]["count"] == 2 and "humidity" not in s
+    rs.add("t", 100 - 3600, {"temperature": 9.0})        # older than the ring: ignored
+    assert rs.stats("t", 100)["temperature"]["1m"]["max"] == 3.0
+    assert rs.stats("nope", 100) is None
+
+
+def test_limit_and_zscore_anomalies():
+    rs = RollingStats(zscore=4, z_window="1m", min_count=30, limits=parse_limits("temperature:-20:60"))
+    for i in range(40):
+        assert rs.add("t", i, {"temperature": 20 + (i % 2)}) == []
+    z = rs.add("t", 40, {"temperature": 30})
+    assert [a["kind"] for a in z] == ["zscore"] and z[0]["topic"] == "t" and z[0]["z"] > 4
+    lim = rs.add("t", 41, {"temperature": 80})
+    assert lim == [{"ts": 41, "field": "temperature", "value": 80, "kind": "limit", "limit": [-20.0, 60.0],
+                    "topic": "t"}]
+    assert [a["kind"] for a in rs.anomalies("t")] == ["limit", "zscore"]
+    assert rs.totals() == [(("t", "temperature", "limit"), 1), (("t", "temperature", "zscore"), 1)]
+
+
+def test_zscore_needs_min_count():
+    rs = RollingStats(zscore=2, z_window="1m", min_count=30)
+    for i in range(5):
+        rs.add("t", i, {"temperature": 20 + i % 2})
+    assert rs.add("t", 6, {"temperature": 1000}) == []
+
+
+def test_parse_limits():
+    assert parse_limits(" temperature:-20:60, humidity:0:100 ,") == {
+        "temperature": (-20.0, 60.0), "humidity": (0.0, 100.0)}
+    with pytest.raises(ValueError):
+        parse_limits("temperature:0")
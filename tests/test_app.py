@@ -0,0 +1,223 @@
+# HTTP endpoints of api/app.py, fed through the ingest batch handler.
+# The TestClient is used without its context manager, so no MQTT lifespan runs.
+import asyncio, json, time, uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.app as gw
+
+client = TestClient(gw.app)
+
+
+@pytest.fixture
+def topic():
+    return f"test/{uuid.uuid4().hex[:8]}"
+
+
+def feed(topic, payloads, t0=1_700_000_000):
+    # One message per payload, one second apart.
+    gw._ingest_batch([(topic, json.dumps(p).encode(), t0 + i, False) for i, p in enumerate(payloads)])
+    gw.LATEST.publish(force=True)
+
+
+def test_history_rows_and_columns(topic):
+    feed(topic, [{"temperature": 20 + i, "humidity": 50} for i in range(5)])
+    rows = client.get("/telemetry/history", params={"topic": topic, "n": 3}).json()
+    assert [r["temperature"] for r in rows] == [22, 23, 24]
+    assert rows[-1]["ts"] == 1_700_000_004
+    cols = client.get("/telemetry/history", params={"topic": topic, "n": 2, "layout": "columns"}).json()
+    assert cols["ts"] == [1_700_000_003, 1_700_000_004]
+    assert cols["temperature"] == [23, 24] and cols["humidity"] == [50, 50]
+
+
+def test_history_missing_fields(topic):
+    # Rows omit a field the message did not carry; columns hold null there.
+    feed(topic, [{"temperature": 20}, {"humidity": 40}])
+    rows = client.get("/telemetry/history", params={"topic": topic}).json()
+    assert "humidity" not in rows[0] and "temperature" not in rows[1]
+    cols = client.get("/telemetry/history", params={"topic": topic, "layout": "columns"}).json()
+    assert cols["temperature"] == [20, None] and cols["humidity"] == [None, 40]
+
+
+def test_history_cache_sees_new_points(topic):
+    feed(topic, [{"temperature": 1}])
+    assert len(client.get("/telemetry/history", params={"topic": topic}).json()) == 1
+    feed(topic, [{"temperature": 2}], t0=1_700_000_100)
+    assert len(client.get("/telemetry/history", params={"topic": topic}).json()) == 2
+
+
+def test_history_unknown_topic_and_bad_n(topic):
+    assert client.get("/telemetry/history", params={"topic": topic}).status_code == 404
+    assert client.get("/telemetry/history", params={"topic": topic, "n": 0}).status_code == 422
+
+
+def test_history_time_range_and_downsampling(topic):
+    t0 = 1_700_000_000
+    feed(topic, [{"temperature": i % 7, "humidity": 50} for i in range(100)], t0)
+    rng = client.get("/telemetry/history", params={"topic": topic, "since": t0 + 10, "until": t0 + 19}).json()
+    assert [r["ts"] for r in rng] == list(range(t0 + 10, t0 + 20))
+    mm = client.get("/telemetry/history", params={"topic": topic, "max_points": 10}).json()
+    assert len(mm) == 10 and sum(b["count"] for b in mm) == 100
+    assert all(b["temperature_min"] == 0 and b["temperature_max"] == 6 for b in mm)
+    lt = client.get("/telemetry/history", params={"topic": topic, "max_points": 10, "mode": "lttb",
+                                                  "layout": "columns"}).json()
+    assert len(lt["ts"]) == 10 and lt["ts"][0] == t0 and lt["ts"][-1] == t0 + 99
+
+
+def test_history_downsampling_errors(topic):
+    feed(topic, [{"temperature": i} for i in range(20)])
+    q = {"topic": topic, "max_points": 5, "mode": "lttb"}
+    assert client.get("/telemetry/history", params={**q, "field": "pressure"}).status_code == 400
+    assert client.get("/telemetry/history", params={**q, "field": "ts"}).status_code == 400
+    assert client.get("/telemetry/history", params={**q, "max_points": 1}).status_code == 422
+    assert client.get("/telemetry/history", params={**q, "mode": "avg"}).status_code == 422
+
+
+def test_sse_stream_sends_snapshot_then_matching_updates(topic):
+    feed(topic + "/a", [{"temperature": 1}])
+
+    async def run():
+        resp = await gw.stream(None, filter=[topic + "/+"])
+        events = resp.body_iterator
+        snap = await events.__anext__()
+        feed(topic + "/b", [{"temperature": 2}])
+        feed("other/" + topic, [{"temperature": 3}])
+        update = await asyncio.wait_for(events.__anext__(), 5)
+        await events.aclose()
+        return snap, update
+
+    snap, update = asyncio.run(run())
+    assert snap.startswith("event: snapshot\n")
+    assert json.loads(snap.split("data: ", 1)[1])[topic + "/a"]["payload"] == {"temperature": 1}
+    assert update.startswith("event: latest\n") and update.count("event:") == 1
+    assert json.loads(update.split("data: ", 1)[1])["topic"] == topic + "/b"
+    assert not gw.LIVE.stats()["clients"]
+
+
+def test_latest_etag_and_not_modified(topic):
+    feed(topic, [{"temperature": 1}])
+    r = client.get("/telemetry/latest")
+    assert r.json()[topic]["payload"] == {"temperature": 1}
+    assert client.get("/telemetry/latest", headers={"if-none-match": r.headers["etag"]}).status_code == 304
+    feed(topic, [{"temperature": 2}], t0=1_700_000_100)
+    r2 = client.get("/telemetry/latest", headers={"if-none-match": r.headers["etag"]})
+    assert r2.status_code == 200 and r2.headers["etag"] != r.headers["etag"]
+    assert client.get("/telemetry/by_topic", params={"topic": topic}).json()["payload"] == {"temperature": 2}
+    assert client.get("/telemetry/by_topic", params={"topic": topic + "/none"}).status_code == 404
+
+
+def test_topics_and_filtered_latest_pages(topic):
+    for k in ("a", "b", "c"):
+        feed(f"{topic}/{k}/dht", [{"temperature": ord(k)}])
+    page = client.get("/telemetry/topics", params={"filter": f"{topic}/+/dht", "limit": 2}).json()
+    assert page == {"topics": [f"{topic}/a/dht", f"{topic}/b/dht"], "next_cursor": f"{topic}/b/dht"}
+    rest = client.get("/telemetry/latest", params={"filter": f"{topic}/#", "cursor": page["next_cursor"],
+                                                   "fields": "temperature"}).json()
+    assert rest == {"items": {f"{topic}/c/dht": {"topic": f"{topic}/c/dht", "payload": {"temperature": 99},
+                                                 "size_bytes": 19, "ts": 1_700_000_000}},
+                    "next_cursor": None}
+    assert client.get("/telemetry/topics", params={"filter": "a/#/b"}).status_code == 400
+    assert client.get("/telemetry/topics/children", params={"prefix": topic}).json()[0]["topics"] == 1
+
+
+def test_metrics_endpoint_counts_ingest(topic):
+    feed(topic, [{"temperature": 1}, {"temperature": 2}])
+    client.get("/telemetry/by_topic", params={"topic": topic})
+    text = client.get("/metrics").text
+    assert f'gateway_readings_total{{topic="{topic}"}} 2' in text
+    assert 'gateway_http_request_duration_seconds_count{route="/telemetry/by_topic",method="GET",status="200"}' in text
+
+
+@pytest.mark.parametrize("from_log", [False, True])
+def test_export_streams_matching_topics(topic, tmp_path, monkeypatch, from_log):
+    if from_log:
+        from api.telemetry_log import TelemetryLog
+        monkeypatch.setattr(gw, "TLOG", TelemetryLog(str(tmp_path)))
+    t0 = 1_700_000_000
+    feed(f"{topic}/a", [{"temperature": i} for i in range(3)], t0)
+    feed(f"{topic}/b", [{"humidity": i} for i in range(3)], t0 + 3)      # arrival order
+    r = client.get("/telemetry/export", params={"filter": f"{topic}/#", "since": t0 + 1, "until": t0 + 4})
+    assert r.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(l) for l in r.text.splitlines()]
+    assert sorted((x["topic"], x["ts"]) for x in rows) == [
+        (f"{topic}/a", t0 + 1), (f"{topic}/a", t0 + 2), (f"{topic}/b", t0 + 3), (f"{topic}/b", t0 + 4)]
+    r = client.get("/telemetry/export", params={"filter": f"{topic}/a", "format": "csv", "fields": "temperature"})
+    assert r.text.splitlines() == ["topic,ts,size_bytes,temperature"] + [
+        f"{topic}/a,{t0 + i},18,{float(i)}" for i in range(3)]
+    if from_log:
+        gw.TLOG.close()
+
+
+def test_export_errors():
+    assert client.get("/telemetry/export", params={"filter": "a/#/b"}).status_code == 400
+    assert client.get("/telemetry/export", params={"fields": "pressure"}).status_code == 400
+    assert client.get("/telemetry/export", params={"format": "xml"}).status_code == 422
+
+
+def test_stats_and_anomalies(topic, monkeypatch):
+    monkeypatch.setattr(gw.STATS, "limits", {"temperature": (0.0, 50.0)})
+    now = int(time.time())
+    feed(topic, [{"temperature": 20}, {"temperature": 22}, {"temperature": 90}], now - 3)
+    st = client.get("/telemetry/stats", params={"topic": topic, "window": "1m"}).json()["stats"]
+    assert st["temperature"]["1m"]["count"] == 3 and st["temperature"]["1m"]["max"] == 90
+    page = client.get("/telemetry/stats", params={"filter": f"{topic}/#", "fields": "humidity"}).json()
+    assert page["items"] == {} and page["next_cursor"] is None
+    an = client.get("/telemetry/anomalies", params={"topic": topic}).json()
+    assert [(a["value"], a["kind"]) for a in an["recent"]] == [(90, "limit")]
+    assert an["totals"] == [{"topic": topic, "field": "temperature", "kind": "limit", "count": 1}]
+    assert client.get("/telemetry/stats", params={"topic": topic, "window": "5m"}).status_code == 400
+    assert client.get("/telemetry/stats", params={"topic": topic + "/none"}).status_code == 404
+
+
+def retained(topic, payload, ts):
+    gw._ingest_batch([(topic, json.dumps(payload).encode(), ts, True)])
+    gw.LATEST.publish(force=True)
+    return gw.LATEST.snapshot().data.get(topic)
+
+
+def test_retained_messages_only_fill_in(topic):
+    row = retained(topic, {"temperature": 1, "_ts": 1_700_000_000_000}, 1_800_000_000)
+    assert row["retained"] and row["ts"] == 1_700_000_000              # the reading's own _ts
+    assert client.get("/telemetry/history", params={"topic": topic}).status_code == 404
+    assert retained(topic, {"temperature": 0, "_ts": 1_600_000_000_000}, 1_800_000_000)["payload"]["temperature"] == 1
+    feed(topic, [{"temperature": 2}])
+    assert retained(topic, {"temperature": 3}, 1_900_000_000)["payload"]["temperature"] == 2   # live row wins
+
+
+def test_warm_start_from_the_snapshot_file(topic, tmp_path, monkeypatch):
+    from api.snapshot import LatestState, save
+    old = LatestState()
+    old.set(topic, {"topic": topic, "payload": {"temperature": 5}, "size_bytes": 18, "ts": 1_700_000_000})
+    old.publish()
+    save(old, str(tmp_path / "latest.snap"))
+    monkeypatch.setattr(gw, "SNAPSHOT_FILE", str(tmp_path / "latest.snap"))
+    monkeypatch.setattr(gw, "LOG_DIR", "")
+    monkeypatch.setattr(gw, "WARM", {**gw.WARM, "hydrated_topics": 0, "first_state_s": None, "full_state_s": None})
+    monkeypatch.setattr(gw, "_PENDING", set())
+    assert gw._hydrate() is None
+    row = client.get("/telemetry/by_topic", params={"topic": topic}).json()
+    assert row["restored"] and row["payload"] == {"temperature": 5}
+    assert topic in gw._PENDING and gw.WARM["first_state_s"] is not None
+    gw._PENDING.intersection_update({topic})       # the map also holds other tests' topics
+    assert retained(topic, {"temperature": 6}, 1_700_000_100)["retained"]   # newer retained replaces it
+    feed(topic, [{"temperature": 7}], t0=1_700_000_200)
+    assert not gw._PENDING and gw.WARM["full_state_s"] is not None
+
+
+def test_admin_limits(monkeypatch):
+    from api.ratelimit import RateLimiter
+    monkeypatch.setattr(gw, "LIMITER", RateLimiter(topic_rate=1, topic_burst=1))
+    gw.LIMITER.check("team1/noisy", b"a")
+    gw.LIMITER.check("team1/noisy", b"b")
+    monkeypatch.setattr(gw, "ADMIN_TOKEN", "")
+    doc = client.get("/admin/limits").json()
+    assert doc["topic_rate"] == 1 and doc["shed"]["topic"] == 1
+    assert client.put("/admin/limits", params={"topic_rate": 5}).status_code == 403
+    monkeypatch.setattr(gw, "ADMIN_TOKEN", "s3cret")
+    assert client.put("/admin/limits", params={"topic_rate": 5}).status_code == 401
+    auth = {"authorization": "Bearer s3cret"}
+    assert client.put("/admin/limits", params={"overrides": "a:1"}, headers=auth).status_code == 400
+    doc = client.put("/admin/limits", params={"topic_rate": 5, "overrides": "team1/lab/+:50:100"}, headers=auth).json()
+    assert doc["topic_rate"] == 5 and doc["topic_burst"] == 5 and doc["overrides"] == {"team1/lab/+": [50, 100]}
+    assert client.put("/admin/limits", params={"global_rate": -1}, headers=auth).status_code == 422
@@ -0,0 +1,83 @@
+# Serial line framing, validation and batched publishing (software/serial_bridge/batching.py).
+import json
+
+import pytest
+
+import batching
+from batching import LineFramer, plausible, stamp
+
+
+def test_framer_joins_chunks_and_keeps_the_partial_tail():
+    f = LineFramer()
+    assert f.feed(b'{"a":1}\r\n{"b"') == [b'{"a":1}']
+    assert f.feed(b":2}\n\n") == [b'{"b":2}', b""]
+    assert f.feed(b"{") == [] and f.buf == b"{"
+
+
+def test_framer_drops_an_overlong_line_without_newline():
+    f = LineFramer(max_line=8)
+    assert f.feed(b"x" * 9) == [] and not f.buf
+    assert f.feed(b"ok\n") == [b"ok"]
+
+
+@pytest.mark.parametrize("line,ok", [
+    (b'{"t":1,"s":"a\\"b"}', True),
+    (b'{"t":1', False),
+    (b'{"t":"x}', False),
+    (b'{"t":[1,2}', False),
+    (b'{"t":1}\x00', False),
+])
+def test_plausible(line, ok):
+    assert plausible(line) is ok
+
+
+def test_stamp_splices_the_timestamp():
+    assert stamp(b'{"temp_c": 21.0}', 5) == b'{"temp_c": 21.0,"_ts":5}'
+    assert stamp(b"{ }", 5) == b'{"_ts":5}'
+    assert stamp(b'{"_ts":1,"t":2}', 5) == b'{"_ts":1,"t":2}'
+    assert json.loads(stamp(b'{"a":{"b":1}}', 7)) == {"a": {"b": 1}, "_ts": 7}
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_stamp_rejects_garbled_lines(monkeypatch, validate):
+    monkeypatch.setattr(batching, "VALIDATE", validate)
+    assert stamp(b"temp=21", 1) is None
+    # balanced but not JSON: only the full parse catches it
+    assert (stamp(b'{"t":1,"h":}', 1) is None) is validate
+    assert stamp(b'{"t":"1}', 1) is None
+
+
+class FakeSerial:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.timeout = 1
+        self.in_waiting = 0
+
+    def read(self, n):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class FakeClient:
+    on_publish = None
+
+
+def _run(monkeypatch, chunks, window_ms, batch_max=50):
+    monkeypatch.setattr(batching, "BATCH_WINDOW_MS", window_ms)
+    monkeypatch.setattr(batching, "BATCH_MAX", batch_max)
+    ser, sent = FakeSerial(chunks), []
+    batching.run_bridge(ser, FakeClient(), "t/dev", lambda: bool(ser.chunks),
+                        publish=lambda t, p: sent.append((t, p)))
+    return ser, sent
+
+
+def test_unbatched_bridge_publishes_each_valid_line(monkeypatch):
+    _, sent = _run(monkeypatch, [b'{"t":1}\nbad\n{"t":', b'2}\n'], 0)
+    assert [(t, json.loads(p)["t"]) for t, p in sent] == [("t/dev", 1), ("t/dev", 2)]
+
+
+def test_batched_bridge_coalesces_up_to_batch_max(monkeypatch):
+    lines = b"".join(b'{"t":%d}\n' % i for i in range(7))
+    ser, sent = _run(monkeypatch, [lines], 10_000, batch_max=3)
+    assert ser.timeout <= 10
+    batches = [[json.loads(l)["t"] for l in p.split(b"\n")] for _, p in sent]
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]                # the rest is flushed on exit
@@ -0,0 +1,95 @@
+# Benchmark harness: the in-process broker and a short gateway_bench run.
+import json, os, shutil, subprocess, sys, time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from gateway_bench import percentiles
+from mini_broker import MiniBroker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Sub:
+    def __init__(self, port, cid, *filters):
+        self.got = []
+        self.c = mqtt.Client(client_id=cid, protocol=mqtt.MQTTv311)
+        self.c.on_message = lambda c, u, m: self.got.append((m.topic, m.payload, m.retain))
+        self.c.connect("127.0.0.1", port)
+        self.c.loop_start()
+        for f in filters:
+            self.c.subscribe(f, 1)
+        time.sleep(0.1)
+
+    def close(self):
+        self.c.loop_stop()
+        self.c.disconnect()
+
+
+def _wait(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond() and time.monotonic() < end:
+        time.sleep(0.02)
+    return cond()
+
+
+@pytest.fixture
+def broker():
+    b = MiniBroker().start_thread()
+    yield b
+    b.stop()
+
+
+def test_mini_broker_routes_retains_and_shares(broker):
+    pub = Sub(broker.port, "pub")
+    pub.c.publish("r/a", b"kept", qos=1, retain=True).wait_for_publish(5)
+    plain = Sub(broker.port, "plain", "r/#", "s/+")
+    g1, g2 = Sub(broker.port, "g1", "$share/g/s/#"), Sub(broker.port, "g2", "$share/g/s/#")
+    for i in range(4):
+        pub.c.publish(f"s/{i}", b"%d" % i, qos=1).wait_for_publish(5)
+    assert _wait(lambda: len(plain.got) == 5 and len(g1.got) + len(g2.got) == 4)
+    assert plain.got[0] == ("r/a", b"kept", True)
+    assert len(g1.got) == len(g2.got) == 2                  # round-robin within the group
+    pub.c.publish("r/a", b"", qos=1, retain=True).wait_for_publish(5)
+    assert _wait(lambda: not broker.retained)
+    for s in (pub, plain, g1, g2):
+        s.close()
+
+
+def test_percentiles():
+    assert percentiles([]) == {"p50": None, "p90": None, "p99": None, "max": None, "count": 0}
+    p = percentiles(list(range(100)))
+    assert p == {"p50": 50, "p90": 90, "p99": 99, "max": 99, "count": 100}
+
+
+def test_gateway_bench_smoke(tmp_path):
+    out = tmp_path / "bench.json"
+    subprocess.run([sys.executable, "bench/gateway_bench.py", "--topics", "2", "--rate", "20",
+                    "--http-rate", "5", "--warmup", "0.5", "--duration", "1", "--out", str(out)],
+                   cwd=ROOT, check=True, timeout=120, capture_output=True)
+    res = json.loads(out.read_text())
+    assert res["ingest"]["readings"] > 0 and res["ingest"]["errors"] == 0
+    assert res["latency_ms"]["count"] > 0 and res["http_ms"]["errors"] == 0
+
+
+def _tls_bench(tmp_path, *args):
+    out = tmp_path / "tls.json"
+    subprocess.run([sys.executable, "bench/tls_handshake_bench.py", "--sigs", "ec", "--concurrency", "1,2",
+                    "--handshakes", "3", "--out", str(out), *args],
+                   cwd=ROOT, check=True, timeout=120, capture_output=True)
+    return json.loads(out.read_text())["results"]
+
+
+@pytest.mark.skipif(not shutil.which("openssl"), reason="needs the openssl binary")
+def test_tls_bench_full_and_resumed_handshakes(tmp_path):
+    res = _tls_bench(tmp_path, "--groups", "X25519")
+    assert [(r["concurrency"], r["mode"]) for r in res] == [(1, "full"), (1, "resumed"), (2, "full"), (2, "resumed")]
+    assert all(r["errors"] == 0 and r["handshakes"] == 3 * r["concurrency"] for r in res)
+    full, resumed = res[0], res[1]
+    assert full["resumed"] == 0 and resumed["resumed"] == resumed["handshakes"]
+    assert resumed["bytes_received"] < full["bytes_received"]     # no certificate chain on resumption
+
+
+@pytest.mark.skipif(not shutil.which("openssl"), reason="needs the openssl binary")
+def test_tls_bench_skips_groups_openssl_cannot_set(tmp_path):
+    assert _tls_bench(tmp_path, "--groups", "NO-SUCH-GROUP") == []
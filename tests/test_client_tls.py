@@ -0,0 +1,94 @@
+# Cached client TLS contexts with session resumption (common/client_tls.py).
+import shutil, socket, ssl, subprocess, threading
+
+import pytest
+
+from common import client_tls
+from common.client_tls import client_context
+
+pytestmark = pytest.mark.skipif(not shutil.which("openssl"), reason="needs the openssl binary")
+
+
+def _openssl(*args, cwd):
+    subprocess.run(["openssl", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture(scope="module")
+def pki(tmp_path_factory):
+    d = tmp_path_factory.mktemp("pki")
+    ec = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes"]
+    _openssl("req", "-x509", *ec, "-keyout", "ca.key", "-out", "ca.crt", "-subj", "/CN=test-ca", "-days", "1", cwd=d)
+    (d / "san.cnf").write_text("subjectAltName=DNS:localhost\n")
+    for name in ("server", "client"):
+        _openssl("req", *ec, "-keyout", f"{name}.key", "-out", f"{name}.csr", "-subj", f"/CN={name}", cwd=d)
+        _openssl("x509", "-req", "-in", f"{name}.csr", "-CA", "ca.crt", "-CAkey", "ca.key", "-CAcreateserial",
+                 "-out", f"{name}.crt", "-days", "1", "-extfile", "san.cnf", cwd=d)
+    return {k: str(d / k) for k in ("ca.crt", "server.crt", "server.key", "client.crt", "client.key")}
+
+
+@pytest.fixture
+def server(pki):
+    # mTLS TLS 1.3 server: handshake, send two bytes, wait for the client to close.
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(pki["server.crt"], pki["server.key"])
+    ctx.load_verify_locations(pki["ca.crt"])
+    ctx.verify_mode = ssl.CERT_REQUIRED
+    lsock = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                conn, _ = lsock.accept()
+            except OSError:
+                return
+            try:
+                with ctx.wrap_socket(conn, server_side=True) as s:
+                    s.sendall(b"hi")
+                    s.recv(1)
+            except (OSError, ssl.SSLError):
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield lsock.getsockname()[1]
+    lsock.close()
+
+
+def _connect(ctx, port):
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with ctx.wrap_socket(raw, server_hostname="localhost") as s:
+            assert s.recv(2) == b"hi"
+            return s.session_reused
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(client_tls, "_contexts", {})
+    monkeypatch.setattr(client_tls, "TLS_LOG", False)
+
+
+def test_context_is_cached_per_settings(pki):
+    a = client_context(pki["ca.crt"], pki["client.crt"], pki["client.key"])
+    assert client_context(pki["ca.crt"], pki["client.crt"], pki["client.key"]) is a
+    assert client_context(pki["ca.crt"]) is not a
+    assert a.minimum_version == ssl.TLSVersion.TLSv1_3
+
+
+def test_reconnect_resumes_the_session(pki, server):
+    ctx = client_context(pki["ca.crt"], pki["client.crt"], pki["client.key"])
+    assert _connect(ctx, server) is False
+    assert _connect(ctx, server) is True
+    s = ctx.stats()
+    assert (s["handshakes"], s["resumed"], s["failures"], s["cached_sessions"]) == (2, 1, 0, 1)
+    assert s["resumption_rate"] == 0.5 and s["full_avg_ms"] is not None
+    assert client_tls.stats()["resumed"] == 1
+
+
+def test_failed_handshake_is_counted(pki, server, tmp_path):
+    other = tmp_path / "other.key"
+    _openssl("req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes",
+             "-keyout", str(other), "-out", str(tmp_path / "other.crt"), "-subj", "/CN=x", "-days", "1",
+             cwd=tmp_path)
+    ctx = client_context(str(tmp_path / "other.crt"))          # does not trust the server's CA
+    with pytest.raises(ssl.SSLError):
+        _connect(ctx, server)
+    assert ctx.stats()["failures"] == 1 and ctx.stats()["handshakes"] == 0
@@ -0,0 +1,47 @@
+# Streaming export encoders (api/export.py).
+import csv, io, json, math
+
+import pytest
+
+from api import export
+from api.history_store import HistoryStore
+
+NAN = float("nan")
+FIELDS = ("temperature", "humidity")
+BATCHES = [[("a", 1, 10, 20.5, NAN), ("b", 2, 11, NAN, 40.0)], [("a", 3, 12, 21.0, 41.0)]]
+
+
+def test_ndjson_omits_missing_readings():
+    chunks = list(export.ndjson(BATCHES, FIELDS))
+    assert len(chunks) == 2
+    rows = [json.loads(l) for c in chunks for l in c.splitlines()]
+    assert rows == [{"topic": "a", "ts": 1, "size_bytes": 10, "temperature": 20.5},
+                    {"topic": "b", "ts": 2, "size_bytes": 11, "humidity": 40.0},
+                    {"topic": "a", "ts": 3, "size_bytes": 12, "temperature": 21.0, "humidity": 41.0}]
+
+
+def test_csv_header_once_and_empty_cells():
+    text = b"".join(export.csv_rows(BATCHES, FIELDS, keep=["humidity"])).decode()
+    assert list(csv.reader(io.StringIO(text))) == [
+        ["topic", "ts", "size_bytes", "humidity"], ["a", "1", "10", ""], ["b", "2", "11", "40.0"],
+        ["a", "3", "12", "41.0"]]
+    assert b"".join(export.csv_rows([], FIELDS)) == b"topic,ts,size_bytes,temperature,humidity\n"
+
+
+def test_arrow_stream_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(b"".join(export.arrow(BATCHES, FIELDS))).read_all()
+    assert table.num_rows == 3
+    assert table.column("topic").to_pylist() == ["a", "b", "a"]
+    assert table.column("temperature").to_pylist() == [20.5, None, 21.0]
+    assert str(table.schema.field("ts").type) == "timestamp[s]"
+
+
+def test_history_batches_chunk_per_topic():
+    store = HistoryStore(100)
+    for i in range(5):
+        store.append("a", i, 1, {"temperature": i})
+    store.append("b", 9, 1, {"humidity": 1})
+    batches = list(export.history_batches(store, ["a", "b", "missing"], since=1, until=None, chunk=2))
+    assert [[r[:2] for r in b] for b in batches] == [[("a", 1), ("a", 2)], [("a", 3), ("a", 4)], [("b", 9)]]
+    assert math.isnan(batches[-1][0][3])
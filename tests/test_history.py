@@ -0,0 +1,139 @@
+# Columnar history rings (api/history_store.py) and downsampling (api/downsample.py).
+import math, random
+from array import array
+
+import pytest
+
+from api.downsample import bucket_rows, lttb_indices, minmax_buckets, take
+from api.history_store import HistoryStore, columns_json, rows_json
+
+NAN = float("nan")
+
+
+def _store(cap, n, start=100):
+    st = HistoryStore(cap)
+    for i in range(n):
+        st.append("t/a", start + i, 10 + i, {"temperature": float(i), "humidity": 50.0})
+    return st
+
+
+def test_ring_grows_then_wraps_keeping_the_newest():
+    st = _store(5, 3)
+    assert list(st.window("t/a")["ts"]) == [100, 101, 102]
+    assert not st.wrapped("t/a")
+    st = _store(5, 12)
+    cols = st.window("t/a")
+    assert list(cols["ts"]) == [107, 108, 109, 110, 111]
+    assert list(cols["temperature"]) == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert st.wrapped("t/a") and st.oldest("t/a") == 107
+
+
+@pytest.mark.parametrize("n", [5, 7, 13, 17])
+def test_window_bounds_across_the_wrap_point(n):
+    st = _store(8, n)
+    ring = st._rings["t/a"]
+    held = list(st.window("t/a")["ts"])
+    for since in range(held[0] - 2, held[-1] + 3):
+        for until in range(since - 1, held[-1] + 3):
+            want = [t for t in held if since <= t <= until]
+            assert list(st.window("t/a", since, until)["ts"]) == want
+    for t in range(held[0] - 1, held[-1] + 2):
+        assert ring.bisect(t) == sum(1 for x in held if x < t)
+        assert ring.bisect(t, right=True) == sum(1 for x in held if x <= t)
+
+
+def test_window_newest_n_and_tail():
+    st = _store(8, 20)
+    assert list(st.tail("t/a", 3)["ts"]) == [117, 118, 119]
+    assert list(st.window("t/a", since=110, until=115, n=2)["ts"]) == [114, 115]
+    assert st.window("t/x") is None
+
+
+def test_duplicate_timestamps_are_bounded_inclusively():
+    st = HistoryStore(10)
+    for ts in (1, 2, 2, 2, 3):
+        st.append("t/a", ts, 0, {})
+    assert list(st.window("t/a", 2, 2)["ts"]) == [2, 2, 2]
+
+
+def test_missing_fields_are_nan_and_json_helpers():
+    st = HistoryStore(4)
+    st.append("t/a", 1, 5, {"temperature": 20.0})
+    st.append("t/a", 2, 6, {"humidity": 40.0})
+    cols = st.window("t/a")
+    assert columns_json(cols) == {"ts": [1, 2], "size_bytes": [5, 6],
+                                  "temperature": [20.0, None], "humidity": [None, 40.0]}
+    assert rows_json(cols) == [{"ts": 1, "size_bytes": 5, "temperature": 20.0},
+                               {"ts": 2, "size_bytes": 6, "humidity": 40.0}]
+
+
+def test_memory_report():
+    rep = _store(100, 10).memory_report()
+    assert rep["points"] == 10 and rep["bytes_per_point"] == 28 and rep["topics"] == 1
+
+
+def _cols(ts, temp):
+    return {"ts": array("q", ts), "size_bytes": array("I", [1] * len(ts)),
+            "temperature": array("d", temp)}
+
+
+def _loop_minmax(ts, vals, nb, t0, t1):
+    # Reference: one bucket index per point.
+    width = max((t1 - t0) / nb, 1e-9)
+    buckets = {}
+    for t, v in zip(ts, vals):
+        b = min(max(int((t - t0) / width), 0), nb - 1)
+        buckets.setdefault(b, []).append(v)
+    out = []
+    for b in sorted(buckets):
+        ok = [v for v in buckets[b] if v == v]
+        out.append((t0 + b * width, len(buckets[b]),
+                    min(ok) if ok else None, max(ok) if ok else None))
+    return out
+
+
+def test_minmax_buckets_match_a_per_point_reference():
+    rnd = random.Random(3)
+    ts = sorted(rnd.randrange(0, 5000) for _ in range(3000))
+    vals = [NAN if rnd.random() < 0.1 else rnd.uniform(-5, 5) for _ in ts]
+    out = minmax_buckets(_cols(ts, vals), 37, 0, 5000)
+    got = list(zip(out["ts"], out["count"], out["temperature_min"], out["temperature_max"]))
+    assert got == _loop_minmax(ts, vals, 37, 0, 5000)
+    assert sum(out["count"]) == len(ts)
+
+
+def test_minmax_buckets_edge_cases():
+    out = minmax_buckets(_cols([1, 2, 3], [NAN, NAN, 4.0]), 1)
+    assert out["count"] == [3] and out["temperature_min"] == [4.0] and out["temperature_mean"] == [4.0]
+    out = minmax_buckets(_cols([1, 2], [NAN, NAN]), 2)
+    assert out["temperature_mean"] == [None, None]
+    assert bucket_rows(out) == [{"ts": 1.0, "count": 1}, {"ts": 1.5, "count": 1}]
+    # points outside the requested range fold into the first and last bucket
+    out = minmax_buckets(_cols([0, 50, 100], [1.0, 2.0, 3.0]), 2, 10, 90)
+    assert out["count"] == [1, 2]
+    assert minmax_buckets(_cols([], []), 10)["ts"] == []
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    ts = list(range(1000))
+    ys = [math.sin(i / 50) for i in ts]
+    ys[500] = 10.0                                  # a spike must survive
+    idx = lttb_indices(array("q", ts), array("d", ys), 50)
+    assert len(idx) == 50 and idx[0] == 0 and idx[-1] == 999
+    assert idx == sorted(idx) and 500 in idx
+
+
+def test_lttb_skips_missing_values():
+    ys = [NAN if i % 3 == 0 else float(i % 7) for i in range(300)]
+    idx = lttb_indices(array("q", range(300)), array("d", ys), 20)
+    assert all(ys[i] == ys[i] for i in idx)
+    assert lttb_indices(array("q", range(10)), array("d", [NAN] * 10), 4) == [0, 3, 6, 9]
+    assert lttb_indices(array("q", range(5)), array("d", [1.0] * 5), 10) == [0, 1, 2, 3, 4]
+
+
+def test_take_gathers_every_column():
+    cols = _cols([10, 20, 30, 40], [1.0, 2.0, 3.0, 4.0])
+    out = take(cols, [0, 2])
+    assert list(out["ts"]) == [10, 30] and list(out["temperature"]) == [1.0, 3.0]
+    assert out["ts"].typecode == "q"
+    assert list(take(cols, [3])["ts"]) == [40] and list(take(cols, [])["ts"]) == []
@@ -0,0 +1,87 @@
+# Ingest pipeline (api/ingest.py) and the worker's batch handler in api/app.py.
+import threading, time
+
+import pytest
+
+import api.app as gw
+from api.ingest import IngestPipeline
+
+
+def _rows(topics):
+    gw.LATEST.publish(force=True)
+    data = gw.LATEST.snapshot().data
+    return {t: data.get(t) for t in topics}
+
+
+def test_poisoned_message_does_not_lose_its_batch(monkeypatch):
+    real = gw._append_values
+
+    def poisoned(topic, ts, size, values):
+        if topic == "poison/bad":
+            raise OverflowError("int too large to convert")
+        real(topic, ts, size, values)
+
+    monkeypatch.setattr(gw, "_append_values", poisoned)
+    now = time.time()
+    gw._ingest_batch([
+        ("poison/a", b'{"temperature": 20}', now, False),
+        ("poison/bad", b'{"temperature": 21}', now, False),
+        ("poison/ok", b'{"temperature": 22}', now, False),
+    ])
+    rows = _rows(["poison/a", "poison/ok"])
+    assert rows["poison/a"]["payload"]["temperature"] == 20
+    assert rows["poison/ok"]["payload"]["temperature"] == 22
+    assert "gateway_ingest_errors_total{topic=\"poison/bad\"} 1" in gw.METRICS.render()
+
+
+def test_pipeline_batches_in_order():
+    seen = []
+    p = IngestPipeline(lambda b: seen.extend(t for t, *_ in b), maxsize=100, batch_max=8)
+    p.start()
+    for i in range(50):
+        p.submit(f"t/{i}", b"{}", time.time())
+    p.stop(5)
+    assert seen == [f"t/{i}" for i in range(50)]
+    assert p.stats()["processed"] == 50
+
+
+def test_pipeline_drop_oldest_and_count_and_drop():
+    p = IngestPipeline(lambda b: None, maxsize=3, policy="drop_oldest")
+    for i in range(5):
+        assert p.submit(f"t/{i}", b"", 0.0)
+    assert [t for t, *_ in p._q] == ["t/2", "t/3", "t/4"]
+    assert p.dropped == 2
+
+    p = IngestPipeline(lambda b: None, maxsize=3, policy="count_and_drop")
+    results = [p.submit(f"t/{i}", b"", 0.0) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert [t for t, *_ in p._q] == ["t/0", "t/1", "t/2"]
+
+
+def test_pipeline_block_policy_reports_no_room_without_waiting():
+    p = IngestPipeline(lambda b: None, maxsize=1, policy="block")
+    assert p.submit("t/0", b"", 0.0, wait=False)
+    assert not p.has_room()
+    assert p.submit("t/1", b"", 0.0, wait=False)     # event loop never blocks
+    assert p.stats()["depth"] == 2
+
+
+def test_pipeline_handler_error_is_counted_and_worker_survives():
+    calls = []
+
+    def handler(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+
+    p = IngestPipeline(handler, batch_max=1)
+    p.start()
+    p.submit("t/a", b"", time.time())
+    p.submit("t/b", b"", time.time())
+    p.stop(5)
+    assert p.errors == 1 and p.processed == 2
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        IngestPipeline(lambda b: None, policy="nope")
@@ -0,0 +1,53 @@
+# The API's MQTT ingest under the FastAPI lifespan, against the in-process broker.
+# Runs in a child process: the lifespan starts and stops module-level state once.
+import json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, threading, time
+sys.path.insert(0, "bench")
+from mini_broker import MiniBroker
+broker = MiniBroker().start_thread()
+import os
+os.environ.update(API_MQTT_BROKERS=f"127.0.0.1:{broker.port}", API_MQTT_TOPIC_FILTER="t/#",
+                  API_MQTT_CONNECTIONS="1")
+import paho.mqtt.client as mqtt
+from fastapi.testclient import TestClient
+import api.app as gw
+
+out = {"started_on_import": [t.name for t in threading.enumerate() if t.name == "ingest"] != [] or gw.POOL is not None}
+gw.POOL = gw.make_pool(None, qos=1)                      # plain TCP, as bench/gateway_bench.py does
+with TestClient(gw.app) as client:
+    end = time.monotonic() + 5
+    while not client.get("/gateway_ok").json()["connected"] and time.monotonic() < end:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    pub = mqtt.Client(client_id="pub", protocol=mqtt.MQTTv311)
+    pub.connect("127.0.0.1", broker.port)
+    pub.loop_start()
+    for i in range(50):
+        pub.publish(f"t/{i % 5}", json.dumps({"temperature": i}), qos=1).wait_for_publish(5)
+    # the latest map is published at most every API_LATEST_PUBLISH_MS, and when the worker idles
+    while time.monotonic() < end + 5:
+        out["latest"] = {t: r["payload"]["temperature"] for t, r in client.get("/telemetry/latest").json().items()}
+        if len(out["latest"]) == 5 and gw.PIPELINE.stats()["processed"] == 50 and out["latest"]["t/4"] == 49:
+            break
+        time.sleep(0.05)
+    out["ok"] = client.get("/gateway_ok").json()
+    out["threads"] = sorted(t.name for t in threading.enumerate() if t.name.startswith(f"paho-mqtt-client-{gw.CLIENT_ID}"))
+    pub.loop_stop()
+out["stopped"] = [c["connected"] for c in gw.POOL.stats()]
+print(json.dumps(out))
+"""
+
+
+def test_ingest_runs_on_the_event_loop_under_the_lifespan():
+    p = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert p.returncode == 0, p.stderr
+    out = json.loads(p.stdout.strip().splitlines()[-1])
+    assert not out["started_on_import"]
+    assert out["latest"] == {f"t/{k}": 45 + k for k in range(5)}
+    assert out["ok"]["connected"] == 1 and out["ok"]["role"] == "standalone"
+    assert out["threads"] == []                           # no paho network threads
+    assert out["stopped"] == [False]
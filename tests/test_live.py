@@ -0,0 +1,80 @@
+# Live stream fan-out (api/live.py).
+import asyncio
+
+import pytest
+
+from api.live import LiveHub
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_filters_route_events(loop):
+    hub = LiveHub()
+    a = hub.subscribe(["team1/+/dht"], loop)
+    b = hub.subscribe([], loop)                 # no filter: everything
+    hub.publish("team1/k/dht", "1")
+    hub.publish("team2/x", "2")
+    assert hub.drain(a) == ([("team1/k/dht", "1")], 0)
+    assert hub.drain(b) == ([("team1/k/dht", "1"), ("team2/x", "2")], 0)
+
+
+def test_coalesce_merges_are_not_reported_as_drops(loop):
+    hub = LiveHub(policy="coalesce", maxlen=4)
+    sub = hub.subscribe(["#"], loop)
+    for i in range(100):
+        hub.publish("t/a", str(i))
+        hub.publish("t/b", str(i))
+    items, dropped = hub.drain(sub)
+    assert items == [("t/a", "99"), ("t/b", "99")]
+    assert dropped == 0
+    st = hub.stats()
+    assert st["dropped_total"] == 0 and st["coalesced_total"] == 198
+
+
+def test_coalesce_buffer_overflow_is_a_real_drop(loop):
+    hub = LiveHub(policy="coalesce", maxlen=2)
+    sub = hub.subscribe(["#"], loop)
+    for t in ("t/a", "t/b", "t/c", "t/a"):
+        hub.publish(t, t)
+    items, dropped = hub.drain(sub)
+    assert [t for t, _ in items] == ["t/c", "t/a"]
+    assert dropped == 2       # t/a's first event and t/b never reached the client
+    assert hub.stats()["coalesced_total"] == 0
+
+
+def test_drop_oldest_keeps_the_newest(loop):
+    hub = LiveHub(policy="drop_oldest", maxlen=3)
+    sub = hub.subscribe(["#"], loop)
+    for i in range(5):
+        hub.publish("t/a", str(i))
+    assert hub.drain(sub) == ([("t/a", "2"), ("t/a", "3"), ("t/a", "4")], 2)
+    assert hub.drain(sub) == ([], 0)
+
+
+def test_disconnect_policy_closes_the_slow_client(loop):
+    hub = LiveHub(policy="disconnect", maxlen=2)
+    sub = hub.subscribe(["#"], loop)
+    for i in range(3):
+        hub.publish("t/a", str(i))
+    assert sub.closed and hub.stats()["disconnected_total"] == 1
+    hub.publish("t/a", "late")              # closed subscribers get nothing more
+    assert [d for _, d in hub.drain(sub)[0]] == ["0", "1"]
+
+
+def test_unsubscribe_and_bool(loop):
+    hub = LiveHub()
+    assert not hub
+    sub = hub.subscribe(["#"], loop)
+    assert hub
+    hub.unsubscribe(sub)
+    assert not hub
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        LiveHub(policy="nope")
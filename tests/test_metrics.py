@@ -0,0 +1,119 @@
+# Prometheus registry (api/metrics.py).
+import threading
+
+from api.metrics import Registry
+
+
+def _lines(text, prefix):
+    return [l for l in text.splitlines() if l.startswith(prefix)]
+
+
+def test_counter_sums_shards_and_escapes_labels():
+    reg = Registry()
+    c = reg.counter("msgs_total", "messages", ("topic",))
+    threads = [threading.Thread(target=lambda: [c.inc(("a",)) for _ in range(1000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    c.inc(('q"\\x\n',), 2.5)
+    text = reg.render()
+    assert "# TYPE msgs_total counter" in text
+    assert 'msgs_total{topic="a"} 4000' in text
+    assert 'msgs_total{topic="q\\"\\\\x\\n"} 2.5' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = Registry()
+    h = reg.histogram("lat", "latency", buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe((), v)
+    assert _lines(reg.render(), "lat_") == [
+        'lat_bucket{le="0.1"} 2', 'lat_bucket{le="1.0"} 3', 'lat_bucket{le="+Inf"} 4',
+        "lat_sum 3.65", "lat_count 4"]
+
+
+def test_collectors_read_at_scrape_time():
+    reg = Registry()
+    depth = [3]
+
+    @reg.collector("queue_depth", "queued")
+    def _depth():
+        yield {}, depth[0]
+        yield {"shard": "1"}, None                  # unknown: left out
+
+    @reg.collector("broken", "fails")
+    def _broken():
+        raise RuntimeError("boom")
+
+    assert _lines(reg.render(), "queue_depth") == ["queue_depth 3"]
+    depth[0] = 7
+    text = reg.render()
+    assert _lines(text, "queue_depth") == ["queue_depth 7"]
+    assert "# broken collector failed: boom" in text
+
+
+def test_timing_middleware_labels_by_route_template():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.metrics import TimingMiddleware
+
+    reg = Registry()
+    h = reg.histogram("http", "requests", ("route", "method", "status"))
+    app = FastAPI()
+
+    @app.get("/items/{item}")
+    def item(item: int):
+        return {"item": item}
+
+    app.add_middleware(TimingMiddleware, histogram=h)
+    client = TestClient(app)
+    client.get("/items/1"); client.get("/items/2"); client.get("/items/x"); client.get("/nope")
+    counts = {k: sum(e[:-1]) for k, e in h.totals().items()}
+    assert counts == {("/items/{item}", "GET", "200"): 2, ("/items/{item}", "GET", "422"): 1,
+                      ("unmatched", "GET", "404"): 1}
+
+
+def test_histogram_totals_sum_thread_shards():
+    reg = Registry()
+    h = reg.histogram("lat", "latency", ("route",), buckets=(0.1, 1.0))
+    h.observe(("/a",), 0.05)
+    t = threading.Thread(target=lambda: [h.observe(("/a",), 0.5), h.observe(("/b",), 5.0)])
+    t.start(); t.join()
+    assert h.totals() == {("/a",): [1, 1, 0, 0.55], ("/b",): [0, 0, 1, 5.0]}
+
+
+def test_histogram_merges_remote_totals():
+    reg = Registry()
+    h = reg.histogram("lat", "latency", ("route",), buckets=(0.1, 1.0))
+    h.observe(("/a",), 0.05)
+    h.remote = lambda: [{("/a",): [2, 0, 0, 0.1], ("/c",): [0, 1, 0, 0.2]},
+                        {("/a",): [9, 9, 0.5]}]       # other bucket layout: ignored
+    text = reg.render()
+    assert 'lat_count{route="/a"} 3' in text
+    assert 'lat_bucket{route="/a",le="0.1"} 3' in text
+    assert 'lat_count{route="/c"} 1' in text
+
+
+def test_histogram_remote_failure_keeps_local_series():
+    reg = Registry()
+    h = reg.histogram("lat", "latency", ("route",))
+
+    def broken():
+        raise OSError("segment gone")
+
+    h.remote = broken
+    h.observe(("/a",), 0.01)
+    text = reg.render()
+    assert "# lat remote totals failed: segment gone" in text
+    assert 'lat_count{route="/a"} 1' in text
+
+
+def test_render_excludes_metrics():
+    reg = Registry()
+    c = reg.counter("hits_total", "hits")
+    h = reg.histogram("lat", "latency")
+    c.inc(())
+    h.observe((), 0.01)
+    text = reg.render(exclude=(h,))
+    assert _lines(text, "hits_total") and not _lines(text, "lat")
@@ -0,0 +1,108 @@
+# Token-bucket rate limits (api/ratelimit.py). Times are passed explicitly,
+# offset from monotonic() so runtime configure() settles at the same clock.
+import time
+
+import pytest
+
+import api.ratelimit as rl
+from api.ratelimit import OVERFLOW, RateLimiter, parse_overrides
+
+
+def test_parse_overrides():
+    assert parse_overrides(" team1/lab/+:50:100, ,team1/noisy:1:5") == {
+        "team1/lab/+": (50.0, 100.0), "team1/noisy": (1.0, 5.0)}
+    assert parse_overrides("") == {}
+    with pytest.raises(ValueError):
+        parse_overrides("team1/lab:50")
+    with pytest.raises(ValueError):
+        parse_overrides("team1/lab:fast:1")
+
+
+def test_disabled_by_default():
+    lim = RateLimiter()
+    assert not lim.enabled
+    assert all(lim.check("a", b"x", now=0.0) is None for _ in range(1000))
+
+
+def test_topic_bucket_sheds_and_refills():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=2, topic_burst=3)
+    assert [lim.check("a", b"x", now=t0) for _ in range(4)] == [None, None, None, "topic"]
+    assert lim.check("b", b"x", now=t0) is None           # other topics have their own bucket
+    assert lim.check("a", b"x", now=t0 + 0.25) == "topic"  # half a token
+    assert lim.check("a", b"x", now=t0 + 0.5) is None
+    assert lim.check("a", b"x", now=t0 + 0.5) == "topic"
+    assert lim.shed_topic == 3 and lim.noisy(t0 + 1) == 1 and lim.noisy(t0 + rl.NOISY_S + 1) == 0
+
+
+def test_burst_defaults_to_rate():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=5)
+    assert lim.limits()["topic_burst"] == 5
+    assert sum(lim.check("a", b"x", now=t0) is None for _ in range(10)) == 5
+
+
+def test_global_bucket_is_shared():
+    lim = RateLimiter(global_rate=1, global_burst=2)
+    t0 = time.monotonic()                                # the global bucket starts at construction
+    assert [lim.check(t, b"x", now=t0) for t in ("a", "b", "c")] == [None, None, "global"]
+    assert lim.shed_global == 1 and lim.noisy(t0) == 0     # a global shed does not blame the topic
+    assert lim.check("c", b"x", now=t0 + 1) is None
+
+
+def test_overrides_match_filters():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=100, overrides={"team1/noisy/#": (1, 0), "team1/+/fast": (0, 0)})
+    assert [lim.check("team1/noisy/a", b"x", now=t0) for _ in range(2)] == [None, "topic"]
+    assert all(lim.check("team1/lab/fast", b"x", now=t0) is None for _ in range(500))
+    assert RateLimiter(overrides={"x": (1, 1)}).enabled
+
+
+def test_configure_keeps_tokens():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=1, topic_burst=2)
+    assert lim.check("a", b"x", now=t0) is None and lim.check("a", b"x", now=t0) is None
+    lim.configure(1, 10, 0, 0, {})                      # a bigger burst is not handed out at once
+    assert lim.check("a", b"x", now=t0) == "topic"
+    assert lim.limits()["topic_burst"] == 10
+    lim.configure(0, 0, 0, 0, {})
+    assert not lim.enabled and lim.check("a", b"x", now=t0) is None
+
+
+def test_idle_buckets_are_evicted_when_full():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=1, topic_burst=1, max_topics=2)
+    lim.check("a", b"x", now=t0)
+    lim.check("b", b"x", now=t0)
+    lim.check("c", b"x", now=t0 + 5)                     # a and b refilled: both dropped
+    assert lim.evicted == 2 and lim.describe()["tracked_topics"] == 1
+
+
+def test_overflow_bucket_when_nothing_is_idle():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=1, topic_burst=1, max_topics=2)
+    lim.check("a", b"x", now=t0)
+    lim.check("b", b"x", now=t0)
+    assert lim.check("c", b"x", now=t0) is None          # shares the overflow bucket
+    assert lim.check("d", b"x", now=t0) == "topic"
+    assert lim.evicted == 0 and OVERFLOW in lim._buckets and "d" not in lim._buckets
+    # The next sweep may run once SWEEP_S has passed
+    assert lim.check("e", b"x", now=t0 + rl.SWEEP_S + 1) is None
+    assert "e" in lim._buckets
+
+
+def test_noisy_topics_keep_samples():
+    t0 = time.monotonic()
+    lim = RateLimiter(topic_rate=1, topic_burst=1, sample_n=2)
+    lim.check("a", b"first", now=t0)
+    assert lim.check("a", b"x", now=t0) == "topic"
+    for i in range(3):
+        assert lim.check("a", b"y" * (rl.SAMPLE_BYTES + i), now=t0 + 1 + i) is None
+    doc = lim.describe(top=5)
+    (noisy,) = doc["noisy"]
+    assert noisy["topic"] == "a" and noisy["shed"] == 1 and noisy["accepted"] == 4 and noisy["noisy"]
+    assert [s["size_bytes"] for s in noisy["samples"]] == [rl.SAMPLE_BYTES + 1, rl.SAMPLE_BYTES + 2]
+    assert len(noisy["samples"][0]["payload"]) == rl.SAMPLE_BYTES
+    assert "payload" not in lim.describe(samples=False)["noisy"][0]["samples"][0]
+    assert doc["shed"] == {"topic": 1, "global": 0} and doc["global_tokens"] is None
+    assert lim.describe(top=0)["noisy"] == []
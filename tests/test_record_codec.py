@@ -0,0 +1,76 @@
+# Binary telemetry records (common/record_codec.py).
+import math
+
+import pytest
+
+from common.record_codec import (MAGIC, REC, decode, encode, encode_json_line, is_record,
+                                 split_topic)
+
+
+def test_round_trip_both_fields():
+    rec = encode(21.37, 45.5, 1_700_000_000_123)
+    assert len(rec) == REC.size and rec[0] == MAGIC
+    assert decode(rec) == [{"_ts": 1_700_000_000_123, "temperature": 21.37, "humidity": 45.5}]
+
+
+def test_batched_records_decode_in_order():
+    payload = b"".join(encode(20 + i, 40, i) for i in range(5))
+    assert [r["temperature"] for r in decode(payload)] == [20, 21, 22, 23, 24]
+
+
+@pytest.mark.parametrize("t, h, want", [
+    (None, 40.0, {"humidity": 40.0}),
+    (float("nan"), 40.0, {"humidity": 40.0}),
+    (math.inf, 40.0, {"humidity": 40.0}),
+    (22.5, -math.inf, {"temperature": 22.5}),
+    (22.5, None, {"temperature": 22.5}),
+])
+def test_missing_and_non_finite_fields_are_left_out(t, h, want):
+    assert decode(encode(t, h, 7)) == [{"_ts": 7, **want}]
+
+
+@pytest.mark.parametrize("t, h", [(None, None), (float("nan"), math.inf), (10 ** 400, None)])
+def test_nothing_finite_encodes_nothing(t, h):
+    assert encode(t, h, 1) is None
+
+
+def test_values_are_clamped_to_field_ranges():
+    (row,) = decode(encode(1000.0, 1000.0, 1))
+    assert row["temperature"] == 327.67 and row["humidity"] == 655.35
+    (row,) = decode(encode(-1000.0, -5.0, 1))
+    assert row["temperature"] == -327.68 and row["humidity"] == 0
+    (row,) = decode(encode(1e308, 1e308, 1))        # finite, overflows once scaled
+    assert row["temperature"] == 327.67 and row["humidity"] == 655.35
+
+
+@pytest.mark.parametrize("line", [
+    b'{"temp_c": 1e999}', b'{"temp_c": NaN, "hum": Infinity}', b'{"other": 1}',
+    b'[1, 2]', b'{"temp_c": "21"}', b'{"temp_c": true}', b'not json',
+])
+def test_unusable_json_lines_are_dropped(line):
+    assert encode_json_line(line, 1) is None
+
+
+def test_json_line_aliases():
+    assert decode(encode_json_line(b'{"temp_c": 21.0, "hum": 40}', 5)) == \
+        [{"_ts": 5, "temperature": 21.0, "humidity": 40.0}]
+    assert decode(encode_json_line(b'{"temperature": 1e999, "humidity": 40}', 5)) == \
+        [{"_ts": 5, "humidity": 40.0}]
+
+
+def test_decode_rejects_other_payloads():
+    assert not is_record(b'{"temperature": 21}')
+    with pytest.raises(ValueError):
+        decode(b'{"temperature": 21}')
+    rec = encode(1, 1, 1)
+    with pytest.raises(ValueError):
+        decode(rec + rec[:-1])
+    with pytest.raises(ValueError):
+        decode(rec + bytes((0xB0,)) + rec[1:])
+
+
+def test_split_topic_only_strips_bin_from_records():
+    rec = encode(1, 1, 1)
+    assert split_topic("team1/s/bin", rec) == ("team1/s", True)
+    assert split_topic("team1/s/bin", b'{"x": 1}') == ("team1/s/bin", False)
+    assert split_topic("team1/s", rec) == ("team1/s", False)
@@ -0,0 +1,66 @@
+# JSON encoding and content negotiation helpers (api/responses.py).
+import json
+
+import pytest
+from starlette.requests import Request
+
+import api.responses as responses
+
+DOC = {"a": [1.5, float("nan"), {"b": float("inf"), "c": -float("inf")}], "s": "é",
+       "t": (1, 2), "n": None, "ok": True, "big": 2 ** 40}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        if responses.orjson is None:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(responses, "orjson", None)
+    return request.param
+
+
+def test_non_finite_values_become_null(encoder):
+    body = responses.dumps(DOC)
+    assert b"NaN" not in body and b"Infinity" not in body
+    assert json.loads(body)["a"] == [1.5, None, {"b": None, "c": None}]
+
+
+def test_both_encoders_produce_the_same_bytes(monkeypatch):
+    if responses.orjson is None:
+        pytest.skip("orjson not installed")
+    fast = responses.dumps(DOC)
+    monkeypatch.setattr(responses, "orjson", None)
+    assert responses.dumps(DOC) == fast
+
+
+def test_ints_beyond_64_bits_fall_back_to_stdlib(encoder):
+    body = responses.dumps({"v": 10 ** 30, "x": float("nan")})
+    assert body == b'{"v":1000000000000000000000000000000,"x":null}'
+
+
+def _req(accept_encoding):
+    return Request({"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]})
+
+
+@pytest.mark.parametrize("header, want", [
+    ("gzip", True),
+    ("gzip, br", True),
+    ("br;q=1.0, gzip;q=0.5", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("*, gzip;q=0", False),
+    ("identity", False),
+    ("", False),
+    ("gzip;q=bogus", False),
+])
+def test_accepts_honours_q_values(header, want):
+    assert responses.accepts(_req(header), "gzip") is want
+
+
+def test_static_asset_variants():
+    asset = responses.StaticAsset(b"<html>" + b"x" * 4096 + b"</html>", "text/html")
+    assert asset.etag.startswith('"') and len(asset.gzip) < 4096
+    assert responses.gzip_body(b"abc") == responses.gzip_body(b"abc")      # mtime=0: stable
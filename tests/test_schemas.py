@@ -0,0 +1,117 @@
+# Schema registry and compiled normalizers (api/schemas.py).
+import json, math
+
+import pytest
+
+from api.schemas import SchemaRegistry, SchemaReject, compile_normalizer
+
+FIELDS = {
+    "temperature": {"type": "float", "min": -40, "max": 80,
+                    "aliases": ["temp_c", {"name": "temp_f", "scale": 0.5, "offset": -10}]},
+    "humidity": {"type": "float", "min": 0, "max": 100, "aliases": ["hum"]},
+    "_ts": {"type": "int"},
+    "label": {"type": "str"},
+    "ok": {"type": "bool"},
+}
+HIST = ("temperature", "humidity")
+
+
+def _norm(**kw):
+    return compile_normalizer("t", FIELDS, history_fields=HIST, **kw)
+
+
+def _reason(fn, data):
+    with pytest.raises(SchemaReject) as e:
+        fn(data)
+    return e.value.reason, e.value.field
+
+
+def test_aliases_conversion_and_history_values():
+    out, vals = _norm()({"temp_c": "21.5", "hum": 40, "_ts": 5.0, "label": "a", "ok": 1, "x": 1})
+    assert out == {"x": 1, "temperature": 21.5, "humidity": 40.0, "_ts": 5, "label": "a", "ok": True}
+    assert vals == {"temperature": 21.5, "humidity": 40.0}
+    out, _ = _norm()({"temp_f": 60})
+    assert out["temperature"] == 20.0
+
+
+def test_extra_drop_removes_unknown_keys():
+    out, _ = _norm(extra="drop")({"temperature": 1, "junk": 2})
+    assert out == {"temperature": 1.0}
+
+
+@pytest.mark.parametrize("data, field", [
+    ({"temperature": float("nan")}, "temperature"),
+    ({"temperature": math.inf}, "temperature"),
+    ({"humidity": -math.inf}, "humidity"),
+    ({"temperature": "nan"}, "temperature"),
+    ({"temperature": "inf"}, "temperature"),
+    ({"temperature": "-Infinity"}, "temperature"),
+    ({"temperature": 10 ** 400}, "temperature"),
+    ({"temp_f": 10 ** 400}, "temperature"),
+    ({"_ts": 2 ** 63}, "_ts"),
+    ({"_ts": -2 ** 63 - 1}, "_ts"),
+    ({"_ts": 1e300}, "_ts"),
+    ({"_ts": float("inf")}, "_ts"),
+    ({"_ts": 1.5}, "_ts"),
+    ({"temperature": True}, "temperature"),
+    ({"label": 3}, "label"),
+    ({"ok": 2}, "ok"),
+])
+def test_non_finite_and_oversized_values_are_type_rejects(data, field):
+    for on_range in ("reject", "drop"):
+        assert _reason(_norm(on_range=on_range), data) == ("type", field)
+
+
+def test_alias_scaling_that_overflows_is_a_type_reject():
+    fn = compile_normalizer("t", {"t": {"type": "float", "aliases": [{"name": "raw", "scale": 10}]}})
+    assert _reason(fn, {"raw": 1.7e308}) == ("type", "t")
+
+
+def test_stdlib_json_nan_and_huge_int_are_rejected():
+    fn = _norm()
+    assert _reason(fn, json.loads('{"temperature": NaN}')) == ("type", "temperature")
+    assert _reason(fn, json.loads('{"_ts": 1' + "0" * 400 + '}')) == ("type", "_ts")
+
+
+def test_int64_bounds_are_accepted():
+    out, _ = _norm()({"_ts": 2 ** 63 - 1})
+    assert out["_ts"] == 2 ** 63 - 1
+    out, _ = _norm()({"_ts": -2 ** 63})
+    assert out["_ts"] == -2 ** 63
+
+
+def test_range_reject_and_drop():
+    assert _reason(_norm(), {"temperature": 81}) == ("range", "temperature")
+    out, vals = _norm(on_range="drop")({"temperature": 81, "humidity": 50})
+    assert "temperature" not in out and vals == {"humidity": 50.0}
+
+
+def test_required_fields():
+    fields = {"moisture": {"type": "float", "min": 0, "max": 100, "required": True}}
+    fn = compile_normalizer("soil", fields, on_range="drop")
+    assert _reason(fn, {}) == ("missing", "moisture")
+    assert _reason(fn, {"moisture": 120}) == ("range", "moisture")
+    assert _reason(fn, [1]) == ("not_object", "")
+
+
+def test_compile_time_errors():
+    with pytest.raises(ValueError):
+        compile_normalizer("bad", {"x": {"type": "decimal"}})
+    with pytest.raises(ValueError):
+        compile_normalizer("bad", {"x": {"type": "str", "min": 1}})
+
+
+def test_registry_lookup_and_counters():
+    reg = SchemaRegistry([{"name": "dht", "topics": ["sensors/+/dht"], "fields": FIELDS}], HIST)
+    s = reg.lookup("sensors/a/dht")
+    assert s is not None and reg.lookup("other/a") is None
+    reg.apply(s, {"temperature": 20})
+    with pytest.raises(SchemaReject):
+        reg.apply(s, {"temperature": "inf"})
+    assert s.accepted == 1 and s.rejected == {"type": 1}
+
+
+def test_example_schema_file_compiles():
+    import os
+    path = os.path.join(os.path.dirname(__file__), "..", "configs", "schemas.example.json")
+    assert len(SchemaRegistry.from_file(path, HIST)) == 2
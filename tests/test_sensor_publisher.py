@@ -0,0 +1,93 @@
+# Deadband publishing and adaptive sampling (common/sensor_publisher.py).
+import threading, time
+
+import pytest
+
+from common import sensor_publisher as sp
+from common.sensor_publisher import SensorPublisher, TimedReader, make_backend, parse_deadband
+
+
+class Script:
+    # Backend returning scripted readings; an Exception item is raised instead.
+    def __init__(self, *readings):
+        self.readings = list(readings)
+
+    def read(self):
+        r = self.readings.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(sp.time, "monotonic", c)
+    return c
+
+
+def _publisher(*readings, **kw):
+    sent = []
+    opts = dict(deadband={"temperature": 0.5, "humidity": 2}, heartbeat=60,
+                min_interval=2, max_interval=16, growth=2)
+    opts.update(kw)
+    pub = SensorPublisher(TimedReader(Script(*readings)), lambda t, h: sent.append((t, h)), **opts)
+    return pub, sent
+
+
+def test_deadband_suppresses_and_backs_off(clock):
+    pub, sent = _publisher((20, 50), (20.5, 51), (20.4, 50), (20, 49), (20, 49), (21, 49))
+    waits = [pub.step() for _ in range(6)]
+    assert sent == [(20, 50), (21, 49)]                     # first, then a 1.0 degree move
+    assert waits == [2, 4, 8, 16, 16, 2]
+    assert pub.stats()["suppressed"] == 4
+
+
+def test_heartbeat_publishes_unchanged_readings(clock):
+    pub, sent = _publisher((20, 50), (20, 50), (20, 50), heartbeat=10, growth=4)
+    pub.step()
+    clock.t += 5
+    assert pub.step() == 5                                  # capped at the heartbeat due time
+    clock.t += 5
+    pub.step()
+    assert sent == [(20, 50), (20, 50)] and pub.heartbeats == 1
+
+
+def test_failed_and_overrunning_reads(clock):
+    gate = threading.Event()
+
+    class Slow:
+        calls = 0
+
+        def read(self):
+            Slow.calls += 1
+            if Slow.calls == 1:
+                raise RuntimeError("checksum")
+            gate.wait(5)
+            return 20, 50
+
+    reader = TimedReader(Slow(), timeout=0.05)
+    assert reader.read() is None and reader.failures == 1
+    assert reader.read() is None and reader.timeouts == 1
+    assert reader.read() is None and Slow.calls == 2        # still running: no second read
+    gate.set()
+    time.sleep(0.05)
+    assert reader.read() == (20, 50)                        # the overrun's own result
+    reader.close()
+
+
+def test_parse_deadband_and_backends():
+    assert parse_deadband("temperature:0.5, humidity:2,") == {"temperature": 0.5, "humidity": 2.0}
+    sim = make_backend("sim")
+    t, h = sim.read()
+    assert 10 < t < 35 and 20 < h < 70 and t == int(t)
+    with pytest.raises(ValueError):
+        make_backend("bmp280")
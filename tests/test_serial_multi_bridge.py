@@ -0,0 +1,143 @@
+# Multi-device serial bridge (software/serial_bridge/serial_multi_bridge.py),
+# driven through pseudo-terminals instead of real boards.
+import asyncio, json, os, pty, time
+
+import pytest
+
+import serial_multi_bridge as smb
+
+
+class FakeClient:
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class RecordingBridge(smb.MultiBridge):
+    # The real supervisor and ports, with publishes captured instead of sent.
+
+    def __init__(self, globs):
+        super().__init__(globs, tls=False)
+        self.sent = []
+
+    def open_mqtt(self):
+        self.cli = FakeClient()
+
+    def publish(self, topic, payload):
+        self.sent.append((topic, payload))
+
+
+async def _wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.02)
+
+
+def _pty(tmp_path, name):
+    master, slave = pty.openpty()
+    link = tmp_path / name
+    os.symlink(os.ttyname(slave), link)
+    return master, slave, str(link)
+
+
+def test_topic_mapping(monkeypatch):
+    monkeypatch.setattr(smb, "TOPIC_TEMPLATE", "site/{name}/dht")
+    monkeypatch.setattr(smb, "TOPIC_MAP", {"/dev/ttyACM1": "site/kitchen"})
+    assert smb.topic_for("/dev/ttyACM0") == "site/ttyACM0/dht"
+    assert smb.topic_for("/dev/ttyACM1") == "site/kitchen"
+
+
+def test_hot_plug_and_unplug_over_ptys(tmp_path, monkeypatch):
+    monkeypatch.setattr(smb, "RESCAN_S", 0.0)
+    master_a, slave_a, path_a = _pty(tmp_path, "ttyA")
+    monkeypatch.setattr(smb, "TOPIC_MAP", {str(tmp_path / "ttyB"): "team1/kitchen"})
+    bridge = RecordingBridge([str(tmp_path / "tty*")])
+
+    def topics():
+        return {t for t, _ in bridge.sent}
+
+    async def scenario():
+        runner = asyncio.create_task(bridge.run())
+        await _wait_for(lambda: path_a in bridge.ports)
+        await asyncio.sleep(0.2)            # let the port open
+        os.write(master_a, b'{"temp_c": 21.5, "hum": 40}\n{"temp_c": 22.0, "hum": 41}\n')
+        await _wait_for(lambda: len(bridge.sent) == 2)
+        assert topics() == {"team1/ttyA"}
+
+        # hot-plug a second board; the next rescan picks it up
+        master_b, slave_b, path_b = _pty(tmp_path, "ttyB")
+        await _wait_for(lambda: path_b in bridge.ports)
+        await asyncio.sleep(0.2)
+        os.write(master_b, b'{"temp_c": 19.0}\n')
+        await _wait_for(lambda: "team1/kitchen" in topics())
+
+        # unplug the first one: hangup, device node gone, port task ends
+        os.unlink(path_a)
+        os.close(master_a)
+        await _wait_for(lambda: bridge.ports[path_a].reopens == 1)
+        bridge.stop()
+        await asyncio.wait_for(runner, 5)
+        os.close(master_b)
+        for fd in (slave_a, slave_b):
+            os.close(fd)
+
+    asyncio.run(scenario())
+    rows = [json.loads(p) for t, p in bridge.sent]
+    assert [r.get("temp_c") for r in rows] == [21.5, 22.0, 19.0]
+    assert all("_ts" in r for r in rows)
+
+
+def test_reopen_backoff(tmp_path, monkeypatch):
+    # Failed opens and ports that hit EOF without data back off (doubling);
+    # a port that delivered data resets the backoff.
+    dev = tmp_path / "ttyX"
+    dev.touch()
+    script = ["fail", "fail", "eof", "data", "eof"]
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    class Bridge:
+        running = True
+        meter = smb.RateMeter()
+        sent = []
+
+        def publish(self, topic, payload):
+            self.sent.append(payload)
+
+    bridge = Bridge()
+
+    def fake_open(path):
+        step = script.pop(0)
+        if not script:
+            bridge.running = False
+        if step == "fail":
+            raise OSError("busy")
+        r, w = os.pipe()
+        if step == "data":
+            os.write(w, b'{"temp_c": 20}\n')
+        os.close(w)
+        return r
+
+    async def fake_sleep(s):
+        sleeps.append(s)
+        await real_sleep(0)
+
+    monkeypatch.setattr(smb, "open_port", fake_open)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    port = smb.Port(bridge, str(dev))
+    asyncio.run(port.run())
+    assert sleeps == [1, 2, 4, 1, 1]
+    assert port.reopens == 3 and len(bridge.sent) == 1
+
+
+def test_tls_is_required_unless_plaintext(monkeypatch, capsys):
+    for name in ("MQTT_CAFILE", "MQTT_CLIENT_CERT", "MQTT_CLIENT_KEY"):
+        monkeypatch.setattr(smb, name, None)
+    monkeypatch.setattr("sys.argv", ["serial_multi_bridge.py"])
+    with pytest.raises(SystemExit):
+        smb.main()
+    assert "MQTT_CAFILE" in capsys.readouterr().err
@@ -0,0 +1,157 @@
+# Shared-memory segments for the multi-worker API (api/shm_store.py).
+import json, os, random, subprocess, sys, threading, uuid
+
+import pytest
+
+from api.history_store import HistoryStore
+from api.shm_store import SharedBlob, SharedHistoryStore, SharedLatestView, WorkerSlots, encode_latest
+from api.snapshot import LatestState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def name():
+    n = f"pqtest-{uuid.uuid4().hex[:8]}"
+    yield n
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    if base:
+        for f in os.listdir(base):
+            if f.startswith(n):
+                os.unlink(os.path.join(base, f))
+
+
+def _same(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        assert [x if x == x else None for x in a[k]] == [x if x == x else None for x in b[k]], k
+
+
+def test_shared_history_matches_the_in_process_store(name):
+    rnd = random.Random(5)
+    shared = SharedHistoryStore(name, capacity=50, max_topics=4, create=True)
+    local = HistoryStore(50)
+    ts = 0
+    for _ in range(180):
+        ts += rnd.choice((0, 1, 2))
+        topic = rnd.choice("abc")
+        values = {"temperature": rnd.random()} if rnd.random() < 0.8 else {"humidity": 1.0}
+        shared.append(topic, ts, 7, values)
+        local.append(topic, ts, 7, values)
+    reader = SharedHistoryStore(name, capacity=50, max_topics=4)
+    assert sorted(reader.topics()) == sorted(local.topics())
+    for t in "abc":
+        assert reader.wrapped(t) == local.wrapped(t) and reader.oldest(t) == local.oldest(t)
+        assert reader.generation(t) == local.generation(t)
+        _same(reader.tail(t, 10), local.tail(t, 10))
+        _same(reader.window(t), local.window(t))
+        for since, until in ((None, ts // 2), (ts // 3, None), (ts // 3, ts // 2), (ts + 1, None)):
+            _same(reader.window(t, since, until), local.window(t, since, until))
+    assert reader.window("zzz") is None
+
+
+def test_shared_history_limits(name):
+    shared = SharedHistoryStore(name, capacity=4, max_topics=1, create=True)
+    shared.append("a", 1, 1, {})
+    shared.append("b", 1, 1, {})
+    shared.append("x" * 300, 1, 1, {})
+    assert shared.topics() == ["a"] and shared.full_dropped == 2
+    with pytest.raises(RuntimeError):
+        SharedHistoryStore(name, capacity=8, max_topics=1)
+    SharedHistoryStore(name, capacity=8, max_topics=1, create=True)   # the writer re-initializes
+    assert SharedHistoryStore(name, capacity=8, max_topics=1).topics() == []
+
+
+def test_readers_never_see_a_torn_ring(name):
+    # Every point carries temperature == ts, so a torn copy shows up as a mismatch.
+    shared = SharedHistoryStore(name, capacity=64, max_topics=1, create=True)
+    reader = SharedHistoryStore(name, capacity=64, max_topics=1)
+    shared.append("a", 0, 1, {"temperature": 0.0})
+    stop, bad = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            w = reader.window("a", n=32)
+            if w is not None and list(w["ts"]) != [int(v) for v in w["temperature"]]:
+                bad.append(w)
+
+    t = threading.Thread(target=read)
+    t.start()
+    for i in range(1, 20000):
+        shared.append("a", i, 1, {"temperature": float(i)})
+    stop.set()
+    t.join()
+    assert not bad
+
+
+def test_shared_blob_versions_and_size_limit(name):
+    w = SharedBlob(f"{name}-blob", 16, create=True)
+    r = SharedBlob(f"{name}-blob", 16)
+    assert r.read() == (0, b"")
+    assert w.write(b"one") and w.write(b"two!")
+    assert r.read() == (2, b"two!")
+    assert not w.write(b"x" * 17) and w.too_big == 1 and r.read() == (2, b"two!")
+    with pytest.raises(RuntimeError):
+        SharedBlob(f"{name}-blob", 32)
+
+
+def test_shared_latest_view_serves_the_writers_bytes(name):
+    state = LatestState()
+    state.update({"t/a": {"topic": "t/a", "payload": {"v": 1}}, "t/\u00e9": {"topic": "t/\u00e9", "payload": {}}})
+    snap = state.publish()
+    blob = SharedBlob(f"{name}-latest", 1 << 16, create=True)
+    view = SharedLatestView(SharedBlob(f"{name}-latest", 1 << 16))
+    assert view.refresh() is None
+    blob.write(encode_latest(state))
+    prev, cur = view.refresh()
+    assert prev.version == 0 and view.refresh() is None
+    assert cur.body() == snap.body() and cur.etag == snap.etag
+    assert set(cur.data) == {"t/a", "t/\u00e9"} and cur.data["t/a"]["payload"] == {"v": 1}
+    assert view.row_json("t/a") == state.row_json("t/a", snap.data["t/a"])
+    assert json.loads(view.compose([("t/a", None), ("missing", None)])) == {"t/a": snap.data["t/a"]}
+
+
+def _worker(name, data):
+    # Another process claims a slot, writes `data`, then waits for stdin to close.
+    code = ("import sys; from api.shm_store import WorkerSlots; "
+            f"s = WorkerSlots({name!r}, half_bytes=4096); i = s.claim(); s.write({data!r}); "
+            "print(i, flush=True); sys.stdin.read()")
+    p = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, text=True)
+    return p, int(p.stdout.readline())
+
+
+def test_worker_slots_see_other_live_workers(name):
+    me = WorkerSlots(name, half_bytes=4096)
+    assert me.claim() == 0
+    me.write(b"mine")
+    p, slot = _worker(name, b"theirs")
+    try:
+        assert slot == 1
+        assert list(me.others()) == [b"theirs"]
+    finally:
+        p.stdin.close(); p.wait(10)
+    assert list(me.others()) == []              # the worker is gone: its slot is skipped
+    me.close()
+
+
+def test_worker_slots_reuse_a_dead_workers_slot(name):
+    me = WorkerSlots(name, half_bytes=4096)
+    me.claim()
+    p, slot = _worker(name, b"old")
+    p.stdin.close(); p.wait(10)
+    p, again = _worker(name, b"new")
+    try:
+        assert again == slot == 1
+        assert list(me.others()) == [b"new"]
+    finally:
+        p.stdin.close(); p.wait(10)
+    me.close()
+
+
+def test_worker_slots_all_taken(name):
+    a, b = WorkerSlots(name, max_slots=1, half_bytes=4096), WorkerSlots(name, max_slots=1, half_bytes=4096)
+    a.claim()
+    with pytest.raises(RuntimeError):
+        b.claim()
+    a.close()
@@ -0,0 +1,99 @@
+# Copy-on-write latest map (api/snapshot.py).
+import json, threading
+
+import pytest
+
+from api.snapshot import LatestState
+
+
+def test_publish_makes_a_new_immutable_version():
+    st = LatestState()
+    st.set("a", {"v": 1})
+    s1 = st.publish()
+    st.set("a", {"v": 2})
+    st.set("b", {"v": 3})
+    assert st.snapshot() is s1 and dict(s1.data) == {"a": {"v": 1}}   # not published yet
+    s2 = st.publish()
+    assert s2.version == s1.version + 1 and s2.etag != s1.etag
+    assert dict(s1.data) == {"a": {"v": 1}} and s2.data["a"] == {"v": 2}
+    with pytest.raises(TypeError):
+        s2.data["c"] = {}
+    assert st.publish() is s2                                        # nothing changed
+
+
+def test_min_interval_throttles_until_forced():
+    st = LatestState(min_interval=60)
+    st.set("a", {"v": 1})
+    first = st.publish()
+    st.set("a", {"v": 2})
+    assert st.publish() is first
+    assert st.publish(force=True).data["a"] == {"v": 2}
+
+
+def test_body_is_cached_and_only_changed_rows_are_reserialized():
+    st = LatestState()
+    a, b = {"v": 1}, {"v": 2}
+    st.update({"a": a, "b": b})
+    s1 = st.publish()
+    assert json.loads(s1.body()) == {"a": a, "b": b} and s1.body() is s1.body()
+    frag_a = st._frags["a"][1]
+    st.set("b", {"v": 3})
+    s2 = st.publish()
+    assert json.loads(s2.body()) == {"a": a, "b": {"v": 3}}
+    assert st._frags["a"][1] is frag_a
+    assert st.row_json("b", s2.data["b"]) == b'{"v":3}'
+
+
+def test_readers_always_see_a_consistent_version():
+    # The writer sets both topics to the same counter before each publish.
+    st = LatestState()
+    stop, bad = threading.Event(), []
+
+    def reader():
+        while not stop.is_set():
+            snap = st.snapshot()
+            if snap.data and snap.data["a"]["n"] != snap.data["b"]["n"]:
+                bad.append(snap.version)
+            json.loads(snap.body())
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for n in range(2000):
+        st.set("a", {"n": n})
+        st.set("b", {"n": n})
+        st.publish()
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not bad and st.snapshot().data["b"]["n"] == 1999
+
+
+def test_save_load_round_trip(tmp_path):
+    from api.snapshot import load, save
+    st = LatestState()
+    st.update({"a/é": {"topic": "a/é", "payload": {"v": 1.5}, "ts": 10}, "b": {"topic": "b", "payload": None}})
+    st.publish()
+    path = str(tmp_path / "latest.snap")
+    size = save(st, path)
+    rows, saved = load(path)
+    assert rows == dict(st.snapshot().data) and saved > 0
+    assert size == (tmp_path / "latest.snap").stat().st_size
+    assert not (tmp_path / "latest.snap.tmp").exists()
+
+
+@pytest.mark.parametrize("damage", ["truncate", "magic", "missing"])
+def test_load_ignores_bad_files(tmp_path, damage):
+    from api.snapshot import load, save
+    st = LatestState()
+    st.set("a", {"v": 1})
+    st.publish()
+    path = tmp_path / "latest.snap"
+    save(st, str(path))
+    if damage == "truncate":
+        path.write_bytes(path.read_bytes()[:-3])
+    elif damage == "magic":
+        path.write_bytes(b"XXXX" + path.read_bytes()[4:])
+    else:
+        path.unlink()
+    assert load(str(path)) == ({}, 0.0)
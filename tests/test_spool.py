@@ -0,0 +1,114 @@
+# Store-and-forward spool of the serial bridges (software/serial_bridge/spool.py).
+import os
+
+import paho.mqtt.client as mqtt
+
+from spool import DiskSpool, SpoolingPublisher
+
+
+def _topics(recs):
+    return [r[1].decode() for r in recs]
+
+
+def test_append_read_commit_and_resume(tmp_path):
+    sp = DiskSpool(str(tmp_path), segment_bytes=64)
+    for i in range(10):
+        sp.append("t/a", b"m%d" % i)
+    assert sp.records == 10 and len(list(tmp_path.glob("*.seg"))) > 1
+    first = sp.read(4)
+    assert _topics(first) == ["m0", "m1", "m2", "m3"] and sp.records == 6
+    sp.commit(first[-1][2], first[-1][4])
+    sp.close()
+    sp = DiskSpool(str(tmp_path), segment_bytes=64)          # restart: resume after the ack
+    assert sp.records == 6
+    assert _topics(sp.read(100)) == [f"m{i}" for i in range(4, 10)]
+
+
+def test_rewind_puts_records_back(tmp_path):
+    sp = DiskSpool(str(tmp_path))
+    for i in range(3):
+        sp.append("t", b"m%d" % i)
+    recs = sp.read(3)
+    sp.rewind(recs[1][2], recs[1][3], 2)
+    assert sp.records == 2 and _topics(sp.read(5)) == ["m1", "m2"]
+    sp.append("t", b"m3")                                     # the active segment keeps growing
+    assert _topics(sp.read(5)) == ["m3"] and sp.empty()
+
+
+def test_torn_tail_is_skipped(tmp_path):
+    sp = DiskSpool(str(tmp_path), segment_bytes=1 << 20)
+    sp.append("t", b"ok")
+    sp.append("t", b"torn")
+    sp.close()
+    seg = next(tmp_path.glob("*.seg"))
+    seg.write_bytes(seg.read_bytes()[:-2])
+    sp = DiskSpool(str(tmp_path))
+    sp.append("t", b"after")
+    assert _topics(sp.read(10)) == ["ok", "after"]
+
+
+def test_size_cap_drops_the_oldest_segments(tmp_path):
+    sp = DiskSpool(str(tmp_path), segment_bytes=40, max_bytes=100)
+    for i in range(20):
+        sp.append("t", b"%02d" % i)
+    assert sp.dropped_records > 0 and sp.records == 20 - sp.dropped_records
+    got = _topics(sp.read(100))
+    assert got == [f"{i:02d}" for i in range(20 - len(got), 20)]
+
+
+class Info:
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.rc = rc
+        self.acked = False
+
+    def is_published(self):
+        return self.acked
+
+
+class FakeClient:
+    def __init__(self):
+        self.connected = False
+        self.full = False
+        self.sent = []
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.full:
+            return Info(mqtt.MQTT_ERR_QUEUE_SIZE)
+        info = Info()
+        self.sent.append((payload, info))
+        return info
+
+
+def test_publisher_spools_offline_and_replays_in_order(tmp_path):
+    cli = FakeClient()
+    pub = SpoolingPublisher(cli, DiskSpool(str(tmp_path)), drain_rate=1e6, stats_interval=0)
+    for i in range(5):
+        pub.publish("t", b"%d" % i)
+    assert pub.spooled == 5 and not cli.sent
+    cli.connected = True
+    pub.publish("t", b"5")              # spool not empty: goes behind the backlog
+    pub.pump()
+    assert [p for p, _ in cli.sent] == [b"%d" % i for i in range(6)]
+    assert pub.spool.empty() and not (tmp_path / "cursor").exists()   # nothing acked yet
+    for _, info in cli.sent:
+        info.acked = True
+    pub.pump()
+    assert pub.replayed == 6 and DiskSpool(str(tmp_path)).empty()
+    pub.publish("t", b"6")              # idle and connected: direct
+    assert pub.spooled == 6 and cli.sent[-1][0] == b"6"
+
+
+def test_publisher_full_queue_rewinds_the_replay(tmp_path):
+    cli = FakeClient()
+    pub = SpoolingPublisher(cli, DiskSpool(str(tmp_path)), drain_rate=1e6, stats_interval=0)
+    cli.connected, cli.full = True, True
+    pub.publish("t", b"a")
+    pub.publish("t", b"b")
+    pub.pump()
+    assert pub.spool.records == 2 and not cli.sent
+    cli.full = False
+    pub.pump()
+    assert [p for p, _ in cli.sent] == [b"a", b"b"]
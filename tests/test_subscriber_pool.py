@@ -0,0 +1,122 @@
+# MQTT subscriber pool (api/subscriber_pool.py) against the in-process broker.
+import asyncio, socket, time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from api.subscriber_pool import SubscriberPool, parse_brokers
+from mini_broker import MiniBroker
+
+
+@pytest.mark.parametrize("spec,want", [
+    ("a", [("a", 1883)]),
+    ("a:1, b:2,,", [("a", 1), ("b", 2)]),
+    ("::1:8883", [("::1", 8883)]),
+])
+def test_parse_brokers(spec, want):
+    assert parse_brokers(spec, 1883) == want
+
+
+def test_filters_are_partitioned_per_broker():
+    pool = SubscriberPool([("a", 1), ("b", 2)], ["f0", "f1", "f2"], lambda *a: None, connections=2)
+    assert [(c.broker, c.filters) for c in pool.conns] == [
+        (("a", 1), ["f0", "f2"]), (("a", 1), ["f1"]), (("b", 2), ["f0", "f2"]), (("b", 2), ["f1"])]
+    assert len({c.client_id for c in pool.conns}) == 4
+    assert len(SubscriberPool([("a", 1)], ["f"], lambda *a: None, connections=3).conns) == 1
+
+
+def test_shared_group_subscribes_every_connection():
+    pool = SubscriberPool([("a", 1)], ["t/#"], lambda *a: None, connections=3, shared_group="g")
+    assert [c.filters for c in pool.conns] == [["t/#"]] * 3
+    assert pool.stats()[0]["filters"] == ["$share/g/t/#"]
+
+
+def _publish(port, topics):
+    pub = mqtt.Client(client_id=f"pub-{port}", protocol=mqtt.MQTTv311)
+    pub.connect("127.0.0.1", port)
+    pub.loop_start()
+    for t in topics:
+        pub.publish(t, b"{}", qos=1).wait_for_publish(5)
+    pub.loop_stop()
+    pub.disconnect()
+
+
+async def _until(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_two_brokers_with_a_shared_group():
+    b1, b2 = MiniBroker().start_thread(), MiniBroker().start_thread()
+    got = []
+
+    async def run():
+        pool = SubscriberPool([("127.0.0.1", b1.port), ("127.0.0.1", b2.port)], ["t/#"],
+                              lambda c, u, m: got.append(m.topic), connections=2, shared_group="g", qos=1)
+        await pool.start()
+        await _until(lambda: all(c["connected"] for c in pool.stats()))
+        await asyncio.sleep(0.1)                        # SUBACKs
+        await asyncio.to_thread(_publish, b1.port, [f"t/{i}" for i in range(10)])
+        await asyncio.to_thread(_publish, b2.port, [f"t/{i}" for i in range(10, 20)])
+        await _until(lambda: len(got) == 20)
+        stats = pool.stats()
+        await pool.stop()
+        return stats
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        b1.stop(); b2.stop()
+    assert sorted(got) == sorted(f"t/{i}" for i in range(20))
+    assert [s["messages"] for s in stats] == [5, 5, 5, 5]
+
+
+def test_full_queue_pauses_reads_until_there_is_room():
+    broker = MiniBroker().start_thread()
+    got, room = [], [False]
+
+    async def run():
+        pool = SubscriberPool([("127.0.0.1", broker.port)], ["t/#"], lambda c, u, m: got.append(m.topic),
+                              accept=lambda: room[0])
+        await pool.start()
+        room[0] = True
+        await _until(lambda: pool.stats()[0]["connected"])
+        await asyncio.sleep(0.1)
+        room[0] = False
+        await asyncio.to_thread(_publish, broker.port, ["t/a", "t/b"])
+        await asyncio.sleep(0.2)
+        held = len(got)
+        room[0] = True
+        await _until(lambda: len(got) == 2)
+        paused = pool.stats()[0]["read_pauses"]
+        await pool.stop()
+        return held, paused
+
+    try:
+        held, paused = asyncio.run(run())
+    finally:
+        broker.stop()
+    assert held == 0 and paused > 0
+
+
+def test_unreachable_broker_backs_off_and_stops_promptly():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+
+    async def run():
+        pool = SubscriberPool([("127.0.0.1", port)], ["t/#"], lambda *a: None,
+                              min_backoff=0.05, max_backoff=0.2)
+        await pool.start()
+        await asyncio.sleep(0.6)
+        stats = pool.stats()[0]
+        t0 = time.monotonic()
+        await pool.stop()
+        return stats, time.monotonic() - t0
+
+    stats, stop_s = asyncio.run(run())
+    assert not stats["connected"] and stats["connects"] == 0
+    assert stats["backoff_s"] == 0.2 and stop_s < 1.0
@@ -0,0 +1,98 @@
+# On-disk segment log (api/telemetry_log.py).
+import math
+
+import pytest
+
+from api.telemetry_log import TelemetryLog
+
+REC = 4 + 8 + 4 + 16    # record bytes with the two default fields
+
+
+def _fill(log, topics=("a", "b"), n=50, t0=1000):
+    for i in range(n):
+        for k, t in enumerate(topics):
+            log.append(t, t0 + i, 10 + k, {"temperature": i, "humidity": k})
+
+
+def test_window_last_n_and_time_range(tmp_path):
+    log = TelemetryLog(str(tmp_path))
+    _fill(log)
+    w = log.window("a", n=3)
+    assert list(w["ts"]) == [1047, 1048, 1049] and list(w["temperature"]) == [47, 48, 49]
+    w = log.window("b", since=1010, until=1012)
+    assert list(w["ts"]) == [1010, 1011, 1012] and set(w["size_bytes"]) == {11}
+    assert log.window("missing") is None
+    log.close()
+
+
+def test_segments_rotate_and_retention_drops_the_oldest(tmp_path):
+    log = TelemetryLog(str(tmp_path), segment_bytes=16 + 20 * REC, retention_segments=3)
+    _fill(log, n=100)
+    assert len(list(tmp_path.glob("seg-*.log"))) == 3
+    assert len(list(tmp_path.glob("seg-*.idx"))) == 2          # the active segment has none yet
+    w = log.window("a")
+    assert list(w["ts"]) == list(range(w["ts"][0], 1100)) and w["ts"][0] > 1000
+    assert list(log.window("a", n=5)["ts"]) == [1095, 1096, 1097, 1098, 1099]
+    log.close()
+
+
+def test_reopen_restores_latest_and_reads_old_segments(tmp_path):
+    log = TelemetryLog(str(tmp_path), segment_bytes=16 + 30 * REC)
+    _fill(log, n=40)
+    log.append("c", 2000, 5, {"temperature": 1.5})
+    log.close()
+    log = TelemetryLog(str(tmp_path))
+    latest = log.restore_latest()
+    assert latest["a"]["payload"] == {"temperature": 39, "humidity": 0}
+    assert latest["c"] == {"topic": "c", "payload": {"temperature": 1.5}, "size_bytes": 5,
+                           "ts": 2000, "restored": True}
+    assert list(log.window("b", n=2)["temperature"]) == [38, 39]
+    log.append("a", 3000, 1, {})
+    w = log.window("a", n=2)
+    assert list(w["ts"]) == [1039, 3000] and math.isnan(w["temperature"][1])
+    log.close()
+
+
+def test_stale_or_missing_index_is_rebuilt(tmp_path):
+    log = TelemetryLog(str(tmp_path), segment_bytes=16 + 10 * REC)
+    _fill(log, n=20)
+    log.close()
+    idx = sorted(tmp_path.glob("seg-*.idx"))
+    idx[0].unlink()
+    idx[1].write_bytes(idx[1].read_bytes()[:-4])                 # torn write
+    log = TelemetryLog(str(tmp_path))
+    assert list(log.window("a")["ts"]) == list(range(1000, 1020))
+    assert idx[0].exists() and len(idx[1].read_bytes()) % 4 == 0
+    log.close()
+
+
+def test_scan_streams_chunks_in_order(tmp_path):
+    log = TelemetryLog(str(tmp_path), segment_bytes=16 + 16 * REC)
+    _fill(log, topics=("a", "b", "c"), n=30)
+    chunks = list(log.scan(["a", "c"], since=1005, until=1024, chunk=7))
+    rows = [r for c in chunks for r in c]
+    assert all(len(c) <= 7 for c in chunks)
+    assert [(r[0], r[1]) for r in rows] == [(t, ts) for ts in range(1005, 1025) for t in ("a", "c")]
+    assert list(log.scan(["nope"])) == []
+    log.close()
+
+
+def test_readonly_follows_the_writer(tmp_path):
+    log = TelemetryLog(str(tmp_path))
+    ro = TelemetryLog(str(tmp_path), readonly=True)
+    assert ro.window("a") is None
+    _fill(log, n=5)
+    log.sync()
+    assert list(ro.window("a")["ts"]) == [1000, 1001, 1002, 1003, 1004]
+    assert ro.topics() == ["a", "b"]
+    log.close()
+
+
+def test_foreign_field_layout_is_ignored(tmp_path):
+    old = TelemetryLog(str(tmp_path), fields=("x",))
+    old.append("a", 1, 1, {"x": 1.0})
+    old.close()
+    log = TelemetryLog(str(tmp_path))
+    w = log.window("a")
+    assert w is not None and len(w["ts"]) == 0
+    log.close()
@@ -0,0 +1,73 @@
+# Topic trie and MQTT filter matching (api/topic_index.py).
+import random
+
+import pytest
+
+from api.topic_index import TopicIndex, valid_filter
+
+
+def _matches(flt, topic):
+    # Straightforward MQTT matching, for reference.
+    f, t = flt.split("/"), topic.split("/")
+    if topic.startswith("$") and f[0] in ("+", "#"):
+        return False
+    for i, lvl in enumerate(f):
+        if lvl == "#":
+            return len(t) >= i
+        if i >= len(t) or (lvl != "+" and lvl != t[i]):
+            return False
+    return len(t) == len(f)
+
+
+def _order(topic):
+    return tuple(topic.split("/"))
+
+
+@pytest.fixture(scope="module")
+def index():
+    rnd = random.Random(7)
+    topics = {"/".join(rnd.choice("abc") for _ in range(rnd.randint(1, 4))) for _ in range(200)}
+    topics |= {"a-c", "$SYS/broker", "a/b/"}
+    idx = TopicIndex()
+    for t in topics:
+        assert idx.insert(t)
+    return idx, topics
+
+
+@pytest.mark.parametrize("flt", ["#", "a/#", "+", "+/b", "a/+/c", "a/b", "+/+/#", "c/#", "a/b/", "$SYS/#", "x/#"])
+def test_match_agrees_with_reference(index, flt):
+    idx, topics = index
+    want = sorted((t for t in topics if _matches(flt, t)), key=_order)
+    assert idx.match(flt) == (want, None)
+
+
+@pytest.mark.parametrize("limit", [1, 3, 17])
+def test_cursor_pages_cover_every_match_once(index, limit):
+    idx, topics = index
+    got, cursor = [], None
+    while True:
+        page, cursor = idx.match("a/#", limit, cursor)
+        assert len(page) <= limit
+        got += page
+        if cursor is None:
+            break
+    assert got == idx.match("a/#")[0]
+
+
+def test_insert_reports_new_topics_and_children_counts():
+    idx = TopicIndex()
+    assert idx.insert("a/b/c") and idx.insert("a/b") and idx.insert("a/d")
+    assert not idx.insert("a/b")
+    assert len(idx) == 3 and "a/d" in idx
+    assert idx.children("a") == [
+        {"name": "b", "path": "a/b", "topics": 2, "is_topic": True},
+        {"name": "d", "path": "a/d", "topics": 1, "is_topic": True},
+    ]
+    assert idx.children() == [{"name": "a", "path": "a", "topics": 3, "is_topic": False}]
+    assert idx.children("nope") == []
+
+
+@pytest.mark.parametrize("flt,ok", [("#", True), ("a/+/b", True), ("a/#/b", False), ("a#", False),
+                                    ("a/b+", False), ("+/#", True)])
+def test_valid_filter(flt, ok):
+    assert valid_filter(flt) is ok